@@ -1,5 +1,8 @@
 -- 新版库结构（废弃旧数据，使用 UUID doctor_id，头像用 COS URL）
 
+DROP TABLE IF EXISTS schedule_exceptions;
+DROP TABLE IF EXISTS schedule_rules;
+DROP TABLE IF EXISTS appointments_archive;
 DROP TABLE IF EXISTS appointments;
 DROP TABLE IF EXISTS doctor_schedules;
 DROP TABLE IF EXISTS doctors;
@@ -30,9 +33,36 @@ CREATE TABLE doctor_schedules (
   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   UNIQUE KEY unique_schedule (doctor_id, schedule_date, period),
   FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE,
-  INDEX idx_doctor_date (doctor_id, schedule_date)
+  -- 按医生查走 unique_schedule；管理端不限医生的列表和余号索引重建按日期范围查
+  INDEX idx_date_doctor (schedule_date, doctor_id, period)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='医生号源管理';
 
+CREATE TABLE schedule_rules (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  doctor_id CHAR(36) NOT NULL COMMENT '医生ID',
+  weekday TINYINT NOT NULL COMMENT '星期：1-7 对应周一到周日',
+  period VARCHAR(10) NOT NULL COMMENT '时段：上午/下午',
+  total_slots INT NOT NULL COMMENT '号源数量',
+  valid_from DATE NULL COMMENT '生效起始日期，为空表示不限',
+  valid_until DATE NULL COMMENT '生效截止日期，为空表示不限',
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  UNIQUE KEY unique_rule (doctor_id, weekday, period),
+  FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='按星期的出诊规则，读排班时展开，首次预约时才生成 doctor_schedules 行';
+
+CREATE TABLE schedule_exceptions (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  doctor_id CHAR(36) NOT NULL COMMENT '医生ID',
+  exception_date DATE NOT NULL COMMENT '日期',
+  period VARCHAR(10) NOT NULL COMMENT '时段：上午/下午',
+  total_slots INT NOT NULL COMMENT '当天号源数量，0 表示停诊',
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  UNIQUE KEY unique_exception (doctor_id, exception_date, period),
+  FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='出诊规则的单日例外';
+
 CREATE TABLE appointments (
   id BIGINT AUTO_INCREMENT PRIMARY KEY,
   doctor_id CHAR(36) NOT NULL COMMENT '医生ID',
@@ -50,8 +80,39 @@ CREATE TABLE appointments (
   status VARCHAR(20) DEFAULT 'pending' COMMENT '预约状态',
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  -- 未取消的预约为 1，取消后为 NULL；唯一键里 NULL 互不冲突，所以同一手机号同一时段只能有一条有效预约
+  active_booking TINYINT AS (IF(status = 'cancelled', NULL, 1)) VIRTUAL,
   FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE,
-  INDEX idx_doctor (doctor_id),
-  INDEX idx_date (schedule_date),
-  INDEX idx_phone (patient_phone)
+  UNIQUE KEY uniq_active_booking (patient_phone, doctor_id, schedule_date, period, active_booking),
+  -- 列表都是 ORDER BY created_at DESC, id DESC，二级索引自带主键 id
+  INDEX idx_doctor_created (doctor_id, created_at),
+  INDEX idx_phone_created (patient_phone, created_at),
+  INDEX idx_status_created (status, created_at),
+  INDEX idx_created (created_at),
+  INDEX idx_date (schedule_date)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='预约记录';
+
+CREATE TABLE appointments_archive (
+  id BIGINT PRIMARY KEY COMMENT '沿用 appointments.id',
+  doctor_id CHAR(36) NOT NULL COMMENT '医生ID',
+  doctor_name VARCHAR(100) NOT NULL COMMENT '医生姓名',
+  hospital_name VARCHAR(200) COMMENT '医院名称',
+  department_name VARCHAR(100) COMMENT '科室名称',
+  schedule_date DATE NOT NULL COMMENT '预约日期',
+  period VARCHAR(10) NOT NULL COMMENT '时段：上午/下午',
+  patient_name VARCHAR(100) NOT NULL COMMENT '就诊人姓名',
+  patient_gender VARCHAR(10) COMMENT '就诊人性别',
+  patient_age INT COMMENT '就诊人年龄',
+  patient_phone VARCHAR(20) NOT NULL COMMENT '预约电话',
+  symptoms TEXT COMMENT '病情症状描述',
+  registration_fee DECIMAL(10,2) COMMENT '挂号费用',
+  status VARCHAR(20) COMMENT '预约状态',
+  created_at TIMESTAMP NULL,
+  updated_at TIMESTAMP NULL,
+  archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '归档时间',
+  INDEX idx_date (schedule_date),
+  INDEX idx_doctor_created (doctor_id, created_at),
+  INDEX idx_phone_created (patient_phone, created_at),
+  INDEX idx_status_created (status, created_at),
+  INDEX idx_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='已归档的预约记录（完成或取消且超过保留天数），不设外键，医生删除后记录仍保留';
@@ -0,0 +1,28 @@
+-- 已有库的增量迁移：按星期的出诊规则和单日例外（新建库直接执行 database-migration.sql 即可）
+-- 可重复执行
+
+CREATE TABLE IF NOT EXISTS schedule_rules (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  doctor_id CHAR(36) NOT NULL COMMENT '医生ID',
+  weekday TINYINT NOT NULL COMMENT '星期：1-7 对应周一到周日',
+  period VARCHAR(10) NOT NULL COMMENT '时段：上午/下午',
+  total_slots INT NOT NULL COMMENT '号源数量',
+  valid_from DATE NULL COMMENT '生效起始日期，为空表示不限',
+  valid_until DATE NULL COMMENT '生效截止日期，为空表示不限',
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  UNIQUE KEY unique_rule (doctor_id, weekday, period),
+  FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='按星期的出诊规则，读排班时展开，首次预约时才生成 doctor_schedules 行';
+
+CREATE TABLE IF NOT EXISTS schedule_exceptions (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  doctor_id CHAR(36) NOT NULL COMMENT '医生ID',
+  exception_date DATE NOT NULL COMMENT '日期',
+  period VARCHAR(10) NOT NULL COMMENT '时段：上午/下午',
+  total_slots INT NOT NULL COMMENT '当天号源数量，0 表示停诊',
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  UNIQUE KEY unique_exception (doctor_id, exception_date, period),
+  FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='出诊规则的单日例外';
@@ -0,0 +1,36 @@
+-- 已有库的增量迁移：预约列表的组合索引和归档表
+-- 列表查询都是 WHERE 筛选列 = ? ORDER BY created_at DESC, id DESC，(筛选列, created_at) 索引可以直接按序取，
+-- 原来的单列 idx_doctor / idx_phone 被新索引的前缀覆盖，一并删除。大表上执行前先评估 DDL 时间。
+-- ALTER 不能重复执行；归档表可以
+
+ALTER TABLE appointments
+  ADD INDEX idx_doctor_created (doctor_id, created_at),
+  ADD INDEX idx_phone_created (patient_phone, created_at),
+  ADD INDEX idx_status_created (status, created_at),
+  ADD INDEX idx_created (created_at),
+  DROP INDEX idx_doctor,
+  DROP INDEX idx_phone;
+
+CREATE TABLE IF NOT EXISTS appointments_archive (
+  id BIGINT PRIMARY KEY COMMENT '沿用 appointments.id',
+  doctor_id CHAR(36) NOT NULL COMMENT '医生ID',
+  doctor_name VARCHAR(100) NOT NULL COMMENT '医生姓名',
+  hospital_name VARCHAR(200) COMMENT '医院名称',
+  department_name VARCHAR(100) COMMENT '科室名称',
+  schedule_date DATE NOT NULL COMMENT '预约日期',
+  period VARCHAR(10) NOT NULL COMMENT '时段：上午/下午',
+  patient_name VARCHAR(100) NOT NULL COMMENT '就诊人姓名',
+  patient_gender VARCHAR(10) COMMENT '就诊人性别',
+  patient_age INT COMMENT '就诊人年龄',
+  patient_phone VARCHAR(20) NOT NULL COMMENT '预约电话',
+  symptoms TEXT COMMENT '病情症状描述',
+  registration_fee DECIMAL(10,2) COMMENT '挂号费用',
+  status VARCHAR(20) COMMENT '预约状态',
+  created_at TIMESTAMP NULL,
+  updated_at TIMESTAMP NULL,
+  archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '归档时间',
+  INDEX idx_doctor_created (doctor_id, created_at),
+  INDEX idx_phone_created (patient_phone, created_at),
+  INDEX idx_status_created (status, created_at),
+  INDEX idx_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='已归档的预约记录（完成或取消且超过保留天数），不设外键，医生删除后记录仍保留';
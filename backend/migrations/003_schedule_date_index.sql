@@ -0,0 +1,8 @@
+-- benchmarks.query_audit 报告：管理端不带 doctorId 的排班列表（按日期范围，ORDER BY 日期、医生、时段）
+-- 和余号索引重建（schedule_date 范围）在 doctor_schedules 上全表扫描加 filesort。
+-- idx_doctor_date 是 unique_schedule 的前缀，外键用 unique_schedule 即可，一并删除。
+-- 不能重复执行
+
+ALTER TABLE doctor_schedules
+  ADD INDEX idx_date_doctor (schedule_date, doctor_id, period),
+  DROP INDEX idx_doctor_date;
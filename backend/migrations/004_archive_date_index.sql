@@ -0,0 +1,4 @@
+-- 预约导出按就诊日期范围读，includeArchived 时归档表也要有 schedule_date 索引
+-- 不能重复执行
+
+ALTER TABLE appointments_archive ADD INDEX idx_date (schedule_date);
@@ -0,0 +1,10 @@
+-- 同一手机号同一时段只能有一条未取消的预约，由唯一键保证。
+-- 进程内的 BookingDedupe 和开事务前的查重只能挡住同一进程里的并发，多 worker 时两个请求可能同时通过查重。
+-- 执行前先确认没有重复的有效预约，否则建唯一键会失败：
+--   SELECT patient_phone, doctor_id, schedule_date, period, COUNT(*) FROM appointments
+--   WHERE status != 'cancelled' GROUP BY 1, 2, 3, 4 HAVING COUNT(*) > 1;
+-- 不能重复执行
+
+ALTER TABLE appointments
+  ADD COLUMN active_booking TINYINT AS (IF(status = 'cancelled', NULL, 1)) VIRTUAL,
+  ADD UNIQUE KEY uniq_active_booking (patient_phone, doctor_id, schedule_date, period, active_booking);
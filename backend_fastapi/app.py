@@ -1,3 +1,5 @@
+import asyncio
+import logging
 import os
 from pathlib import Path
 
@@ -6,8 +8,17 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from backend_fastapi.db import get_pool, init_db_pool
-from backend_fastapi.routers import appointments, doctors, schedules, wechat
+from backend_fastapi.archival import APPOINTMENT_ARCHIVE, appointment_archiver
+from backend_fastapi.availability import availability_index
+from backend_fastapi.db import DB_POOL_WARM, app_pools, get_pool, init_db_pool, init_read_pool
+from backend_fastapi.metrics import monitor_loop_lag, request_metrics
+from backend_fastapi.middleware import RequestMetricsMiddleware
+from backend_fastapi.recurrence import schedule_rules
+from backend_fastapi.responses import FastJSONResponse
+from backend_fastapi.routers import appointments, doctors, metrics, schedule_rules as schedule_rules_router, schedules, wechat
+from backend_fastapi.search import doctor_search_index
+from backend_fastapi.utils import shutdown_image_executor
+from backend_fastapi.wechat_bot import close_http_client, notification_queue
 
 load_dotenv()
 
@@ -15,7 +26,7 @@ ROOT_DIR = Path(__file__).resolve().parent.parent
 LEGACY_BACKEND_DIR = ROOT_DIR / "backend"
 ADMIN_DIR = LEGACY_BACKEND_DIR / "admin"
 
-app = FastAPI(title="Medical Backend (FastAPI)", version="1.0.0")
+app = FastAPI(title="Medical Backend (FastAPI)", version="1.0.0", default_response_class=FastJSONResponse)
 
 # 全局中间件
 app.add_middleware(
@@ -25,6 +36,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 放在最外层，延迟统计包含其它中间件的开销
+app.add_middleware(RequestMetricsMiddleware)
 
 # 挂载静态管理后台
 if ADMIN_DIR.exists():
@@ -34,12 +47,37 @@ if ADMIN_DIR.exists():
 @app.on_event("startup")
 async def _startup() -> None:
     app.state.db_pool = await init_db_pool()
+    app.state.db_read_pool = await init_read_pool(app.state.db_pool)
+    pools = app_pools(app.state)
+    for pool in pools:
+        await pool.warm(DB_POOL_WARM)
+    # 内存索引构建失败不阻止服务启动：搜索退回 LIKE 查询，余号字段为空，后台任务会继续重试
+    # 排班规则要在余号索引之前建好，余号索引会展开规则
+    indexes = (("doctor search", doctor_search_index), ("schedule rules", schedule_rules), ("availability", availability_index))
+    for name, index in indexes:
+        try:
+            await index.rebuild(app.state.db_pool)
+        except Exception as e:
+            logging.warning(f"Build {name} index failed: {e}")
+    app.state.background_tasks = [
+        asyncio.create_task(doctor_search_index.refresh_forever(app.state.db_pool)),
+        asyncio.create_task(schedule_rules.refresh_forever(app.state.db_pool)),
+        asyncio.create_task(availability_index.refresh_forever(app.state.db_pool)),
+        asyncio.create_task(monitor_loop_lag(request_metrics)),
+        *(asyncio.create_task(pool.ping_forever()) for pool in pools),
+    ]
+    if APPOINTMENT_ARCHIVE:
+        app.state.background_tasks.append(asyncio.create_task(appointment_archiver.run_forever(app.state.db_pool)))
 
 
 @app.on_event("shutdown")
 async def _shutdown() -> None:
-    pool = getattr(app.state, "db_pool", None)
-    if pool:
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
+    shutdown_image_executor()
+    await notification_queue.close()
+    await close_http_client()
+    for pool in app_pools(app.state):
         pool.close()
         await pool.wait_closed()
 
@@ -47,5 +85,7 @@ async def _shutdown() -> None:
 # 注册路由
 app.include_router(doctors.router)
 app.include_router(schedules.router)
+app.include_router(schedule_rules_router.router)
 app.include_router(appointments.router)
 app.include_router(wechat.router)
+app.include_router(metrics.router)
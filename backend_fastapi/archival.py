@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import aiomysql
+
+APPOINTMENT_ARCHIVE = os.getenv("APPOINTMENT_ARCHIVE", "0").lower() in ("1", "true", "yes")
+APPOINTMENT_ARCHIVE_AFTER_DAYS = int(os.getenv("APPOINTMENT_ARCHIVE_AFTER_DAYS", "180"))
+APPOINTMENT_ARCHIVE_BATCH = int(os.getenv("APPOINTMENT_ARCHIVE_BATCH", "500"))
+APPOINTMENT_ARCHIVE_PAUSE = float(os.getenv("APPOINTMENT_ARCHIVE_PAUSE", "0.5"))
+APPOINTMENT_ARCHIVE_INTERVAL = float(os.getenv("APPOINTMENT_ARCHIVE_INTERVAL", "3600"))
+
+ARCHIVE_TABLE = "appointments_archive"
+ARCHIVE_LOCK = "yihai.appointments.archive"
+FINISHED_STATUSES = ("completed", "cancelled")
+APPOINTMENT_COLUMNS = (
+    "id, doctor_id, doctor_name, hospital_name, department_name, schedule_date, period, patient_name, "
+    "patient_gender, patient_age, patient_phone, symptoms, registration_fee, status, created_at, updated_at"
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AppointmentArchiver:
+    """把已结束（完成或取消）且创建超过 after_days 天的预约分批搬到 appointments_archive。
+
+    每批在一个事务里锁定一批行（不排序，沿 (status, created_at) 索引取，避免每批都排序），
+    INSERT ... SELECT 到归档表再 DELETE。批与批之间至少停 pause 秒，且不短于上一批的耗时，
+    占用数据库的时间不超过一半。多进程部署时用 GET_LOCK 保证同一时间只有一个进程在搬。
+    """
+
+    def __init__(
+        self,
+        after_days: int = APPOINTMENT_ARCHIVE_AFTER_DAYS,
+        batch_size: int = APPOINTMENT_ARCHIVE_BATCH,
+        pause: float = APPOINTMENT_ARCHIVE_PAUSE,
+    ) -> None:
+        self.after_days = after_days
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+        self.running = False
+        self.stats: Dict[str, Any] = {"runs": 0, "archived": 0, "batches": 0, "skippedLocked": 0, "lastRunAt": None, "lastError": None}
+
+    async def _archive_batch(self, conn: Any, cutoff: datetime) -> int:
+        statuses = ", ".join(["%s"] * len(FINISHED_STATUSES))
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    f"""
+                    SELECT id FROM appointments
+                    WHERE status IN ({statuses}) AND created_at < %s
+                    LIMIT %s FOR UPDATE
+                    """,
+                    [*FINISHED_STATUSES, cutoff, self.batch_size],
+                )
+                ids = [row["id"] for row in await cur.fetchall()]
+                if ids:
+                    placeholders = ", ".join(["%s"] * len(ids))
+                    await cur.execute(
+                        f"""
+                        INSERT INTO {ARCHIVE_TABLE} ({APPOINTMENT_COLUMNS}, archived_at)
+                        SELECT {APPOINTMENT_COLUMNS}, NOW() FROM appointments WHERE id IN ({placeholders})
+                        """,
+                        ids,
+                    )
+                    await cur.execute(f"DELETE FROM appointments WHERE id IN ({placeholders})", ids)
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+        return len(ids)
+
+    async def run_once(self, pool: aiomysql.Pool, max_rows: Optional[int] = None) -> int:
+        """搬一轮，返回搬走的行数；别的进程正在搬时直接返回 0。"""
+        if self.running:
+            return 0
+        self.running = True
+        archived = 0
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    # 截止时间按数据库时钟算，和 created_at 的来源一致；整轮用同一个截止时间
+                    await cur.execute(
+                        "SELECT GET_LOCK(%s, 0) AS locked, NOW() - INTERVAL %s DAY AS cutoff", [ARCHIVE_LOCK, self.after_days]
+                    )
+                    row = await cur.fetchone()
+                    locked, cutoff = row["locked"] == 1, row["cutoff"]
+                if not locked:
+                    self.stats["skippedLocked"] += 1
+                    return 0
+                try:
+                    while max_rows is None or archived < max_rows:
+                        began = time.perf_counter()
+                        moved = await self._archive_batch(conn, cutoff)
+                        archived += moved
+                        self.stats["batches"] += 1
+                        if moved < self.batch_size:
+                            break
+                        await asyncio.sleep(max(self.pause, time.perf_counter() - began))
+                finally:
+                    async with conn.cursor() as cur:
+                        await cur.execute("SELECT RELEASE_LOCK(%s)", [ARCHIVE_LOCK])
+        finally:
+            self.running = False
+            self.stats["runs"] += 1
+            self.stats["archived"] += archived
+            self.stats["lastRunAt"] = datetime.now().isoformat(timespec="seconds")
+        return archived
+
+    async def run_forever(self, pool: aiomysql.Pool, interval: float = APPOINTMENT_ARCHIVE_INTERVAL) -> None:
+        while True:
+            try:
+                archived = await self.run_once(pool)
+                if archived:
+                    logger.info(f"Archived {archived} finished appointments")
+                self.stats["lastError"] = None
+            except Exception as e:
+                self.stats["lastError"] = repr(e)
+                logger.warning(f"Archive appointments failed: {e}")
+            await asyncio.sleep(interval)
+
+
+appointment_archiver = AppointmentArchiver()
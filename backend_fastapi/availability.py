@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Set, Tuple
+
+import aiomysql
+
+from backend_fastapi.booking import SlotKey, slot_key
+from backend_fastapi.recurrence import schedule_rules
+from backend_fastapi.slot_events import slot_broadcaster
+
+AVAILABILITY_DAYS = int(os.getenv("AVAILABILITY_DAYS", "7"))
+AVAILABILITY_LOOKAHEAD_DAYS = int(os.getenv("AVAILABILITY_LOOKAHEAD_DAYS", "60"))
+AVAILABILITY_REFRESH = float(os.getenv("AVAILABILITY_REFRESH", "60"))
+
+PERIOD_ORDER = {"上午": 0, "下午": 1}
+
+logger = logging.getLogger(__name__)
+
+
+class AvailabilityIndex:
+    """每个医生未来号源的剩余数，用来在医生列表上直接给出"最近可约"和"近 N 天余号"。
+
+    预约、取消、排班写入时增量更新；定期从 MySQL 全量重建，兜底其他进程的写入。
+    只保存今天起 lookahead_days 天内的排班。每次变更同时交给 slot_broadcaster 推送给订阅方，
+    重建时与旧数据不同的号源也会推送。每个医生另有一个变更计数，本进程写入（不论是否在窗口内）
+    和重建发现的变化都会让它加一，排班接口用它判断缓存的响应体是否还能用。
+    """
+
+    def __init__(self, days: int = AVAILABILITY_DAYS, lookahead_days: int = AVAILABILITY_LOOKAHEAD_DAYS) -> None:
+        self.days = days
+        self.lookahead_days = max(days, lookahead_days)
+        self.ready = False
+        self.version = 0
+        self._slots: Dict[str, Dict[Tuple[str, str], int]] = {}
+        self._ids: Dict[int, Tuple[str, str, str]] = {}
+        # 每次增量写入的序号，重建时据此认出查询期间被改过的号源
+        self._seq = 0
+        self._touched: Dict[SlotKey, int] = {}
+        self._doctor_versions: Dict[str, int] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._summary_day = ""
+        self._refresh_now = asyncio.Event()
+
+    def _in_window(self, schedule_date: str) -> bool:
+        today = date.today()
+        return today.isoformat() <= schedule_date < (today + timedelta(days=self.lookahead_days)).isoformat()
+
+    def set_slot(
+        self, doctor_id: Any, schedule_date: Any, period: Any, remaining: int, schedule_id: Optional[int] = None
+    ) -> None:
+        doctor_id, schedule_date, period = slot_key(doctor_id, schedule_date, period)
+        try:
+            remaining = int(remaining)
+        except (TypeError, ValueError):
+            self._refresh_now.set()
+            return
+        if schedule_id is not None:
+            self._ids[schedule_id] = (doctor_id, schedule_date, period)
+        self._bump(doctor_id)
+        self._seq += 1
+        self._touched[(doctor_id, schedule_date, period)] = self._seq
+        slot_broadcaster.publish(doctor_id, schedule_date, period, remaining)
+        if not self._in_window(schedule_date):
+            return
+        self._slots.setdefault(doctor_id, {})[(schedule_date, period)] = remaining
+        self._summaries.pop(doctor_id, None)
+        self.version += 1
+
+    def doctor_version(self, doctor_id: str) -> int:
+        return self._doctor_versions.get(doctor_id, 0)
+
+    def _bump(self, doctor_id: str) -> None:
+        self._doctor_versions[doctor_id] = self._doctor_versions.get(doctor_id, 0) + 1
+
+    def slot_for(self, schedule_id: Any) -> Optional[SlotKey]:
+        """按排班行 id 找号源键；重建之后新建的或不在窗口内的排班返回 None。"""
+        try:
+            return self._ids.get(int(schedule_id))
+        except (TypeError, ValueError):
+            return None
+
+    def set_by_id(self, schedule_id: Any, remaining: int) -> None:
+        key = self.slot_for(schedule_id)
+        if key is None:
+            # 重建之后新建的排班没有 id 映射，提前触发一次重建
+            self._refresh_now.set()
+            return
+        self.set_slot(*key, remaining)
+
+    def request_refresh(self) -> None:
+        self._refresh_now.set()
+
+    def remove_doctor(self, doctor_id: str) -> None:
+        self._bump(doctor_id)
+        self._slots.pop(doctor_id, None)
+        self._summaries.pop(doctor_id, None)
+        self.version += 1
+
+    def summary(self, doctor_id: str) -> Dict[str, Any]:
+        today = date.today()
+        if self._summary_day != today.isoformat():
+            self._summaries.clear()
+            self._summary_day = today.isoformat()
+        cached = self._summaries.get(doctor_id)
+        if cached is not None:
+            return cached
+        slots = self._slots.get(doctor_id, {})
+        today_str = today.isoformat()
+        open_until = (today + timedelta(days=self.days)).isoformat()
+        next_key: Optional[Tuple[str, str]] = None
+        open_slots = 0
+        for (schedule_date, period), remaining in slots.items():
+            if remaining <= 0 or schedule_date < today_str:
+                continue
+            if schedule_date < open_until:
+                open_slots += remaining
+            sort_key = (schedule_date, PERIOD_ORDER.get(period, 9))
+            if next_key is None or sort_key < (next_key[0], PERIOD_ORDER.get(next_key[1], 9)):
+                next_key = (schedule_date, period)
+        result = {
+            "nextAvailableDate": next_key[0] if next_key else None,
+            "nextAvailablePeriod": next_key[1] if next_key else None,
+            "openSlots": open_slots,
+        }
+        self._summaries[doctor_id] = result
+        return result
+
+    async def rebuild(self, pool: aiomysql.Pool) -> None:
+        """pool 要用主库：增量写入都发生在主库提交之后，从库的结果可能比已推送的值还旧。"""
+        started = self._seq
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    SELECT id, doctor_id, schedule_date, period, remaining_slots
+                    FROM doctor_schedules
+                    WHERE schedule_date >= CURDATE() AND schedule_date < CURDATE() + INTERVAL %s DAY
+                    """,
+                    [self.lookahead_days],
+                )
+                rows = await cur.fetchall()
+        slots: Dict[str, Dict[Tuple[str, str], int]] = {}
+        ids: Dict[int, Tuple[str, str, str]] = {}
+        for row in rows:
+            key = slot_key(row["doctor_id"], row["schedule_date"], row["period"])
+            slots.setdefault(key[0], {})[(key[1], key[2])] = row["remaining_slots"]
+            ids[row["id"]] = key
+        # 规则展开的时段还没有具体行，号源数就是规则里的总数
+        last_day = date.today() + timedelta(days=self.lookahead_days - 1)
+        for row in schedule_rules.expand(date.today(), last_day):
+            key = slot_key(row["doctor_id"], row["schedule_date"], row["period"])
+            slots.setdefault(key[0], {}).setdefault((key[1], key[2]), row["remaining_slots"])
+        # 查询期间本进程写入过的号源以增量值为准，查询结果可能是写入之前读到的
+        touched = {key: seq for key, seq in self._touched.items() if seq > started}
+        for doctor_id, schedule_date, period in touched:
+            current = self._slots.get(doctor_id, {}).get((schedule_date, period))
+            if current is not None:
+                slots.setdefault(doctor_id, {})[(schedule_date, period)] = current
+        self._touched = touched
+        if self.ready:
+            for doctor_id in self._publish_changes(self._slots, slots):
+                self._bump(doctor_id)
+        self._slots = slots
+        self._ids = ids
+        self._summaries = {}
+        self.version += 1
+        self.ready = True
+
+    @staticmethod
+    def _publish_changes(
+        old: Dict[str, Dict[Tuple[str, str], int]], new: Dict[str, Dict[Tuple[str, str], int]]
+    ) -> Set[str]:
+        """推送新旧两份号源的差异，返回有变化的医生。"""
+        changed: Set[str] = set()
+        for doctor_id, doctor_slots in new.items():
+            previous = old.get(doctor_id, {})
+            for (schedule_date, period), remaining in doctor_slots.items():
+                if previous.get((schedule_date, period)) != remaining:
+                    slot_broadcaster.publish(doctor_id, schedule_date, period, remaining)
+                    changed.add(doctor_id)
+        # 消失的号源（排班被删、规则停诊）按 0 推送；日期已过的是移出了窗口，不用推
+        today = date.today().isoformat()
+        for doctor_id, doctor_slots in old.items():
+            current = new.get(doctor_id, {})
+            for schedule_date, period in doctor_slots:
+                if schedule_date >= today and (schedule_date, period) not in current:
+                    slot_broadcaster.publish(doctor_id, schedule_date, period, 0)
+                    changed.add(doctor_id)
+        return changed
+
+    async def refresh_forever(self, pool: aiomysql.Pool, interval: float = AVAILABILITY_REFRESH) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._refresh_now.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_now.clear()
+            try:
+                await self.rebuild(pool)
+            except Exception as e:
+                logger.warning(f"Rebuild availability index failed: {e}")
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+BOOKING_SLOT_CONCURRENCY = int(os.getenv("BOOKING_SLOT_CONCURRENCY", "4"))
+BOOKING_CLOSED_TTL = float(os.getenv("BOOKING_CLOSED_TTL", "5"))
+
+SlotKey = Tuple[str, str, str]
+
+
+def slot_key(doctor_id: Any, schedule_date: Any, period: Any) -> SlotKey:
+    """统一号源键，日期既可能是字符串也可能是 DB 返回的 date。"""
+    if isinstance(schedule_date, datetime):
+        schedule_date = schedule_date.date()
+    if isinstance(schedule_date, date):
+        schedule_date = schedule_date.isoformat()
+    return (str(doctor_id), str(schedule_date), str(period))
+
+
+class _SlotGate:
+    __slots__ = ("semaphore", "users")
+
+    def __init__(self, concurrency: int) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.users = 0
+
+
+class SlotAdmission:
+    """进程内号源准入：已知无号的时段直接拒绝，单个时段同时进入数据库的请求数有上限。
+
+    "已满"标记只在本进程内有效且带 TTL，取消预约或修改排班时会主动清除，
+    因此多进程部署下最多在 TTL 内误拒，不会超卖（超卖由数据库条件扣减保证）。
+    """
+
+    def __init__(self, concurrency: int = BOOKING_SLOT_CONCURRENCY, closed_ttl: float = BOOKING_CLOSED_TTL) -> None:
+        self.concurrency = max(1, concurrency)
+        self.closed_ttl = closed_ttl
+        self._gates: Dict[SlotKey, _SlotGate] = {}
+        self._closed: Dict[SlotKey, Tuple[float, str]] = {}
+        self.rejected = 0
+
+    def closed_reason(self, key: SlotKey) -> Optional[str]:
+        entry = self._closed.get(key)
+        if entry is None:
+            return None
+        until, detail = entry
+        if until < time.monotonic():
+            self._closed.pop(key, None)
+            return None
+        return detail
+
+    def mark_closed(self, key: SlotKey, detail: str) -> None:
+        now = time.monotonic()
+        if len(self._closed) > 4096:
+            self._closed = {k: v for k, v in self._closed.items() if v[0] >= now}
+        self._closed[key] = (now + self.closed_ttl, detail)
+
+    def mark_open(self, key: SlotKey) -> None:
+        self._closed.pop(key, None)
+
+    def reset_doctor(self, doctor_id: str) -> None:
+        doctor_id = str(doctor_id)
+        for key in [k for k in self._closed if k[0] == doctor_id]:
+            self._closed.pop(key, None)
+
+    def reset(self) -> None:
+        self._closed.clear()
+
+    def _reject_if_closed(self, key: SlotKey) -> None:
+        detail = self.closed_reason(key)
+        if detail is not None:
+            self.rejected += 1
+            raise HTTPException(status_code=400, detail=detail)
+
+    @asynccontextmanager
+    async def admit(self, key: SlotKey) -> AsyncIterator[None]:
+        self._reject_if_closed(key)
+        gate = self._gates.get(key)
+        if gate is None:
+            gate = self._gates[key] = _SlotGate(self.concurrency)
+        gate.users += 1
+        try:
+            async with gate.semaphore:
+                # 排队期间号源可能已被抢完，拿到名额后再检查一次
+                self._reject_if_closed(key)
+                yield
+        finally:
+            gate.users -= 1
+            if gate.users == 0 and self._gates.get(key) is gate:
+                del self._gates[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"activeSlots": len(self._gates), "closedSlots": len(self._closed), "rejected": self.rejected}
+
+
+slot_admission = SlotAdmission()
+
+
+class BookingDedupe:
+    """同一手机号对同一时段同时只允许一个预约请求在途，连点和重试在进入事务前就被挡掉。
+
+    已经约成功的重复预约由 book_appointment 在开事务前查库拦截。两者都只在本进程内有效，
+    多 worker 时跨进程的并发重复由 appointments 表的 uniq_active_booking 唯一键兜底。
+    """
+
+    def __init__(self) -> None:
+        self._active: Set[Tuple[str, str, str, str]] = set()
+        self.rejected = 0
+
+    @contextmanager
+    def hold(self, phone: Any, key: SlotKey) -> Iterator[None]:
+        entry = (str(phone), *key)
+        if entry in self._active:
+            self.rejected += 1
+            raise HTTPException(status_code=409, detail="该时段的预约正在提交，请勿重复提交")
+        self._active.add(entry)
+        try:
+            yield
+        finally:
+            self._active.discard(entry)
+
+
+booking_dedupe = BookingDedupe()
@@ -0,0 +1,129 @@
+import inspect
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from backend_fastapi.utils import content_etag, fast_json
+
+DOCTOR_CACHE_TTL = float(os.getenv("DOCTOR_CACHE_TTL", "300"))
+DOCTOR_CACHE_SIZE = int(os.getenv("DOCTOR_CACHE_SIZE", "1024"))
+AVATAR_CACHE_TTL = float(os.getenv("AVATAR_CACHE_TTL", "3600"))
+AVATAR_CACHE_SIZE = int(os.getenv("AVATAR_CACHE_SIZE", "2048"))
+RENDER_CACHE_TTL = float(os.getenv("RENDER_CACHE_TTL", "300"))
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "2048"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存，超过 maxsize 时淘汰最久未使用的条目。
+
+    只在事件循环线程内使用，不加锁。generation 在每次 clear() 后递增，
+    便于依赖缓存内容的上层判断数据是否已经失效。
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """generation 是读数据之前记下的 self.generation；期间缓存被清空过时不写入，免得把旧数据放回去。"""
+        if generation is not None and generation != self.generation:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": round(self.hits / lookups, 4) if lookups else None,
+            "generation": self.generation,
+        }
+
+
+# 医生目录缓存：("list", keyword) -> 列表，("doctor", doctor_id) -> 单个医生，值均为 map_doctor_row 结果
+doctor_cache = TTLCache(DOCTOR_CACHE_SIZE, DOCTOR_CACHE_TTL)
+
+
+def invalidate_doctor_cache() -> None:
+    """医生数据有写入时调用。列表查询都可能受影响，所以整体清空。"""
+    doctor_cache.clear()
+
+
+# 头像缓存：doctor_id -> ("redirect", url) 或 ("bytes", 内容, ETag, media_type)
+avatar_cache = TTLCache(AVATAR_CACHE_SIZE, AVATAR_CACHE_TTL)
+
+
+class RenderCache:
+    """GET 接口序列化好的响应体和 ETag：key -> (源对象, 版本, ETag, 响应体, 修改时间)。
+
+    源对象（比如 doctor_cache 里的那份数据）和版本（进程内计数器、聚合查询结果等）都没变时直接复用，
+    不再查库也不再序列化，If-None-Match 命中时就是一次字典查找。ETag 取响应体的哈希，
+    不同进程对同样的数据给出同样的 ETag，客户端换了 worker 也能拿到 304。
+    修改时间是本进程第一次渲染出这份响应体的时间，重新渲染但内容没变时沿用原来的时间，用作 Last-Modified。
+    """
+
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE, ttl: float = RENDER_CACHE_TTL) -> None:
+        self._cache = TTLCache(maxsize, ttl)
+
+    async def render(
+        self, key: Hashable, source: Any, version: Hashable, build: Callable[[], Any]
+    ) -> Tuple[str, bytes, float]:
+        """build 返回要序列化的内容，可以是协程。返回 (ETag, 响应体, 修改时间)。"""
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] is source and entry[1] == version:
+            return entry[2], entry[3], entry[4]
+        content = build()
+        if inspect.isawaitable(content):
+            content = await content
+        body = fast_json(content)
+        etag = content_etag(body)
+        modified = entry[4] if entry is not None and entry[2] == etag else time.time()
+        # 存下源对象本身而不是 id()，避免对象被回收后 id 复用造成误命中
+        self._cache.set(key, (source, version, etag, body, modified))
+        return etag, body, modified
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+render_cache = RenderCache()
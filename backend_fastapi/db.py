@@ -1,10 +1,18 @@
+import asyncio
+import inspect
+import logging
 import os
-from typing import Any
+import time
+from typing import Any, Dict, Optional
 
 import aiomysql
+import pymysql
 from aiomysql.cursors import DictCursor
+from pymysql.constants import CLIENT
 from fastapi import HTTPException, Request
 
+from backend_fastapi.metrics import SQLMetrics, sql_metrics
+
 DB_CONFIG: dict[str, Any] = {
     "host": os.getenv("DB_HOST", "127.0.0.1"),
     "user": os.getenv("DB_USER", "root"),
@@ -13,20 +21,351 @@ DB_CONFIG: dict[str, Any] = {
     "port": int(os.getenv("DB_PORT", "3306")),
 }
 
+# 从库只需配置 DB_REPLICA_HOST，其余项缺省与主库相同
+REPLICA_CONFIG: dict[str, Any] = {
+    "host": os.getenv("DB_REPLICA_HOST", ""),
+    "user": os.getenv("DB_REPLICA_USER", DB_CONFIG["user"]),
+    "password": os.getenv("DB_REPLICA_PASSWORD", DB_CONFIG["password"]),
+    "db": os.getenv("DB_REPLICA_NAME", DB_CONFIG["db"]),
+    "port": int(os.getenv("DB_REPLICA_PORT", str(DB_CONFIG["port"]))),
+}
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# 连接空闲超过该秒数后重建，应小于 MySQL 的 wait_timeout；-1 表示不回收
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+# 启动时预先建好的连接数，默认半个池；设成 DB_POOL_MIN 或更小等于不预热（连接池本身就会建 minsize 条）
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", str(max(DB_POOL_MIN, DB_POOL_MAX // 2))))
+DB_PING_INTERVAL = float(os.getenv("DB_PING_INTERVAL", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedCursor:
+    """给 execute/executemany 计时，按 SQL 指纹记录耗时、行数和错误；其余属性透传。"""
+
+    def __init__(self, cursor: Any, connection: "InstrumentedConnection") -> None:
+        self._cursor = cursor
+        self._connection = connection
+        self._unbuffered = isinstance(cursor, aiomysql.SSCursor)
+        self._last_sql = ""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    async def _timed(self, method: Any, sql: str, *args: Any) -> Any:
+        self._last_sql = sql
+        acquire_wait = self._connection.take_acquire_wait()
+        began = time.perf_counter()
+        try:
+            result = await method(sql, *args)
+        except BaseException:
+            self._connection.metrics.record(sql, time.perf_counter() - began, error=True, acquire_wait=acquire_wait)
+            raise
+        rows = 0 if self._unbuffered else max(self._cursor.rowcount or 0, 0)
+        self._connection.metrics.record(sql, time.perf_counter() - began, rows=rows, acquire_wait=acquire_wait)
+        return result
+
+    async def execute(self, query: str, args: Any = None) -> Any:
+        return await self._timed(self._cursor.execute, query, args)
+
+    async def executemany(self, query: str, args: Any) -> Any:
+        return await self._timed(self._cursor.executemany, query, args)
+
+    def _count_fetched(self, rows: int) -> None:
+        # 流式游标 execute 时不知道行数，按实际取到的行累计
+        if self._unbuffered and rows and self._last_sql:
+            self._connection.metrics.add_rows(self._last_sql, rows)
+
+    async def fetchone(self) -> Any:
+        row = await self._cursor.fetchone()
+        self._count_fetched(1 if row is not None else 0)
+        return row
+
+    async def fetchmany(self, size: Optional[int] = None) -> Any:
+        rows = await self._cursor.fetchmany(size)
+        self._count_fetched(len(rows))
+        return rows
+
+    async def fetchall(self) -> Any:
+        rows = await self._cursor.fetchall()
+        self._count_fetched(len(rows))
+        return rows
+
+    async def __aenter__(self) -> "InstrumentedCursor":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self._cursor.__aexit__(*exc)
+
+
+class _CursorContext:
+    """和 aiomysql 一样，conn.cursor() 既可以 await 也可以 async with。"""
+
+    def __init__(self, connection: "InstrumentedConnection", cursor_classes: tuple) -> None:
+        self._connection = connection
+        self._cursor_classes = cursor_classes
+        self._cursor: Optional[InstrumentedCursor] = None
+
+    async def _open(self) -> InstrumentedCursor:
+        raw = self._connection.raw.cursor(*self._cursor_classes)
+        if inspect.isawaitable(raw):
+            raw = await raw
+        self._cursor = InstrumentedCursor(raw, self._connection)
+        return self._cursor
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def __aenter__(self) -> InstrumentedCursor:
+        return await self._open()
+
+    async def __aexit__(self, *exc: Any) -> None:
+        if self._cursor is not None:
+            await self._cursor.__aexit__(*exc)
+
+
+class InstrumentedConnection:
+    def __init__(self, connection: Any, metrics: SQLMetrics, acquire_wait: float) -> None:
+        self.raw = connection
+        self.metrics = metrics
+        self._acquire_wait: Optional[float] = acquire_wait
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.raw, name)
+
+    def take_acquire_wait(self) -> Optional[float]:
+        # 借连接的等待时间记到这条连接上的第一条语句
+        wait, self._acquire_wait = self._acquire_wait, None
+        return wait
+
+    def cursor(self, *cursor_classes: Any) -> _CursorContext:
+        return _CursorContext(self, cursor_classes)
+
+    async def _timed(self, statement: str, method: Any) -> Any:
+        acquire_wait = self.take_acquire_wait()
+        began = time.perf_counter()
+        try:
+            result = await method()
+        except BaseException:
+            self.metrics.record(statement, time.perf_counter() - began, error=True, acquire_wait=acquire_wait)
+            raise
+        self.metrics.record(statement, time.perf_counter() - began, acquire_wait=acquire_wait)
+        return result
 
-async def init_db_pool() -> aiomysql.Pool:
-    return await aiomysql.create_pool(
+    async def begin(self) -> None:
+        await self._timed("BEGIN", self.raw.begin)
+
+    async def commit(self) -> None:
+        await self._timed("COMMIT", self.raw.commit)
+
+    async def rollback(self) -> None:
+        await self._timed("ROLLBACK", self.raw.rollback)
+
+
+class _AcquireContext:
+    def __init__(self, pool: "InstrumentedPool") -> None:
+        self._pool = pool
+        self._inner: Any = None
+
+    async def __aenter__(self) -> InstrumentedConnection:
+        pool = self._pool
+        if pool.fallback is not None and not pool.healthy:
+            self._inner = pool.fallback.acquire()
+            return await self._inner.__aenter__()
+        began = time.perf_counter()
+        try:
+            connection = await pool.acquire_raw(self)
+        except asyncio.TimeoutError:
+            if pool.fallback is None:
+                raise HTTPException(status_code=503, detail="数据库繁忙，请稍后重试")
+            # 只是从库池忙：这一个请求改走主库，不标记不可用，免得高峰时把全部读流量压到主库
+            pool.stats_counters["fallbacks"] += 1
+            self._inner = pool.fallback.acquire()
+            return await self._inner.__aenter__()
+        except (OSError, pymysql.err.OperationalError) as e:
+            if pool.fallback is None:
+                raise
+            # 连不上从库时改走主库，等探活成功后再切回来
+            pool.mark_unhealthy(e)
+            self._inner = pool.fallback.acquire()
+            return await self._inner.__aenter__()
+        wait = time.perf_counter() - began
+        pool.metrics.record_acquire(wait)
+        return InstrumentedConnection(connection, pool.metrics, wait)
+
+    async def __aexit__(self, *exc: Any) -> Any:
+        return await self._inner.__aexit__(*exc)
+
+
+class InstrumentedPool:
+    """包一层 aiomysql 连接池：记录借连接等待和每条语句的耗时，接口与原连接池一致。
+
+    另外负责借连接超时、启动预热和定时探活；设置了 fallback（从库池指向主库池）时，
+    本池不可用就把请求转给 fallback。
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        metrics: SQLMetrics = sql_metrics,
+        name: str = "primary",
+        acquire_timeout: float = DB_ACQUIRE_TIMEOUT,
+        fallback: Optional["InstrumentedPool"] = None,
+    ) -> None:
+        self.raw = pool
+        self.metrics = metrics
+        self.name = name
+        self.acquire_timeout = acquire_timeout
+        self.fallback = fallback
+        self.healthy = True
+        self.waiting = 0
+        self.stats_counters: Dict[str, int] = {"acquireTimeouts": 0, "pings": 0, "pingFailures": 0, "fallbacks": 0}
+        self.last_ping_ms: Optional[float] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.raw, name)
+
+    def acquire(self) -> _AcquireContext:
+        return _AcquireContext(self)
+
+    async def acquire_raw(self, context: _AcquireContext) -> Any:
+        context._inner = self.raw.acquire()
+        self.waiting += 1
+        try:
+            return await asyncio.wait_for(context._inner.__aenter__(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats_counters["acquireTimeouts"] += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+    def mark_unhealthy(self, error: BaseException) -> None:
+        if self.healthy:
+            logger.warning(f"DB pool {self.name} unavailable, falling back: {error!r}")
+        self.healthy = False
+        self.stats_counters["fallbacks"] += 1
+
+    async def warm(self, target: int) -> int:
+        """启动时一次性建好 target 条连接，避免第一波请求排队建连。"""
+        target = min(target, self.raw.maxsize)
+        connections = await asyncio.gather(*(self.raw.acquire() for _ in range(target)), return_exceptions=True)
+        warmed = 0
+        for connection in connections:
+            if isinstance(connection, BaseException):
+                logger.warning(f"Warm DB pool {self.name} failed: {connection!r}")
+                continue
+            warmed += 1
+            await self.raw.release(connection)
+        return warmed
+
+    async def ping_idle(self) -> None:
+        """逐个借出空闲连接 ping 一下，断掉的直接关闭，由连接池下次按需重建。
+
+        只有连新连接都建不起来时才认为整个池不可用；借不到连接只说明池忙，不改变状态。
+        """
+        failures = 0
+        reachable = True
+        began = time.perf_counter()
+        for _ in range(max(1, self.raw.freesize)):
+            try:
+                connection = await asyncio.wait_for(self.raw.acquire(), self.acquire_timeout)
+            except asyncio.TimeoutError:
+                reachable = self.healthy
+                break
+            except Exception as e:
+                failures += 1
+                reachable = False
+                logger.warning(f"DB pool {self.name} liveness acquire failed: {e!r}")
+                break
+            try:
+                await connection.ping(reconnect=False)
+            except Exception as e:
+                failures += 1
+                logger.warning(f"DB pool {self.name} dropped stale connection: {e!r}")
+                connection.close()
+            finally:
+                await self.raw.release(connection)
+        self.stats_counters["pings"] += 1
+        self.stats_counters["pingFailures"] += failures
+        self.last_ping_ms = round((time.perf_counter() - began) * 1000, 3)
+        if reachable and not self.healthy:
+            logger.info(f"DB pool {self.name} is healthy again")
+        self.healthy = reachable
+
+    async def ping_forever(self, interval: float = DB_PING_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.ping_idle()
+            except Exception as e:
+                logger.warning(f"DB pool {self.name} liveness probe failed: {e!r}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "size": self.raw.size,
+            "free": self.raw.freesize,
+            "minsize": self.raw.minsize,
+            "maxsize": self.raw.maxsize,
+            "waiting": self.waiting,
+            "lastPingMs": self.last_ping_ms,
+            **self.stats_counters,
+        }
+
+
+async def _create_pool(config: Dict[str, Any], name: str, fallback: Optional[InstrumentedPool] = None) -> InstrumentedPool:
+    pool = await aiomysql.create_pool(
         autocommit=True,
-        minsize=1,
-        maxsize=10,
+        minsize=DB_POOL_MIN,
+        maxsize=DB_POOL_MAX,
+        pool_recycle=DB_POOL_RECYCLE,
         charset="utf8mb4",
         cursorclass=DictCursor,
-        **DB_CONFIG,
+        # rowcount 返回匹配行数而不是实际改动行数，UPDATE 的 rowcount 可以直接当存在性检查
+        client_flag=CLIENT.FOUND_ROWS,
+        **config,
     )
+    return InstrumentedPool(pool, name=name, fallback=fallback)
+
+
+async def init_db_pool() -> InstrumentedPool:
+    return await _create_pool(DB_CONFIG, "primary")
 
 
-async def get_pool(request: Request) -> aiomysql.Pool:
-    pool: aiomysql.Pool = getattr(request.app.state, "db_pool", None)
+async def init_read_pool(primary: InstrumentedPool) -> InstrumentedPool:
+    """配置了 DB_REPLICA_HOST 时建从库连接池，不可用时回落主库；没配置就直接用主库。"""
+    if not REPLICA_CONFIG["host"]:
+        return primary
+    try:
+        return await _create_pool(REPLICA_CONFIG, "replica", fallback=primary)
+    except Exception as e:
+        logger.warning(f"Create replica DB pool failed, reads use primary: {e!r}")
+        return primary
+
+
+def app_pools(state: Any) -> list:
+    """app.state 上的主库池和（单独配置时的）从库池，去重。"""
+    pools = []
+    for name in ("db_pool", "db_read_pool"):
+        pool = getattr(state, name, None)
+        if pool is not None and pool not in pools:
+            pools.append(pool)
+    return pools
+
+
+async def get_pool(request: Request) -> InstrumentedPool:
+    pool: Optional[InstrumentedPool] = getattr(request.app.state, "db_pool", None)
     if not pool:
         raise HTTPException(status_code=500, detail="Database pool not initialized")
     return pool
+
+
+async def get_read_pool(request: Request) -> InstrumentedPool:
+    """只读查询用的连接池：有从库用从库，否则用主库。"""
+    pool = getattr(request.app.state, "db_read_pool", None)
+    if pool is None:
+        return await get_pool(request)
+    return pool
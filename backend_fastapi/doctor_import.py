@@ -0,0 +1,274 @@
+"""批量导入医生：CSV（首行表头）或 NDJSON，逐行流式解析，分块多行 INSERT，头像并发压缩上传。
+
+    python -m backend_fastapi.doctor_import doctors.csv [--format csv|ndjson]
+
+字段名与 POST /api/admin/doctors 的请求体相同：name（必填）、title、expertise、intro、hospitalId、
+hospitalName、departmentName、registrationFee、avatarImage（base64，压缩后上传 COS），
+另外可以用 avatarUrl 直接给已经上传好的头像地址。
+命令行导入只清本进程的缓存，运行中的服务等缓存过期和搜索索引定期重建后才能看到新医生。
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import orjson
+import pymysql
+
+from backend_fastapi.cache import invalidate_doctor_cache
+from backend_fastapi.db import init_db_pool
+from backend_fastapi.search import doctor_search_index
+from backend_fastapi.utils import process_avatar_payload_async, shutdown_image_executor, upload_avatar_to_cos_async
+
+DOCTOR_IMPORT_BATCH = int(os.getenv("DOCTOR_IMPORT_BATCH", "200"))
+DOCTOR_IMPORT_AVATAR_WORKERS = int(os.getenv("DOCTOR_IMPORT_AVATAR_WORKERS", "4"))
+# 报告里最多保留的逐行错误条数，超出的只计数
+DOCTOR_IMPORT_MAX_ERRORS = int(os.getenv("DOCTOR_IMPORT_MAX_ERRORS", "1000"))
+IMPORT_FORMATS = ("csv", "ndjson")
+READ_CHUNK_SIZE = 64 * 1024
+
+# 请求字段 -> 列，顺序即 INSERT 的列顺序（avatar_url、registration_fee 单独处理）
+TEXT_FIELDS = (
+    ("name", "name"),
+    ("title", "title"),
+    ("expertise", "expertise"),
+    ("intro", "intro"),
+    ("hospitalId", "hospital_id"),
+    ("hospitalName", "hospital_name"),
+    ("departmentName", "department_name"),
+)
+IMPORT_COLUMNS = ("doctor_id", *(column for _, column in TEXT_FIELDS), "avatar_url", "registration_fee")
+AVATAR_INDEX = IMPORT_COLUMNS.index("avatar_url")
+
+# (行号, 字段, 解析错误)
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """把字节块切成行，跨块的多字节字符和半行留到下一块；兼容带 BOM 的 UTF-8。"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    line_no = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield line_no + 1, pending.rstrip("\r")
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Record]:
+    """逐条产出记录。CSV 的引号字段里可以换行：引号个数为奇数时接着读下一行。"""
+    if fmt == "ndjson":
+        async for line_no, line in iter_lines(chunks):
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                yield line_no, None, "Invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "Row must be a JSON object"
+                continue
+            yield line_no, record, None
+        return
+
+    header: Optional[List[str]] = None
+    buffered: List[str] = []
+    quotes = 0
+    start = 0
+    async for line_no, line in iter_lines(chunks):
+        if not buffered:
+            start = line_no
+        buffered.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text = "\n".join(buffered)
+        buffered, quotes = [], 0
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        if len(values) != len(header):
+            yield start, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield start, dict(zip(header, values)), None
+    if buffered:
+        yield start, None, "Unterminated quoted field"
+
+
+def doctor_values(record: Dict[str, Any]) -> Tuple[List[Any], Optional[str]]:
+    """返回 (按 IMPORT_COLUMNS 排列的值, 待处理的头像 base64)；数据不合法时抛 ValueError。"""
+    name = str(record.get("name") or "").strip()
+    if not name:
+        raise ValueError("Doctor name is required")
+    fee = record.get("registrationFee")
+    if fee is None or fee == "":
+        fee = 10.00
+    else:
+        try:
+            fee = float(fee)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid registrationFee")
+    texts = [name, *(str(record.get(field) or "") for field, _ in TEXT_FIELDS[1:])]
+    values = [str(uuid.uuid4()), *texts, record.get("avatarUrl") or None, fee]
+    return values, record.get("avatarImage") or None
+
+
+class DoctorImport:
+    """一次导入任务。
+
+    读一行处理一行：没有头像的行直接进批，攒够 batch_size 行发一条多行 INSERT；
+    有头像的行交给最多 avatar_workers 个并发任务压缩上传，任务占满时停止读入，内存占用与文件大小无关。
+    某一批写库失败时改为逐行插入，只有出错的那几行记为失败。头像处理失败的行照常导入、头像为空，
+    与单个创建接口的行为一致。
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        batch_size: int = DOCTOR_IMPORT_BATCH,
+        avatar_workers: int = DOCTOR_IMPORT_AVATAR_WORKERS,
+        max_errors: int = DOCTOR_IMPORT_MAX_ERRORS,
+    ) -> None:
+        self.pool = pool
+        self.batch_size = max(1, batch_size)
+        self.max_errors = max_errors
+        self._avatar_slots = asyncio.Semaphore(max(1, avatar_workers))
+        self._avatar_tasks: Set[asyncio.Task] = set()
+        self._batch: List[Tuple[int, List[Any]]] = []
+        self._writing = asyncio.Lock()
+        self.report: Dict[str, Any] = {"rows": 0, "imported": 0, "failed": 0, "avatarFailed": 0, "errors": []}
+
+    def _note(self, line_no: int, name: Any, message: str) -> None:
+        if len(self.report["errors"]) < self.max_errors:
+            self.report["errors"].append({"line": line_no, "name": name, "error": message})
+
+    def _fail(self, line_no: int, name: Any, message: str) -> None:
+        self.report["failed"] += 1
+        self._note(line_no, name, message)
+
+    async def run(self, records: AsyncIterator[Record]) -> Dict[str, Any]:
+        try:
+            async for line_no, record, error in records:
+                self.report["rows"] += 1
+                if error is None:
+                    try:
+                        values, avatar = doctor_values(record)
+                    except ValueError as e:
+                        error = str(e)
+                if error is not None:
+                    self._fail(line_no, (record or {}).get("name"), error)
+                    continue
+                if avatar:
+                    await self._avatar_slots.acquire()
+                    task = asyncio.create_task(self._with_avatar(line_no, values, avatar))
+                    self._avatar_tasks.add(task)
+                    task.add_done_callback(self._avatar_tasks.discard)
+                else:
+                    await self._add(line_no, values)
+            if self._avatar_tasks:
+                await asyncio.gather(*self._avatar_tasks)
+            await self._flush()
+        finally:
+            # 客户端中途断开等情况下不留后台任务
+            for task in list(self._avatar_tasks):
+                task.cancel()
+            if self.report["imported"]:
+                invalidate_doctor_cache()
+        return self.report
+
+    async def _with_avatar(self, line_no: int, values: List[Any], avatar: str) -> None:
+        try:
+            processed = await process_avatar_payload_async(avatar)
+            if not processed:
+                raise ValueError("invalid image")
+            values[AVATAR_INDEX] = await upload_avatar_to_cos_async(processed)
+        except Exception as e:
+            self.report["avatarFailed"] += 1
+            self._note(line_no, values[1], f"Avatar skipped: {e}")
+        finally:
+            self._avatar_slots.release()
+        await self._add(line_no, values)
+
+    async def _add(self, line_no: int, values: List[Any]) -> None:
+        self._batch.append((line_no, values))
+        if len(self._batch) >= self.batch_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        placeholders = "(" + ", ".join(["%s"] * len(IMPORT_COLUMNS)) + ")"
+        sql = f"INSERT INTO doctors ({', '.join(IMPORT_COLUMNS)}) VALUES "
+        inserted: List[List[Any]] = []
+        # 同一时间只占一个连接写库，头像任务多时也不会把连接池占满
+        async with self._writing:
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    try:
+                        await cur.execute(sql + ", ".join([placeholders] * len(batch)), [v for _, values in batch for v in values])
+                        inserted = [values for _, values in batch]
+                    except pymysql.MySQLError:
+                        # 单条多行 INSERT 要么全成功要么全失败，逐行重试找出坏行
+                        for line_no, values in batch:
+                            try:
+                                await cur.execute(sql + placeholders, values)
+                                inserted.append(values)
+                            except pymysql.MySQLError as e:
+                                self._fail(line_no, values[1], f"Insert failed: {e.args[-1] if e.args else e}")
+        self.report["imported"] += len(inserted)
+        # 命令行导入时索引没有建过，不必维护
+        if doctor_search_index.ready:
+            for values in inserted:
+                row = dict(zip(IMPORT_COLUMNS, values))
+                doctor_search_index.upsert(row["doctor_id"], row)
+
+
+async def read_file(path: Path, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    path = Path(args.path)
+    fmt = args.format or ("ndjson" if path.suffix.lower() in (".ndjson", ".jsonl") else "csv")
+    pool = await init_db_pool()
+    try:
+        job = DoctorImport(pool, batch_size=args.batch, avatar_workers=args.avatar_workers)
+        return await job.run(iter_records(read_file(path), fmt))
+    finally:
+        pool.close()
+        await pool.wait_closed()
+        shutdown_image_executor()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV 或 NDJSON 文件")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="默认按扩展名判断，.ndjson/.jsonl 以外都当 CSV")
+    parser.add_argument("--batch", type=int, default=DOCTOR_IMPORT_BATCH, help="每条 INSERT 的行数")
+    parser.add_argument("--avatar-workers", type=int, default=DOCTOR_IMPORT_AVATAR_WORKERS, help="并发处理头像的行数")
+    report = asyncio.run(_main(parser.parse_args()))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
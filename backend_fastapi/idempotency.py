@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from fastapi import HTTPException
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "20000"))
+MAX_KEY_LENGTH = 255
+
+IdempotencyKey = Tuple[str, str]
+
+
+class _Entry:
+    __slots__ = ("future", "fingerprint", "expires_at")
+
+    def __init__(self, future: asyncio.Future, fingerprint: str) -> None:
+        self.future = future
+        self.fingerprint = fingerprint
+        self.expires_at = float("inf")
+
+
+def request_fingerprint(body: Any) -> str:
+    raw = json.dumps(body, sort_keys=True, ensure_ascii=False, default=str).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+class IdempotencyStore:
+    """进程内的 Idempotency-Key 存储。
+
+    同一个 key 的第一个请求真正执行；执行期间到达的重复请求等待同一个 future，
+    执行完成后 ttl 内到达的重复请求直接拿缓存的结果。业务错误（4xx 的 HTTPException）
+    同样缓存，重试得到一样的答复；5xx 和其他异常不缓存，客户端可以用同一个 key 重试。
+    同一个 key 配不同的请求体返回 422。
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[IdempotencyKey, _Entry] = {}
+        self.stats: Dict[str, int] = {"executed": 0, "joined": 0, "replayed": 0, "conflicts": 0}
+
+    def _prune(self, now: float) -> None:
+        if len(self._entries) < self.max_entries:
+            return
+        self._entries = {k: v for k, v in self._entries.items() if v.expires_at >= now}
+        # 全是进行中的请求也不能无限增长，丢掉最早的已完成结果
+        overflow = len(self._entries) - self.max_entries + 1
+        if overflow > 0:
+            done = [k for k, v in self._entries.items() if v.future.done()][:overflow]
+            for k in done:
+                del self._entries[k]
+
+    async def run(
+        self, key: IdempotencyKey, body: Any, func: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """返回 (结果, 是否为重放)。"""
+        if len(key[1]) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+        fingerprint = request_fingerprint(body)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < now:
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self.stats["conflicts"] += 1
+                raise HTTPException(status_code=422, detail="Idempotency-Key 已用于不同的请求")
+            self.stats["replayed" if entry.future.done() else "joined"] += 1
+            # shield：重复请求自己被取消时不影响第一个请求的执行
+            return await asyncio.shield(entry.future), True
+
+        self._prune(now)
+        entry = self._entries[key] = _Entry(asyncio.get_running_loop().create_future(), fingerprint)
+        self.stats["executed"] += 1
+        try:
+            result = await func()
+        except HTTPException as e:
+            self._finish(key, entry, exception=e, keep=e.status_code < 500)
+            raise
+        except asyncio.CancelledError:
+            self._finish(key, entry, exception=HTTPException(status_code=409, detail="请求处理中断，请重试"), keep=False)
+            raise
+        except Exception as e:
+            self._finish(key, entry, exception=e, keep=False)
+            raise
+        entry.future.set_result(result)
+        entry.expires_at = time.monotonic() + self.ttl
+        return result, False
+
+    def _finish(self, key: IdempotencyKey, entry: _Entry, exception: BaseException, keep: bool) -> None:
+        entry.future.set_exception(exception)
+        # 没有重复请求等待时避免 "exception was never retrieved" 警告
+        entry.future.exception()
+        if keep:
+            entry.expires_at = time.monotonic() + self.ttl
+        elif self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._entries)}
+
+
+idempotency_store = IdempotencyStore()
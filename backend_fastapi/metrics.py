@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+MAX_FINGERPRINTS = int(os.getenv("SQL_METRICS_MAX_FINGERPRINTS", "500"))
+
+# 对外导出的 Prometheus 桶边界（秒）；内部按更细的对数-线性桶计数
+EXPORT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_logger = logging.getLogger("backend_fastapi.slow_query")
+
+
+class LatencyHistogram:
+    """HDR 风格的延迟直方图：按 2 的幂分段，每段再线性切成 2**sub_bits 个子桶。
+
+    以微秒为单位计数，相对误差不超过 1 / 2**sub_bits；记录是 O(1)，
+    内存固定，分位数从桶里估算。
+    """
+
+    __slots__ = ("sub_bits", "counts", "count", "total", "max")
+
+    def __init__(self, sub_bits: int = 3, max_exponent: int = 36) -> None:
+        self.sub_bits = sub_bits
+        self.counts = [0] * ((max_exponent + 1) << sub_bits)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, micros: int) -> int:
+        if micros < (1 << self.sub_bits):
+            return micros
+        exponent = micros.bit_length() - 1 - self.sub_bits
+        sub = (micros >> exponent) - (1 << self.sub_bits)
+        index = ((exponent + 1) << self.sub_bits) + sub
+        return min(index, len(self.counts) - 1)
+
+    def _upper_bound(self, index: int) -> float:
+        """桶的上界（秒）。"""
+        size = 1 << self.sub_bits
+        if index < size:
+            return (index + 1) / 1e6
+        exponent = (index >> self.sub_bits) - 1
+        sub = index & (size - 1)
+        return ((size + sub + 1) << exponent) / 1e6
+
+    def record(self, seconds: float) -> None:
+        self.counts[self._index(max(0, int(seconds * 1e6)))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        target = math.ceil(self.count * pct / 100.0)
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if bucket and seen >= target:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds: Iterable[float] = EXPORT_BUCKETS) -> List[Tuple[float, int]]:
+        """按导出桶边界给出累计计数；细桶上界不超过边界的都算进去。"""
+        result: List[Tuple[float, int]] = []
+        bounds = list(bounds)
+        seen = 0
+        bound_index = 0
+        for index, bucket in enumerate(self.counts):
+            upper = self._upper_bound(index)
+            while bound_index < len(bounds) and upper > bounds[bound_index]:
+                result.append((bounds[bound_index], seen))
+                bound_index += 1
+            seen += bucket
+        while bound_index < len(bounds):
+            result.append((bounds[bound_index], seen))
+            bound_index += 1
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sumMs": round(self.total * 1000, 3),
+            "p50Ms": round(self.percentile(50) * 1000, 3),
+            "p95Ms": round(self.percentile(95) * 1000, 3),
+            "p99Ms": round(self.percentile(99) * 1000, 3),
+            "maxMs": round(self.max * 1000, 3),
+        }
+
+
+_COMMENT_RE = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_RE = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """把 SQL 归一化成指纹：去注释、合并空白、字面量和占位符换成 ?，多值列表折叠。"""
+    text = _COMMENT_RE.sub(" ", sql)
+    text = _STRING_RE.sub("?", text)
+    text = _PLACEHOLDER_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = " ".join(text.split())
+    text = _IN_LIST_RE.sub("(...)", text)
+    text = _VALUES_RE.sub("(...)", text)
+    return text
+
+
+class StatementStats:
+    __slots__ = ("acquire", "execute", "rows", "errors")
+
+    def __init__(self) -> None:
+        self.acquire = LatencyHistogram()
+        self.execute = LatencyHistogram()
+        self.rows = 0
+        self.errors = 0
+
+
+class SQLMetrics:
+    """按 SQL 指纹汇总：连接池等待、执行耗时、返回/影响行数、错误数。"""
+
+    OTHER = "__other__"
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, max_fingerprints: int = MAX_FINGERPRINTS) -> None:
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.max_fingerprints = max_fingerprints
+        self.statements: Dict[str, StatementStats] = {}
+        self.pool_acquire = LatencyHistogram()
+
+    def _stats(self, key: str) -> StatementStats:
+        stats = self.statements.get(key)
+        if stats is None:
+            if len(self.statements) >= self.max_fingerprints:
+                key = self.OTHER
+                stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats()
+        return stats
+
+    def record_acquire(self, seconds: float) -> None:
+        self.pool_acquire.record(seconds)
+
+    def record(
+        self,
+        sql: str,
+        seconds: float,
+        rows: int = 0,
+        error: bool = False,
+        acquire_wait: Optional[float] = None,
+    ) -> None:
+        key = fingerprint(sql)
+        stats = self._stats(key)
+        stats.execute.record(seconds)
+        if acquire_wait is not None:
+            stats.acquire.record(acquire_wait)
+        if rows > 0:
+            stats.rows += rows
+        if error:
+            stats.errors += 1
+        if seconds >= self.slow_query_seconds:
+            slow_query_logger.warning(
+                f"slow query {seconds * 1000:.1f}ms rows={rows} error={error} acquire_wait="
+                f"{(acquire_wait or 0) * 1000:.1f}ms sql={key}"
+            )
+
+    def add_rows(self, sql: str, rows: int) -> None:
+        self._stats(fingerprint(sql)).rows += rows
+
+    def top(self, limit: int = 50) -> List[Dict[str, Any]]:
+        ranked = sorted(self.statements.items(), key=lambda item: item[1].execute.total, reverse=True)
+        return [
+            {
+                "fingerprint": key,
+                "execute": stats.execute.summary(),
+                "acquireWait": stats.acquire.summary(),
+                "rows": stats.rows,
+                "errors": stats.errors,
+            }
+            for key, stats in ranked[:limit]
+        ]
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_histogram(name: str, labels: str, histogram: LatencyHistogram) -> List[str]:
+    sep = "," if labels else ""
+    lines = [
+        f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}' for bound, count in histogram.cumulative()
+    ]
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.total:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+def render_sql_metrics(metrics: SQLMetrics) -> List[str]:
+    lines = [
+        "# HELP db_pool_acquire_wait_seconds Time spent waiting for a pooled connection.",
+        "# TYPE db_pool_acquire_wait_seconds histogram",
+        *render_histogram("db_pool_acquire_wait_seconds", "", metrics.pool_acquire),
+        "# HELP db_query_duration_seconds Statement execution time by SQL fingerprint.",
+        "# TYPE db_query_duration_seconds histogram",
+    ]
+    for key, stats in metrics.statements.items():
+        lines.extend(render_histogram("db_query_duration_seconds", f'fingerprint="{_label(key)}"', stats.execute))
+    lines += [
+        "# HELP db_query_acquire_wait_seconds Pool wait attributed to the first statement on a connection.",
+        "# TYPE db_query_acquire_wait_seconds histogram",
+    ]
+    for key, stats in metrics.statements.items():
+        if stats.acquire.count:
+            lines.extend(render_histogram("db_query_acquire_wait_seconds", f'fingerprint="{_label(key)}"', stats.acquire))
+    lines += ["# HELP db_query_rows_total Rows returned or affected.", "# TYPE db_query_rows_total counter"]
+    lines += [f'db_query_rows_total{{fingerprint="{_label(k)}"}} {s.rows}' for k, s in metrics.statements.items()]
+    lines += ["# HELP db_query_errors_total Statements that raised.", "# TYPE db_query_errors_total counter"]
+    lines += [f'db_query_errors_total{{fingerprint="{_label(k)}"}} {s.errors}' for k, s in metrics.statements.items()]
+    return lines
+
+
+sql_metrics = SQLMetrics()
+
+
+RATE_WINDOW = 60
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RouteStats:
+    __slots__ = ("latency", "statuses", "recent")
+
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.statuses: Dict[int, int] = {}
+        # 最近 RATE_WINDOW 秒每秒的请求数，[秒, 计数]
+        self.recent: List[List[int]] = [[0, 0] for _ in range(RATE_WINDOW)]
+
+    def rate(self, now: float) -> float:
+        second = int(now)
+        total = sum(count for stamp, count in self.recent if second - stamp < RATE_WINDOW)
+        return total / RATE_WINDOW
+
+
+class RequestMetrics:
+    """按 (方法, 路由模板) 汇总请求延迟、状态码、最近速率，另记在途请求数和事件循环延迟。"""
+
+    def __init__(self) -> None:
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loop_lag = LatencyHistogram()
+        self.last_loop_lag = 0.0
+
+    def start(self) -> None:
+        self.in_flight += 1
+        if self.in_flight > self.max_in_flight:
+            self.max_in_flight = self.in_flight
+
+    def finish(self, method: str, route: str, status: int, seconds: float, now: float) -> None:
+        self.in_flight -= 1
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = RouteStats()
+        stats.latency.record(seconds)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        second = int(now)
+        slot = stats.recent[second % RATE_WINDOW]
+        if slot[0] != second:
+            slot[0], slot[1] = second, 0
+        slot[1] += 1
+
+    def record_loop_lag(self, seconds: float) -> None:
+        self.loop_lag.record(seconds)
+        self.last_loop_lag = seconds
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        routes = [
+            {
+                "method": method,
+                "route": route,
+                "latency": stats.latency.summary(),
+                "ratePerSecond": round(stats.rate(now), 3),
+                "statuses": {str(code): count for code, count in sorted(stats.statuses.items())},
+            }
+            for (method, route), stats in sorted(self.routes.items(), key=lambda item: item[0][1])
+        ]
+        return {
+            "inFlight": self.in_flight,
+            "maxInFlight": self.max_in_flight,
+            "loopLag": {**self.loop_lag.summary(), "lastMs": round(self.last_loop_lag * 1000, 3)},
+            "routes": routes,
+        }
+
+
+async def monitor_loop_lag(metrics: "RequestMetrics", interval: float = 0.5) -> None:
+    """定时 sleep，实际醒来比预期晚多少就是事件循环被阻塞的时间。"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        metrics.record_loop_lag(max(0.0, loop.time() - expected))
+
+
+def render_request_metrics(metrics: RequestMetrics) -> List[str]:
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route template.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), stats in metrics.routes.items():
+        labels = f'method="{method}",route="{_label(route)}"'
+        lines.extend(render_histogram("http_request_duration_seconds", labels, stats.latency))
+    lines += ["# HELP http_responses_total Responses by route and status code.", "# TYPE http_responses_total counter"]
+    for (method, route), stats in metrics.routes.items():
+        for status, count in stats.statuses.items():
+            lines.append(f'http_responses_total{{method="{method}",route="{_label(route)}",status="{status}"}} {count}')
+    lines += [
+        "# HELP http_requests_in_flight Requests currently being handled.",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {metrics.in_flight}",
+        "# HELP event_loop_lag_seconds How late the event loop woke up from a timed sleep.",
+        "# TYPE event_loop_lag_seconds histogram",
+        *render_histogram("event_loop_lag_seconds", "", metrics.loop_lag),
+    ]
+    return lines
+
+
+request_metrics = RequestMetrics()
+
+
+def render_pool_metrics(pools: List[Dict[str, Any]]) -> List[str]:
+    """pools 是 InstrumentedPool.stats() 的结果列表。"""
+    gauges = (
+        ("db_pool_size", "size", "Open connections in the pool."),
+        ("db_pool_free", "free", "Idle connections in the pool."),
+        ("db_pool_waiting", "waiting", "Coroutines waiting to acquire a connection."),
+        ("db_pool_healthy", "healthy", "1 when the last liveness probe could reach the server."),
+    )
+    lines: List[str] = []
+    for metric, field, help_text in gauges:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{pool="{stats["name"]}"}} {int(stats[field])}' for stats in pools]
+    counters = (
+        ("db_pool_acquire_timeouts_total", "acquireTimeouts", "Acquires that hit DB_ACQUIRE_TIMEOUT."),
+        ("db_pool_fallbacks_total", "fallbacks", "Acquires redirected to the fallback pool."),
+        ("db_pool_ping_failures_total", "pingFailures", "Liveness probe failures, including dropped stale connections."),
+    )
+    for metric, field, help_text in counters:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{pool="{stats["name"]}"}} {stats[field]}' for stats in pools]
+    return lines
@@ -0,0 +1,41 @@
+import time
+from typing import Any
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend_fastapi.metrics import UNMATCHED_ROUTE, RequestMetrics, request_metrics
+
+
+class RequestMetricsMiddleware:
+    """纯 ASGI 中间件：按路由模板（而不是实际路径）记录延迟和状态码，不包装响应体。"""
+
+    def __init__(self, app: ASGIApp, metrics: RequestMetrics = request_metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.start()
+        began = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.finish(
+                scope.get("method", ""), _route_template(scope), status, time.perf_counter() - began, time.time()
+            )
+
+
+def _route_template(scope: Scope) -> str:
+    # 路由匹配后 starlette 会把 route 写回 scope；没匹配上的统一归到一个标签，避免标签爆炸
+    route: Any = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
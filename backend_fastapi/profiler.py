@@ -0,0 +1,57 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Dict, Optional
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MAX_DEPTH = 128
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """按固定间隔抓目标线程（默认是事件循环线程）的调用栈，输出 collapsed stack 格式。
+
+    采样在独立线程里进行，不需要重启、也不往业务代码里插桩；结果可以直接喂给
+    flamegraph.pl 或 speedscope。同一时间只允许一个采样任务。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, thread_id: int, seconds: float, interval: float) -> Dict[str, int]:
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("profiler already running")
+        try:
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + min(seconds, PROFILE_MAX_SECONDS)
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+                del frame
+                time.sleep(interval)
+            return dict(stacks)
+        finally:
+            self._lock.release()
+
+
+def render_collapsed(stacks: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import aiomysql
+
+SCHEDULE_RULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_RULE_HORIZON_DAYS", "28"))
+SCHEDULE_RULE_REFRESH = float(os.getenv("SCHEDULE_RULE_REFRESH", "60"))
+
+logger = logging.getLogger(__name__)
+
+# (period, total_slots, valid_from, valid_until)
+Rule = Tuple[str, int, Optional[date], Optional[date]]
+
+RULE_SLOT_SQL = """
+    SELECT total_slots FROM (
+        SELECT 0 AS priority, total_slots FROM schedule_exceptions
+        WHERE doctor_id = %s AND exception_date = %s AND period = %s
+        UNION ALL
+        SELECT 1 AS priority, total_slots FROM schedule_rules
+        WHERE doctor_id = %s AND weekday = %s AND period = %s
+        AND (valid_from IS NULL OR valid_from <= %s) AND (valid_until IS NULL OR valid_until >= %s)
+    ) candidates ORDER BY priority LIMIT 1
+"""
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def schedule_sort_key(row: Dict[str, Any]) -> Tuple[str, str, str]:
+    """与排班查询的 ORDER BY schedule_date, doctor_id, period 一致。"""
+    schedule_date = row["schedule_date"]
+    if isinstance(schedule_date, (date, datetime)):
+        schedule_date = schedule_date.isoformat()[:10]
+    return (str(schedule_date), str(row["doctor_id"]), str(row["period"]))
+
+
+def virtual_schedule(doctor_id: str, day: date, period: str, total: int) -> Dict[str, Any]:
+    """规则展开出的排班，字段与 doctor_schedules 行一致；id 为空表示还没有落库。"""
+    return {
+        "id": None,
+        "doctor_id": doctor_id,
+        "schedule_date": day,
+        "period": period,
+        "total_slots": total,
+        "remaining_slots": total,
+        "created_at": None,
+        "updated_at": None,
+    }
+
+
+class ScheduleRuleIndex:
+    """医生按星期的排班规则（schedule_rules）和按日期的例外（schedule_exceptions），读时在内存里展开。
+
+    只展开今天起 horizon_days 天（放号周期）内的日期；同一时段已有 doctor_schedules 行时以具体行为准，
+    例外优先于规则，例外的号源为 0 表示停诊。具体行只在第一次预约时才由 rule_slot_total 查出号源后插入。
+    写规则的接口会立即重建本进程的索引，其他进程靠定期重建。
+    """
+
+    def __init__(self, horizon_days: int = SCHEDULE_RULE_HORIZON_DAYS) -> None:
+        self.horizon_days = max(1, horizon_days)
+        self.ready = False
+        self._rules: Dict[str, Dict[int, List[Rule]]] = {}
+        self._exceptions: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._doctor_ids: List[str] = []
+        self._refresh_now = asyncio.Event()
+
+    @property
+    def doctor_ids(self) -> List[str]:
+        """有规则或例外的医生。"""
+        return self._doctor_ids
+
+    def window(self) -> Tuple[date, date]:
+        """返回 [起, 止] 两端都包含的展开范围。"""
+        today = date.today()
+        return today, today + timedelta(days=self.horizon_days - 1)
+
+    def request_refresh(self) -> None:
+        self._refresh_now.set()
+
+    def slots_for(self, doctor_id: str, day: date) -> List[Tuple[str, int]]:
+        slots: Dict[str, int] = {}
+        for period, total, valid_from, valid_until in self._rules.get(doctor_id, {}).get(day.isoweekday(), ()):
+            if (valid_from is None or valid_from <= day) and (valid_until is None or day <= valid_until):
+                slots[period] = total
+        slots.update(self._exceptions.get((doctor_id, day.isoformat()), {}))
+        return sorted((period, total) for period, total in slots.items() if total > 0)
+
+    def expand(self, start: Any, end: Any = None, doctor_ids: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+        """按 (日期, 医生, 时段) 顺序生成虚拟排班；end 为空时展开到放号周期末尾。"""
+        first, last = self.window()
+        start, end = _as_date(start) or first, _as_date(end) or last
+        ids = self._doctor_ids if doctor_ids is None else sorted(set(doctor_ids) & set(self._doctor_ids))
+        day = max(start, first)
+        while day <= min(end, last):
+            for doctor_id in ids:
+                for period, total in self.slots_for(doctor_id, day):
+                    yield virtual_schedule(doctor_id, day, period, total)
+            day += timedelta(days=1)
+
+    async def rebuild(self, pool: aiomysql.Pool) -> None:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT doctor_id, weekday, period, total_slots, valid_from, valid_until FROM schedule_rules")
+                rule_rows = await cur.fetchall()
+                await cur.execute(
+                    "SELECT doctor_id, exception_date, period, total_slots FROM schedule_exceptions WHERE exception_date >= CURDATE()"
+                )
+                exception_rows = await cur.fetchall()
+        rules: Dict[str, Dict[int, List[Rule]]] = {}
+        for row in rule_rows:
+            rules.setdefault(row["doctor_id"], {}).setdefault(int(row["weekday"]), []).append(
+                (row["period"], int(row["total_slots"]), _as_date(row["valid_from"]), _as_date(row["valid_until"]))
+            )
+        exceptions: Dict[Tuple[str, str], Dict[str, int]] = {}
+        for row in exception_rows:
+            key = (row["doctor_id"], _as_date(row["exception_date"]).isoformat())
+            exceptions.setdefault(key, {})[row["period"]] = int(row["total_slots"])
+        self._rules = rules
+        self._exceptions = exceptions
+        self._doctor_ids = sorted(set(rules) | {doctor_id for doctor_id, _ in exceptions})
+        self.ready = True
+
+    async def refresh_forever(self, pool: aiomysql.Pool, interval: float = SCHEDULE_RULE_REFRESH) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._refresh_now.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh_now.clear()
+            try:
+                await self.rebuild(pool)
+            except Exception as e:
+                logger.warning(f"Rebuild schedule rule index failed: {e}")
+
+
+schedule_rules = ScheduleRuleIndex()
+
+
+def merge_schedules(rows: Iterable[Dict[str, Any]], virtual: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """把已按 schedule_sort_key 排序的具体行和虚拟行归并，同一时段只保留具体行。"""
+    virtual = iter(virtual)
+    pending = next(virtual, None)
+    for row in rows:
+        key = schedule_sort_key(row)
+        while pending is not None and schedule_sort_key(pending) < key:
+            yield pending
+            pending = next(virtual, None)
+        if pending is not None and schedule_sort_key(pending) == key:
+            pending = next(virtual, None)
+        yield row
+    if pending is not None:
+        yield pending
+        yield from virtual
+
+
+async def merge_schedule_stream(
+    chunks: AsyncIterator[List[Dict[str, Any]]], virtual: Iterable[Dict[str, Any]]
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """merge_schedules 的分块版本，给服务端游标的流式输出用。"""
+    virtual = iter(virtual)
+    pending = next(virtual, None)
+    async for rows in chunks:
+        merged: List[Dict[str, Any]] = []
+        for row in rows:
+            key = schedule_sort_key(row)
+            while pending is not None and schedule_sort_key(pending) < key:
+                merged.append(pending)
+                pending = next(virtual, None)
+            if pending is not None and schedule_sort_key(pending) == key:
+                pending = next(virtual, None)
+            merged.append(row)
+        yield merged
+    if pending is not None:
+        yield [pending, *virtual]
+
+
+async def rule_slot_total(cur: Any, doctor_id: str, schedule_date: Any, period: str, horizon_days: Optional[int] = None) -> int:
+    """预约命中还没有具体行的时段时，查规则/例外得到这个时段的号源数；不在放号周期内返回 0。
+
+    直接查库而不用内存索引，避免其他进程刚删掉的规则还被用来放号。
+    """
+    day = _as_date(schedule_date)
+    if day is None:
+        return 0
+    today = date.today()
+    if not today <= day < today + timedelta(days=horizon_days or schedule_rules.horizon_days):
+        return 0
+    await cur.execute(RULE_SLOT_SQL, [doctor_id, day, period, doctor_id, day.isoweekday(), period, day, day])
+    row = await cur.fetchone()
+    return int(row["total_slots"]) if row else 0
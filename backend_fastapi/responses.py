@@ -0,0 +1,34 @@
+from email.utils import formatdate
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse, Response
+
+from backend_fastapi.utils import etag_matches, fast_json
+
+
+class FastJSONResponse(JSONResponse):
+    """用 orjson 渲染的 JSON 响应。
+
+    作为 app 的默认响应类时只替换最后一步的 json.dumps；路由直接 return FastJSONResponse(...)
+    才能跳过 FastAPI 的 jsonable_encoder 逐字段遍历，列表接口都这样返回。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return fast_json(content)
+
+
+def conditional_json(
+    body: bytes, etag: str, if_none_match: Optional[str], cache_control: str, last_modified: Optional[float] = None
+) -> Response:
+    """带 ETag / Last-Modified / Cache-Control 的 JSON 响应，If-None-Match 命中时返回空的 304。
+
+    只按 ETag 判断是否 304，不处理 If-Modified-Since：HTTP 日期只精确到秒，同一秒内的两次修改
+    （比如连着两次预约）分不出来，换了 worker 还可能拿到旧数据的 304。带着 Last-Modified 的客户端
+    也会带 If-None-Match，照协议 If-Modified-Since 本来就要忽略。
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,15 +1,55 @@
-from typing import Any, Dict, List, Optional
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import pymysql
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
-from backend_fastapi.db import get_pool
-from backend_fastapi.utils import fetch_all, fetch_one
+from backend_fastapi.archival import APPOINTMENT_ARCHIVE, APPOINTMENT_COLUMNS, ARCHIVE_TABLE, appointment_archiver
+from backend_fastapi.availability import availability_index
+from backend_fastapi.booking import booking_dedupe, slot_admission, slot_key
+from backend_fastapi.db import get_pool, get_read_pool
+from backend_fastapi.idempotency import idempotency_store
+from backend_fastapi.recurrence import rule_slot_total
+from backend_fastapi.responses import FastJSONResponse
+from backend_fastapi.slot_events import slot_broadcaster
+from backend_fastapi.utils import csv_chunks, decode_cursor, encode_cursor, fetch_all, ndjson_chunks, ndjson_stream, stream_rows
 
 router = APIRouter(prefix="/api", tags=["appointments"])
 
+DEFAULT_PAGE_SIZE = 50
+
+# 条件扣减代替 SELECT ... FOR UPDATE：行锁只在 UPDATE 到 COMMIT 之间持有；扣减后的余数通过 LAST_INSERT_ID 带回
+TAKE_SLOT_SQL = """
+    UPDATE doctor_schedules
+    SET remaining_slots = LAST_INSERT_ID(remaining_slots - 1)
+    WHERE doctor_id = %s AND schedule_date = %s AND period = %s AND remaining_slots > 0
+"""
+MAX_PAGE_SIZE = 500
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
 
 @router.post("/appointments")
-async def create_appointment(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+async def create_appointment(
+    body: Dict[str, Any],
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
+    pool=Depends(get_pool),
+) -> Dict[str, Any]:
+    """带 Idempotency-Key 时重复提交拿到第一次的结果，不会再扣一次号源。"""
+    return await _idempotent("appointments.create", idempotency_key, body, response, lambda: book_appointment(body, pool))
+
+
+async def _idempotent(scope: str, key: Optional[str], body: Dict[str, Any], response: Response, func) -> Any:
+    if not key:
+        return await func()
+    result, replayed = await idempotency_store.run((scope, key), body, func)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+async def book_appointment(body: Dict[str, Any], pool) -> Dict[str, Any]:
     doctor_id = body.get("doctorId")
     schedule_date = body.get("scheduleDate")
     period = body.get("period")
@@ -18,107 +58,292 @@ async def create_appointment(body: Dict[str, Any], pool=Depends(get_pool)) -> Di
     if not doctor_id or not schedule_date or not period or not patient_name or not patient_phone:
         raise HTTPException(status_code=400, detail="Missing required fields")
 
-    async with pool.acquire() as conn:
-        conn.autocommit(False)
-        try:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    """
-                    SELECT * FROM doctor_schedules
-                    WHERE doctor_id = %s AND schedule_date = %s AND period = %s
-                    FOR UPDATE
-                    """,
-                    [doctor_id, schedule_date, period],
-                )
-                schedule = await cur.fetchone()
-                if not schedule:
+    key = slot_key(doctor_id, schedule_date, period)
+    # created_at 显式写入（取自数据库时间），返回值直接用写入的数据拼出来，不再回查一次
+    appointment = {
+        "doctor_id": doctor_id,
+        "doctor_name": body.get("doctorName"),
+        "hospital_name": body.get("hospitalName"),
+        "department_name": body.get("departmentName"),
+        "schedule_date": schedule_date,
+        "period": period,
+        "patient_name": patient_name,
+        "patient_gender": body.get("patientGender"),
+        "patient_age": body.get("patientAge"),
+        "patient_phone": patient_phone,
+        "symptoms": body.get("symptoms"),
+        "registration_fee": body.get("registrationFee"),
+        "status": "pending",
+    }
+    with booking_dedupe.hold(patient_phone, key):
+        async with slot_admission.admit(key):
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    # 事务外先查同一手机号在该时段是否已有有效预约，避免重复占号；
+                    # 多进程下两个请求可能同时通过这一步，最终由 uniq_active_booking 唯一键拦住。
+                    # 顺带取数据库时间作为 created_at，时区和时钟都与列默认值一致，不多一次往返
+                    await cur.execute(
+                        """
+                        SELECT NOW() AS now, (
+                            SELECT id FROM appointments
+                            WHERE patient_phone = %s AND doctor_id = %s AND schedule_date = %s AND period = %s
+                            AND status != 'cancelled' LIMIT 1
+                        ) AS duplicate_id
+                        """,
+                        [patient_phone, doctor_id, schedule_date, period],
+                    )
+                    check = await cur.fetchone()
+                    if check["duplicate_id"] is not None:
+                        raise HTTPException(status_code=409, detail="您已预约该时段，请勿重复预约")
+                await conn.begin()
+                try:
+                    async with conn.cursor() as cur:
+                        await cur.execute(TAKE_SLOT_SQL, [doctor_id, schedule_date, period])
+                        if cur.rowcount == 0:
+                            await cur.execute(
+                                "SELECT remaining_slots FROM doctor_schedules WHERE doctor_id = %s AND schedule_date = %s AND period = %s",
+                                [doctor_id, schedule_date, period],
+                            )
+                            exists = await cur.fetchone()
+                            total = 0 if exists else await rule_slot_total(cur, doctor_id, schedule_date, period)
+                            taken = False
+                            if total > 0:
+                                # 规则展开的时段第一次被预约：先落一行具体排班再扣减；
+                                # 并发的首个预约靠唯一键只会插入一行，其余的在 INSERT IGNORE 上等这一行提交
+                                await cur.execute(
+                                    """
+                                    INSERT IGNORE INTO doctor_schedules (doctor_id, schedule_date, period, total_slots, remaining_slots)
+                                    VALUES (%s, %s, %s, %s, %s)
+                                    """,
+                                    [doctor_id, schedule_date, period, total, total],
+                                )
+                                await cur.execute(TAKE_SLOT_SQL, [doctor_id, schedule_date, period])
+                                taken = cur.rowcount > 0
+                            if not taken:
+                                detail = "该时段号源已满" if exists or total > 0 else "该时段暂无号源"
+                                slot_admission.mark_closed(key, detail)
+                                raise HTTPException(status_code=400, detail=detail)
+                        remaining = cur.lastrowid
+                        appointment["created_at"] = appointment["updated_at"] = check["now"]
+                        try:
+                            await cur.execute(
+                                """
+                                INSERT INTO appointments
+                                (doctor_id, doctor_name, hospital_name, department_name, schedule_date, period,
+                                patient_name, patient_gender, patient_age, patient_phone, symptoms, registration_fee,
+                                status, created_at, updated_at)
+                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                                """,
+                                list(appointment.values()),
+                            )
+                        except pymysql.err.IntegrityError as e:
+                            # 回滚后扣掉的号源也一并恢复
+                            if e.args and e.args[0] == pymysql.constants.ER.DUP_ENTRY:
+                                raise HTTPException(status_code=409, detail="您已预约该时段，请勿重复预约")
+                            raise
+                        appointment = {"id": cur.lastrowid, **appointment}
+                    await conn.commit()
+                except BaseException:
                     await conn.rollback()
-                    conn.autocommit(True)
-                    raise HTTPException(status_code=400, detail="该时段暂无号源")
-                if schedule["remaining_slots"] <= 0:
-                    await conn.rollback()
-                    conn.autocommit(True)
-                    raise HTTPException(status_code=400, detail="该时段号源已满")
+                    raise
+    if remaining == 0:
+        slot_admission.mark_closed(key, "该时段号源已满")
+    availability_index.set_slot(doctor_id, schedule_date, period, remaining)
+    return {"success": True, "message": "预约成功", "appointment": appointment}
 
-                await cur.execute(
-                    "UPDATE doctor_schedules SET remaining_slots = remaining_slots - 1 WHERE id = %s",
-                    [schedule["id"]],
-                )
-                await cur.execute(
-                    """
-                    INSERT INTO appointments
-                    (doctor_id, doctor_name, hospital_name, department_name, schedule_date, period,
-                    patient_name, patient_gender, patient_age, patient_phone, symptoms, registration_fee, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending')
-                    """,
-                    [
-                        doctor_id,
-                        body.get("doctorName"),
-                        body.get("hospitalName"),
-                        body.get("departmentName"),
-                        schedule_date,
-                        period,
-                        patient_name,
-                        body.get("patientGender"),
-                        body.get("patientAge"),
-                        patient_phone,
-                        body.get("symptoms"),
-                        body.get("registrationFee"),
-                    ],
-                )
-                new_id = cur.lastrowid
-                await conn.commit()
-        except Exception:
-            await conn.rollback()
-            conn.autocommit(True)
-            raise
-        conn.autocommit(True)
 
-    appointment = await fetch_one("SELECT * FROM appointments WHERE id = %s", [new_id], pool)
-    return {"success": True, "message": "预约成功", "appointment": appointment}
+@router.get("/admin/booking/stats")
+async def admin_booking_stats() -> Dict[str, Any]:
+    return {
+        "admission": slot_admission.stats(),
+        "duplicateRejected": booking_dedupe.rejected,
+        "idempotency": idempotency_store.snapshot(),
+        "slotStream": slot_broadcaster.stats(),
+        "archive": {"enabled": APPOINTMENT_ARCHIVE, "running": appointment_archiver.running, **appointment_archiver.stats},
+    }
 
 
-@router.get("/appointments")
-async def list_appointments(
-    phone: Optional[str] = Query(default=None),
-    doctorId: Optional[str] = Query(default=None),
-    status: Optional[str] = Query(default=None),
-    pool=Depends(get_pool),
-) -> List[Dict[str, Any]]:
-    sql = "SELECT * FROM appointments WHERE 1=1"
+@router.post("/admin/appointments/archive")
+async def admin_archive_appointments(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+    """手动触发一轮归档，maxRows 限制本轮最多搬多少行（按批取整）。"""
+    max_rows = body.get("maxRows")
+    if max_rows is not None and (not isinstance(max_rows, int) or max_rows <= 0):
+        raise HTTPException(status_code=400, detail="Invalid maxRows")
+    if appointment_archiver.running:
+        raise HTTPException(status_code=409, detail="Archive is already running")
+    archived = await appointment_archiver.run_once(pool, max_rows=max_rows)
+    return {"success": True, "archived": archived}
+
+
+def build_appointments_query(
+    phone: Optional[str], doctor_id: Optional[str], status: Optional[str], table: str = "appointments"
+) -> Tuple[str, List[Any]]:
+    # 只列出对外的列：热表的 active_booking 是唯一约束用的虚拟列，归档表多一列 archived_at
+    sql = f"SELECT {APPOINTMENT_COLUMNS} FROM {table} WHERE 1=1"
     params: List[Any] = []
     if phone:
         sql += " AND patient_phone = %s"
         params.append(phone)
-    if doctorId:
+    if doctor_id:
         sql += " AND doctor_id = %s"
-        params.append(doctorId)
+        params.append(doctor_id)
     if status:
         sql += " AND status = %s"
         params.append(status)
-    sql += " ORDER BY created_at DESC"
-    return await fetch_all(sql, params, pool)
+    return sql, params
+
+
+def build_listing_query(
+    phone: Optional[str], doctor_id: Optional[str], status: Optional[str], include_archived: bool, after: Optional[List[Any]], limit: Optional[int]
+) -> Tuple[str, List[Any]]:
+    """按 (created_at, id) 倒序的列表查询。include_archived 时热表和归档表各查一段再 UNION ALL：
+    每段都能走自己的 (筛选列, created_at) 索引并各自 LIMIT，外层只需要排序 2 * limit 行。
+    """
+    tables = ["appointments", ARCHIVE_TABLE] if include_archived else ["appointments"]
+    parts: List[str] = []
+    params: List[Any] = []
+    for table in tables:
+        sql, table_params = build_appointments_query(phone, doctor_id, status, table)
+        if after:
+            sql += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+            table_params.extend([after[0], after[0], after[1]])
+        sql += " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT %s"
+            table_params.append(limit)
+        parts.append(sql)
+        params.extend(table_params)
+    if len(parts) == 1:
+        return parts[0], params
+    sql = " UNION ALL ".join(f"({part})" for part in parts) + " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+
+@router.get("/appointments", response_class=FastJSONResponse)
+async def list_appointments(
+    phone: Optional[str] = Query(default=None),
+    doctorId: Optional[str] = Query(default=None),
+    status: Optional[str] = Query(default=None),
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None),
+    format: Optional[str] = Query(default=None),
+    includeArchived: bool = Query(default=False),
+    pool=Depends(get_read_pool),
+) -> Any:
+    """不带 limit/cursor 时保持原来的整表数组返回；带上后按 (created_at, id) 做 keyset 分页。
+
+    format=ndjson 时用服务端游标逐行流式输出。默认只查热表，includeArchived=true 时连同已归档的预约一起查；
+    没有开启归档（APPOINTMENT_ARCHIVE）时可能还没有归档表，归档部分按空处理。
+    """
+    includeArchived = includeArchived and APPOINTMENT_ARCHIVE
+    if format == "ndjson" or (limit is None and cursor is None):
+        sql, params = build_listing_query(phone, doctorId, status, includeArchived, None, None)
+        if format == "ndjson":
+            return StreamingResponse(ndjson_stream(sql, params, pool), media_type="application/x-ndjson")
+        return FastJSONResponse(await fetch_all(sql, params, pool))
+
+    page_size = limit or DEFAULT_PAGE_SIZE
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, 2)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    sql, params = build_listing_query(phone, doctorId, status, includeArchived, after, page_size + 1)
+    rows = await fetch_all(sql, params, pool)
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([rows[-1]["created_at"], rows[-1]["id"]])
+    return FastJSONResponse({"items": rows, "nextCursor": next_cursor})
+
+
+def build_export_query(
+    table: str, start_date: Optional[str], end_date: Optional[str], doctor_id: Optional[str], status: Optional[str]
+) -> Tuple[str, List[Any]]:
+    """按就诊日期导出。ORDER BY 与 idx_date (schedule_date, 隐含 id) 一致，流式游标不用等排序就能出第一行。"""
+    sql, params = build_appointments_query(None, doctor_id, status, table)
+    if start_date:
+        sql += " AND schedule_date >= %s"
+        params.append(start_date)
+    if end_date:
+        sql += " AND schedule_date <= %s"
+        params.append(end_date)
+    return sql + " ORDER BY schedule_date, id", params
+
+
+@router.get("/admin/appointments/export")
+async def export_appointments(
+    format: str = Query(default="csv"),
+    startDate: Optional[str] = Query(default=None),
+    endDate: Optional[str] = Query(default=None),
+    doctorId: Optional[str] = Query(default=None),
+    status: Optional[str] = Query(default=None),
+    includeArchived: bool = Query(default=False),
+    pool=Depends(get_read_pool),
+) -> StreamingResponse:
+    """对账用的全量导出（CSV 或 NDJSON），按就诊日期范围、医生、状态筛选。
+
+    用服务端游标分块读、分块写，内存占用与导出行数无关，第一块读到就开始发送。
+    includeArchived 时先导热表再导归档表，两段各自按日期有序；没有开启归档时只导热表。
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    try:
+        for value in (startDate, endDate):
+            if value:
+                date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid startDate or endDate")
+    tables = ["appointments", ARCHIVE_TABLE] if includeArchived and APPOINTMENT_ARCHIVE else ["appointments"]
+
+    async def chunks() -> AsyncIterator[List[Dict[str, Any]]]:
+        for table in tables:
+            sql, params = build_export_query(table, startDate, endDate, doctorId, status)
+            async for rows in stream_rows(sql, params, pool):
+                yield rows
+
+    if format == "csv":
+        body = csv_chunks(chunks(), [column.strip() for column in APPOINTMENT_COLUMNS.split(",")])
+    else:
+        body = ndjson_chunks(chunks())
+    filename = f"appointments-{datetime.now():%Y%m%d%H%M%S}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"}
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[format], headers=headers)
 
 
 # 取消预约：传入 appointmentId
 @router.post("/appointments/cancel")
-async def cancel_appointment(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+async def cancel_appointment(
+    body: Dict[str, Any],
+    response: Response,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
+    pool=Depends(get_pool),
+) -> Dict[str, Any]:
+    return await _idempotent("appointments.cancel", idempotency_key, body, response, lambda: cancel_booking(body, pool))
+
+
+async def cancel_booking(body: Dict[str, Any], pool) -> Dict[str, Any]:
     appointment_id = body.get("appointmentId")
     if not appointment_id:
         raise HTTPException(status_code=400, detail="appointmentId is required")
     async with pool.acquire() as conn:
-        conn.autocommit(False)
+        await conn.begin()
         try:
             async with conn.cursor() as cur:
                 await cur.execute("SELECT * FROM appointments WHERE id = %s FOR UPDATE", [appointment_id])
                 appointment = await cur.fetchone()
                 if not appointment:
-                    await conn.rollback()
-                    conn.autocommit(True)
+                    if APPOINTMENT_ARCHIVE:
+                        # 归档的都是已完成或已取消的预约，给出和热表里一样的拒绝
+                        await cur.execute(f"SELECT id FROM {ARCHIVE_TABLE} WHERE id = %s", [appointment_id])
+                        if await cur.fetchone():
+                            raise HTTPException(status_code=400, detail="Appointment already archived")
                     raise HTTPException(status_code=404, detail="Appointment not found")
                 if appointment.get("status") == "cancelled":
-                    await conn.rollback()
-                    conn.autocommit(True)
                     raise HTTPException(status_code=400, detail="Appointment already cancelled")
                 await cur.execute(
                     'UPDATE appointments SET status = "cancelled" WHERE id = %s',
@@ -127,15 +352,17 @@ async def cancel_appointment(body: Dict[str, Any], pool=Depends(get_pool)) -> Di
                 await cur.execute(
                     """
                     UPDATE doctor_schedules
-                    SET remaining_slots = remaining_slots + 1
+                    SET remaining_slots = LAST_INSERT_ID(remaining_slots + 1)
                     WHERE doctor_id = %s AND schedule_date = %s AND period = %s
                     """,
                     [appointment["doctor_id"], appointment["schedule_date"], appointment["period"]],
                 )
-                await conn.commit()
-        except Exception:
+                remaining = cur.lastrowid if cur.rowcount else None
+            await conn.commit()
+        except BaseException:
             await conn.rollback()
-            conn.autocommit(True)
             raise
-        conn.autocommit(True)
+    slot_admission.mark_open(slot_key(appointment["doctor_id"], appointment["schedule_date"], appointment["period"]))
+    if remaining is not None:
+        availability_index.set_slot(appointment["doctor_id"], appointment["schedule_date"], appointment["period"], remaining)
     return {"success": True, "message": "Appointment cancelled successfully"}
@@ -1,90 +1,201 @@
+import base64
 from datetime import date, datetime
+import functools
+import logging
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import RedirectResponse
 
+from backend_fastapi.availability import availability_index
+from backend_fastapi.cache import avatar_cache, doctor_cache, invalidate_doctor_cache, render_cache
 from backend_fastapi.db import get_pool
+from backend_fastapi.doctor_import import IMPORT_FORMATS, DoctorImport, iter_records
+from backend_fastapi.responses import FastJSONResponse, conditional_json
+from backend_fastapi.search import doctor_search_index
 from backend_fastapi.utils import (
-    DEFAULT_AVATAR_BASE64,
+    content_etag,
+    default_avatar_base64,
+    default_avatar_bytes,
+    delete_avatar_from_cos_async,
+    etag_matches,
     fetch_all,
     fetch_one,
     map_doctor_row,
     map_doctor_summary_row,
-    process_avatar_payload,
-    upload_avatar_to_cos,
+    process_avatar_payload_async,
+    sniff_image_type,
+    upload_avatar_to_cos_async,
 )
 
 router = APIRouter(prefix="/api", tags=["doctors"])
 
+logger = logging.getLogger(__name__)
 
-@router.get("/doctors")
-async def get_doctors(
-    keyword: Optional[str] = Query(default=None),
-    pool=Depends(get_pool),
-) -> List[Dict[str, Any]]:
-    sql = "SELECT doctor_id, name, title, expertise, intro, hospital_id, hospital_name, department_name, registration_fee, avatar_url FROM doctors"
-    params: List[Any] = []
-    if keyword:
-        sql += " WHERE name LIKE %s OR expertise LIKE %s"
-        like_kw = f"%{keyword}%"
-        params.extend([like_kw, like_kw])
-    rows = await fetch_all(sql, params, pool)
-    return [map_doctor_row(row) for row in rows]
 
+# 医生和头像缓存是进程内共享的，管理端也从这里读；缓存未命中时只从主库加载，
+# 否则失效后的第一次公开读可能从延迟的从库把旧数据放回缓存，一直留到过期
+DOCTOR_COLUMNS = "doctor_id, name, title, expertise, intro, hospital_id, hospital_name, department_name, registration_fee, avatar_url"
 
-@router.get("/admin/doctors")
-async def admin_list_doctors(keyword: Optional[str] = Query(default=None), pool=Depends(get_pool)) -> List[Dict[str, Any]]:
-    sql = "SELECT doctor_id, name, title, expertise, intro, hospital_id, hospital_name, department_name, registration_fee, avatar_url FROM doctors"
+
+async def load_doctor_list(keyword: Optional[str], pool) -> List[Dict[str, Any]]:
+    cache_key = ("list", keyword or "")
+    doctors = doctor_cache.get(cache_key)
+    if doctors is not None:
+        return doctors
+    generation = doctor_cache.generation
+    sql = f"SELECT {DOCTOR_COLUMNS} FROM doctors"
     params: List[Any] = []
     if keyword:
         sql += " WHERE name LIKE %s OR expertise LIKE %s"
         like_kw = f"%{keyword}%"
         params.extend([like_kw, like_kw])
     rows = await fetch_all(sql, params, pool)
-    return [map_doctor_row(row) for row in rows]
+    doctors = [map_doctor_row(row) for row in rows]
+    doctor_cache.set(cache_key, doctors, generation)
+    return doctors
 
 
-@router.get("/doctors/{doctor_id}")
-async def get_doctor_detail(doctor_id: str, pool=Depends(get_pool)) -> Dict[str, Any]:
-    row = await fetch_one("SELECT * FROM doctors WHERE doctor_id = %s", [doctor_id], pool)
+async def load_doctor_map(pool) -> Dict[str, Dict[str, Any]]:
+    doctor_map = doctor_cache.get(("map",))
+    if doctor_map is None:
+        generation = doctor_cache.generation
+        doctor_map = {doctor["id"]: doctor for doctor in await load_doctor_list(None, pool)}
+        doctor_cache.set(("map",), doctor_map, generation)
+    return doctor_map
+
+
+async def search_doctors(keyword: Optional[str], pool) -> List[Dict[str, Any]]:
+    """有关键词且索引可用时走内存倒排索引（按相关度排序），否则退回 LIKE 查询。"""
+    if not keyword or not doctor_search_index.ready:
+        return await load_doctor_list(keyword, pool)
+    doctor_map = await load_doctor_map(pool)
+    return [doctor_map[doctor_id] for doctor_id in doctor_search_index.search(keyword) if doctor_id in doctor_map]
+
+
+async def load_doctor(doctor_id: str, pool) -> Optional[Dict[str, Any]]:
+    cache_key = ("doctor", doctor_id)
+    doctor = doctor_cache.get(cache_key)
+    if doctor is not None:
+        return doctor
+    generation = doctor_cache.generation
+    row = await fetch_one(f"SELECT {DOCTOR_COLUMNS} FROM doctors WHERE doctor_id = %s", [doctor_id], pool)
     if not row:
-        raise HTTPException(status_code=404, detail="Doctor not found")
-    return map_doctor_row(row)
+        return None
+    doctor = map_doctor_row(row)
+    doctor_cache.set(cache_key, doctor, generation)
+    return doctor
 
 
-@router.get("/doctors/{doctor_id}/avatar")
-async def get_doctor_avatar(doctor_id: str, pool=Depends(get_pool)):
-    row = await fetch_one("SELECT avatar_url FROM doctors WHERE doctor_id = %s", [doctor_id], pool)
-    base = ""
-    if row:
-        value = row.get("avatar_url")
-        if isinstance(value, str) and value.startswith("http"):
-            from fastapi.responses import RedirectResponse
+def _availability_sort_key(doctor: Dict[str, Any]) -> Tuple[Any, ...]:
+    next_date = doctor["nextAvailableDate"]
+    return (next_date is None, next_date or "", -doctor["openSlots"])
 
-            return RedirectResponse(value)
-        if isinstance(value, (bytes, bytearray)):
-            import base64 as b64
 
-            base = b64.b64encode(value).decode()
-        elif isinstance(value, str):
-            base = value.strip()
-    if not base:
-        base = DEFAULT_AVATAR_BASE64
-    if not base:
-        raise HTTPException(status_code=404, detail="Avatar not found")
-    import base64
-    from fastapi import Response
+# 列表里带余号，允许代理和客户端短时间复用；详情变化少；两者过期后都用 ETag 重新验证
+DOCTOR_LIST_CACHE_CONTROL = "public, max-age=15"
+DOCTOR_DETAIL_CACHE_CONTROL = "public, max-age=60"
 
-    try:
-        content = base64.b64decode(base)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Invalid avatar data")
-    return Response(
-        content=content,
-        media_type="image/png",
-        headers={"Cache-Control": "public, max-age=31536000"},
+
+@router.get("/doctors", response_class=FastJSONResponse)
+async def get_doctors(
+    keyword: Optional[str] = Query(default=None),
+    sort: Optional[str] = Query(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+    pool=Depends(get_pool),
+) -> Response:
+    """医生列表附带最近可约时段和近 N 天余号；sort=availability 时有号的医生排在前面。
+
+    医生数据（缓存里的同一份对象）、余号索引、搜索索引和日期都没变时复用上次序列化的结果。
+    """
+
+    async def build() -> List[Dict[str, Any]]:
+        doctors = [{**doctor, **availability_index.summary(doctor["id"])} for doctor in await search_doctors(keyword, pool)]
+        if sort == "availability":
+            doctors.sort(key=_availability_sort_key)
+        return doctors
+
+    source = await load_doctor_map(pool)
+    version = (availability_index.version, doctor_search_index.version, date.today().isoformat())
+    etag, body, modified = await render_cache.render(
+        ("doctors", keyword or "", sort == "availability"), source, version, build
     )
+    return conditional_json(body, etag, if_none_match, DOCTOR_LIST_CACHE_CONTROL, modified)
+
+
+@router.get("/admin/doctors", response_class=FastJSONResponse)
+async def admin_list_doctors(keyword: Optional[str] = Query(default=None), pool=Depends(get_pool)) -> FastJSONResponse:
+    return FastJSONResponse(await search_doctors(keyword, pool))
+
+
+@router.get("/admin/cache/stats")
+async def admin_cache_stats() -> Dict[str, Any]:
+    return {
+        "doctors": doctor_cache.stats(),
+        "avatars": avatar_cache.stats(),
+        "responses": render_cache.stats(),
+        "searchIndex": {"ready": doctor_search_index.ready, "size": len(doctor_search_index)},
+    }
+
+
+@router.get("/doctors/{doctor_id}")
+async def get_doctor_detail(
+    doctor_id: str, if_none_match: Optional[str] = Header(default=None), pool=Depends(get_pool)
+) -> Response:
+    doctor = await load_doctor(doctor_id, pool)
+    if not doctor:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    etag, body, modified = await render_cache.render(("doctor", doctor_id), doctor, None, lambda: doctor)
+    return conditional_json(body, etag, if_none_match, DOCTOR_DETAIL_CACHE_CONTROL, modified)
+
+
+AVATAR_CACHE_CONTROL = "public, max-age=3600"
+
+
+@functools.lru_cache(maxsize=None)
+def _default_avatar_entry() -> Tuple[Any, ...]:
+    """默认头像只算一次，所有没有头像的医生共用同一份字节和 ETag。"""
+    content = default_avatar_bytes()
+    return ("bytes", content, content_etag(content), sniff_image_type(content)) if content else ("missing",)
+
+
+def _decode_avatar(value: Any) -> Tuple[Any, ...]:
+    if isinstance(value, str) and value.startswith("http"):
+        return ("redirect", value)
+    content = b""
+    if isinstance(value, (bytes, bytearray)):
+        content = bytes(value)
+    elif isinstance(value, str) and value.strip():
+        try:
+            content = base64.b64decode(value.strip())
+        except Exception:
+            raise HTTPException(status_code=500, detail="Invalid avatar data")
+    if not content:
+        return _default_avatar_entry()
+    return ("bytes", content, content_etag(content), sniff_image_type(content))
+
+
+@router.get("/doctors/{doctor_id}/avatar")
+async def get_doctor_avatar(
+    doctor_id: str,
+    if_none_match: Optional[str] = Header(default=None),
+    pool=Depends(get_pool),
+):
+    entry = avatar_cache.get(doctor_id)
+    if entry is None:
+        row = await fetch_one("SELECT avatar_url FROM doctors WHERE doctor_id = %s", [doctor_id], pool)
+        entry = _decode_avatar((row or {}).get("avatar_url"))
+        avatar_cache.set(doctor_id, entry)
+    if entry[0] == "redirect":
+        return RedirectResponse(entry[1])
+    if entry[0] == "missing":
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    _, content, etag, media_type = entry
+    headers = {"ETag": etag, "Cache-Control": AVATAR_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
 
 
 @router.post("/admin/doctors")
@@ -94,10 +205,10 @@ async def create_doctor(payload: Dict[str, Any], pool=Depends(get_pool)) -> Dict
         raise HTTPException(status_code=400, detail="Doctor name is required")
     avatar_payload = None
     if payload.get("avatarImage"):
-        processed = process_avatar_payload(payload.get("avatarImage"))
+        processed = await process_avatar_payload_async(payload.get("avatarImage"))
         if processed:
             try:
-                avatar_payload = upload_avatar_to_cos(processed)
+                avatar_payload = await upload_avatar_to_cos_async(processed)
             except Exception as e:
                 # 如果 COS 未配置或上传失败，允许继续创建医生但头像为空
                 import logging
@@ -126,8 +237,44 @@ async def create_doctor(payload: Dict[str, Any], pool=Depends(get_pool)) -> Dict
                     fee,
                 ],
             )
-    row = await fetch_one("SELECT * FROM doctors WHERE doctor_id = %s", [doctor_id], pool)
-    return map_doctor_row(row)
+    invalidate_doctor_cache()
+    doctor_search_index.upsert(
+        doctor_id,
+        {
+            "name": name,
+            "expertise": payload.get("expertise", ""),
+            "intro": payload.get("intro", ""),
+            "hospital_name": payload.get("hospitalName", ""),
+            "department_name": payload.get("departmentName", ""),
+        },
+    )
+    # 刚写入的值都在手上，不再回查
+    return map_doctor_row(
+        {
+            "doctor_id": doctor_id,
+            "name": name,
+            "title": payload.get("title", ""),
+            "expertise": payload.get("expertise", ""),
+            "intro": payload.get("intro", ""),
+            "hospital_id": payload.get("hospitalId", ""),
+            "hospital_name": payload.get("hospitalName", ""),
+            "department_name": payload.get("departmentName", ""),
+            "registration_fee": fee,
+            "avatar_url": avatar_payload,
+        }
+    )
+
+
+@router.post("/admin/doctors/import")
+async def import_doctors(request: Request, format: Optional[str] = Query(default=None), pool=Depends(get_pool)) -> Dict[str, Any]:
+    """请求体直接是文件内容：CSV（首行表头）或 NDJSON，字段同 /admin/doctors。边读边写库，不整体读进内存。
+
+    format 不传时按 Content-Type 判断。坏行不影响其余行，逐行错误在返回的 errors 里。
+    """
+    fmt = format or ("ndjson" if "json" in request.headers.get("content-type", "") else "csv")
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    return await DoctorImport(pool).run(iter_records(request.stream(), fmt))
 
 
 @router.post("/admin/doctors/getInfo")
@@ -135,18 +282,10 @@ async def admin_get_doctor_info(body: Dict[str, Any], pool=Depends(get_pool)) ->
     doctor_id = body.get("doctorId")
     if not doctor_id:
         raise HTTPException(status_code=400, detail="doctorId is required")
-    row = await fetch_one(
-        """
-        SELECT doctor_id, name, title, expertise, intro,
-               hospital_id, hospital_name, department_name, registration_fee, avatar_url
-        FROM doctors WHERE doctor_id = %s
-        """,
-        [doctor_id],
-        pool,
-    )
-    if not row:
+    doctor = await load_doctor(doctor_id, pool)
+    if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
-    return map_doctor_row(row)
+    return doctor
 
 
 @router.post("/admin/doctors/modifyInfo")
@@ -154,12 +293,10 @@ async def admin_modify_doctor_info(body: Dict[str, Any], pool=Depends(get_pool))
     doctor_id = body.get("doctorId")
     if not doctor_id:
         raise HTTPException(status_code=400, detail="doctorId is required")
-    exists = await fetch_one("SELECT doctor_id FROM doctors WHERE doctor_id = %s", [doctor_id], pool)
-    if not exists:
-        raise HTTPException(status_code=404, detail="Doctor not found")
-
+    fee = body.get("registrationFee", 10.00)
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
+            # 连接带 FOUND_ROWS 标志，rowcount 是匹配行数，内容没变也不会误报 404
             await cur.execute(
                 """
                 UPDATE doctors SET name=%s, title=%s, expertise=%s, intro=%s,
@@ -174,20 +311,43 @@ async def admin_modify_doctor_info(body: Dict[str, Any], pool=Depends(get_pool))
                     body.get("hospitalId"),
                     body.get("hospitalName"),
                     body.get("departmentName"),
-                    body.get("registrationFee", 10.00),
+                    fee,
                     doctor_id,
                 ],
             )
-    row = await fetch_one(
-        """
-        SELECT doctor_id, name, title, expertise, intro,
-               hospital_id, hospital_name, department_name, registration_fee, avatar_url
-        FROM doctors WHERE doctor_id = %s
-        """,
-        [doctor_id],
-        pool,
+            if cur.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Doctor not found")
+            # UPDATE 之后再读缓存：之前完成的写入都已经清过缓存，读到的不会比这次写入旧
+            cached = doctor_cache.get(("doctor", doctor_id))
+            avatar_url = cached.get("avatarUrl") if cached else None
+            if cached is None:
+                await cur.execute("SELECT avatar_url FROM doctors WHERE doctor_id = %s", [doctor_id])
+                avatar_url = ((await cur.fetchone()) or {}).get("avatar_url")
+    invalidate_doctor_cache()
+    doctor_search_index.upsert(
+        doctor_id,
+        {
+            "name": body.get("name"),
+            "expertise": body.get("expertise"),
+            "intro": body.get("intro"),
+            "hospital_name": body.get("hospitalName"),
+            "department_name": body.get("departmentName"),
+        },
+    )
+    return map_doctor_row(
+        {
+            "doctor_id": doctor_id,
+            "name": body.get("name"),
+            "title": body.get("title"),
+            "expertise": body.get("expertise"),
+            "intro": body.get("intro"),
+            "hospital_id": body.get("hospitalId"),
+            "hospital_name": body.get("hospitalName"),
+            "department_name": body.get("departmentName"),
+            "registration_fee": fee,
+            "avatar_url": avatar_url,
+        }
     )
-    return map_doctor_row(row)
 
 
 @router.post("/admin/doctors/modifyImage")
@@ -196,32 +356,38 @@ async def admin_modify_doctor_image(body: Dict[str, Any], pool=Depends(get_pool)
     raw_avatar = body.get("avatarImage")
     if not doctor_id or not raw_avatar:
         raise HTTPException(status_code=400, detail="doctorId and avatarImage are required")
-    exists = await fetch_one("SELECT doctor_id FROM doctors WHERE doctor_id = %s", [doctor_id], pool)
-    if not exists:
-        raise HTTPException(status_code=404, detail="Doctor not found")
-
-    avatar_payload = process_avatar_payload(raw_avatar)
+    avatar_payload = await process_avatar_payload_async(raw_avatar)
     if not avatar_payload:
         raise HTTPException(status_code=400, detail="Invalid avatar image")
     try:
-        avatar_url = upload_avatar_to_cos(avatar_payload)
+        avatar_url = await upload_avatar_to_cos_async(avatar_payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上传头像失败: {e}") from e
 
+    cached = row = None
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute("UPDATE doctors SET avatar_url=%s WHERE doctor_id=%s", [avatar_url, doctor_id])
-
-    row = await fetch_one(
-        """
-        SELECT doctor_id, name, title, expertise, intro,
-               hospital_id, hospital_name, department_name, registration_fee, avatar_url
-        FROM doctors WHERE doctor_id = %s
-        """,
-        [doctor_id],
-        pool,
-    )
-    return map_doctor_row(row)
+            found = cur.rowcount > 0
+            if found:
+                # 压缩和上传要等很久，期间可能有 modifyInfo 完成；缓存要在 UPDATE 之后读
+                cached = doctor_cache.get(("doctor", doctor_id))
+                if cached is None:
+                    await cur.execute(f"SELECT {DOCTOR_COLUMNS} FROM doctors WHERE doctor_id = %s", [doctor_id])
+                    row = await cur.fetchone()
+    if not found:
+        # 医生不存在（或上传期间被删除），刚上传的头像没有人引用，删掉；放在释放连接之后
+        try:
+            await delete_avatar_from_cos_async(avatar_url)
+        except Exception as e:
+            logger.warning(f"Delete orphaned avatar failed: {avatar_url} error={e}")
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    invalidate_doctor_cache()
+    avatar_cache.pop(doctor_id)
+    if row is not None:
+        return map_doctor_row(row)
+    # 缓存里的医生信息加上新头像地址即为最新结果
+    return {**cached, "avatarUrl": avatar_url}
 
 
 @router.post("/admin/doctors/getImage")
@@ -242,7 +408,7 @@ async def admin_get_doctor_image(body: Dict[str, Any], pool=Depends(get_pool)) -
         elif isinstance(val, str):
             base = val.strip()
     if not base:
-        base = DEFAULT_AVATAR_BASE64
+        base = default_avatar_base64()
     data_uri = f"data:image/png;base64,{base}" if base else None
     return {"avatarImage": data_uri}
 
@@ -254,4 +420,8 @@ async def delete_doctor(doctor_id: str, pool=Depends(get_pool)):
             await cur.execute("DELETE FROM doctors WHERE doctor_id = %s", [doctor_id])
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Doctor not found")
+    invalidate_doctor_cache()
+    avatar_cache.pop(doctor_id)
+    doctor_search_index.remove(doctor_id)
+    availability_index.remove_doctor(doctor_id)
     return {"success": True}
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from backend_fastapi.db import app_pools
+from backend_fastapi.metrics import (
+    render_pool_metrics,
+    render_request_metrics,
+    render_sql_metrics,
+    request_metrics,
+    sql_metrics,
+)
+from backend_fastapi.profiler import PROFILE_MAX_SECONDS, render_collapsed, sampling_profiler
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def pool_stats(request: Request) -> List[Dict[str, Any]]:
+    return [pool.stats() for pool in app_pools(request.app.state) if hasattr(pool, "stats")]
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    lines = render_request_metrics(request_metrics) + render_sql_metrics(sql_metrics)
+    lines += render_pool_metrics(pool_stats(request))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/api/admin/sql-stats")
+async def admin_sql_stats(limit: int = Query(50, ge=1, le=500)) -> Dict[str, Any]:
+    # 按总执行耗时排序，方便直接看出最重的语句
+    return {
+        "slowQueryMs": sql_metrics.slow_query_seconds * 1000,
+        "poolAcquireWait": sql_metrics.pool_acquire.summary(),
+        "statements": sql_metrics.top(limit),
+    }
+
+
+@router.get("/api/admin/pool-stats")
+async def admin_pool_stats(request: Request) -> List[Dict[str, Any]]:
+    return pool_stats(request)
+
+
+@router.get("/api/admin/request-stats")
+async def admin_request_stats() -> Dict[str, Any]:
+    return request_metrics.snapshot(time.time())
+
+
+@router.post("/api/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000, alias="intervalMs"),
+    x_admin_token: Optional[str] = Header(None),
+) -> PlainTextResponse:
+    # 未配置 ADMIN_TOKEN 时直接关闭该接口
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if sampling_profiler.running:
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    # 采样线程在后台跑，事件循环照常处理请求，采到的就是线上真实负载下的调用栈
+    loop_thread = threading.get_ident()
+    try:
+        stacks = await asyncio.to_thread(sampling_profiler.run, loop_thread, seconds, interval_ms / 1000.0)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return PlainTextResponse(
+        render_collapsed(stacks), headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
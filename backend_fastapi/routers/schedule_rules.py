@@ -0,0 +1,166 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from backend_fastapi.availability import availability_index
+from backend_fastapi.booking import slot_admission
+from backend_fastapi.db import get_pool
+from backend_fastapi.recurrence import schedule_rules
+from backend_fastapi.responses import FastJSONResponse
+from backend_fastapi.routers.schedules import PERIODS, parse_weekday_templates
+from backend_fastapi.utils import fetch_all
+
+router = APIRouter(prefix="/api", tags=["schedule-rules"])
+
+PERIOD_NAMES = {period for _, period in PERIODS}
+
+
+def parse_date(value: Any, field: str) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field}")
+
+
+async def after_rule_change(doctor_id: str, pool) -> None:
+    """本进程立即生效；其他进程等各自的定期重建。"""
+    await schedule_rules.rebuild(pool)
+    availability_index.request_refresh()
+    slot_admission.reset_doctor(doctor_id)
+
+
+@router.get("/admin/schedule-rules", response_class=FastJSONResponse)
+async def admin_get_schedule_rules(doctorId: str = Query(...), pool=Depends(get_pool)) -> FastJSONResponse:
+    rules = await fetch_all("SELECT * FROM schedule_rules WHERE doctor_id = %s ORDER BY weekday, period", [doctorId], pool)
+    exceptions = await fetch_all(
+        "SELECT * FROM schedule_exceptions WHERE doctor_id = %s AND exception_date >= CURDATE() ORDER BY exception_date, period",
+        [doctorId],
+        pool,
+    )
+    return FastJSONResponse({"rules": rules, "exceptions": exceptions, "horizonDays": schedule_rules.horizon_days})
+
+
+@router.post("/admin/schedule-rules")
+async def save_schedule_rules(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+    """按星期设置出诊规则，weekdayTemplates 的格式与 /admin/schedules/bulk 相同。
+
+    规则不提前生成排班行，读排班时按放号周期展开。replace 为真时先删掉该医生原有的全部规则；
+    validFrom / validUntil 可选，限定规则的生效日期。
+    """
+    doctor_id = body.get("doctorId")
+    templates = body.get("weekdayTemplates")
+    if not doctor_id:
+        raise HTTPException(status_code=400, detail="doctorId is required")
+    if not isinstance(templates, dict) or not templates:
+        raise HTTPException(status_code=400, detail="weekdayTemplates is required")
+    valid_from = parse_date(body.get("validFrom"), "validFrom")
+    valid_until = parse_date(body.get("validUntil"), "validUntil")
+    if valid_from and valid_until and valid_until < valid_from:
+        raise HTTPException(status_code=400, detail="validUntil is before validFrom")
+
+    params: List[Any] = []
+    for weekday, periods in parse_weekday_templates(templates).items():
+        for period, slots in periods:
+            params.extend([doctor_id, weekday, period, slots, valid_from, valid_until])
+    rows = len(params) // 6
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                if body.get("replace"):
+                    await cur.execute("DELETE FROM schedule_rules WHERE doctor_id = %s", [doctor_id])
+                if rows:
+                    await cur.execute(
+                        f"""
+                        INSERT INTO schedule_rules (doctor_id, weekday, period, total_slots, valid_from, valid_until)
+                        VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * rows)}
+                        ON DUPLICATE KEY UPDATE total_slots = VALUES(total_slots),
+                        valid_from = VALUES(valid_from), valid_until = VALUES(valid_until)
+                        """,
+                        params,
+                    )
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    await after_rule_change(doctor_id, pool)
+    return {"success": True, "rulesWritten": rows}
+
+
+@router.post("/admin/schedule-rules/delete")
+async def delete_schedule_rules(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+    """删除医生的规则；给了 weekday / period 时只删对应的那些。已经生成的排班行不受影响。"""
+    doctor_id = body.get("doctorId")
+    if not doctor_id:
+        raise HTTPException(status_code=400, detail="doctorId is required")
+    sql = "DELETE FROM schedule_rules WHERE doctor_id = %s"
+    params: List[Any] = [doctor_id]
+    if body.get("weekday") is not None:
+        sql += " AND weekday = %s"
+        params.append(body.get("weekday"))
+    if body.get("period"):
+        sql += " AND period = %s"
+        params.append(body.get("period"))
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, params)
+            deleted = cur.rowcount
+    await after_rule_change(doctor_id, pool)
+    return {"success": True, "deleted": deleted}
+
+
+@router.post("/admin/schedule-exceptions")
+async def save_schedule_exception(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+    """单日覆盖规则：totalSlots 为 0 表示停诊，也可以给没有规则的日期加诊。
+
+    该时段已经有排班行（已被预约过或手工排过）时以排班行为准，返回的 scheduleId 非空，需要改排班行本身。
+    """
+    doctor_id = body.get("doctorId")
+    exception_date = parse_date(body.get("date"), "date")
+    period = body.get("period")
+    total_slots = body.get("totalSlots")
+    if not doctor_id or exception_date is None or not period or total_slots is None:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    if period not in PERIOD_NAMES:
+        raise HTTPException(status_code=400, detail="Invalid period")
+    if not isinstance(total_slots, int) or total_slots < 0:
+        raise HTTPException(status_code=400, detail="Invalid totalSlots")
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO schedule_exceptions (doctor_id, exception_date, period, total_slots)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE total_slots = VALUES(total_slots)
+                """,
+                [doctor_id, exception_date, period, total_slots],
+            )
+            await cur.execute(
+                "SELECT id FROM doctor_schedules WHERE doctor_id = %s AND schedule_date = %s AND period = %s",
+                [doctor_id, exception_date, period],
+            )
+            schedule = await cur.fetchone()
+    await after_rule_change(doctor_id, pool)
+    return {"success": True, "scheduleId": schedule["id"] if schedule else None}
+
+
+@router.post("/admin/schedule-exceptions/delete")
+async def delete_schedule_exception(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+    doctor_id = body.get("doctorId")
+    exception_date = parse_date(body.get("date"), "date")
+    period = body.get("period")
+    if not doctor_id or exception_date is None or not period:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "DELETE FROM schedule_exceptions WHERE doctor_id = %s AND exception_date = %s AND period = %s",
+                [doctor_id, exception_date, period],
+            )
+            if cur.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Exception not found")
+    await after_rule_change(doctor_id, pool)
+    return {"success": True}
@@ -1,31 +1,120 @@
+import time
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, List, Optional
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
+from backend_fastapi.availability import AVAILABILITY_REFRESH, availability_index
+from backend_fastapi.booking import slot_admission, slot_key
+from backend_fastapi.cache import render_cache
 from backend_fastapi.db import get_pool
-from backend_fastapi.utils import fetch_all, fetch_one
+from backend_fastapi.recurrence import merge_schedule_stream, merge_schedules, schedule_rules, schedule_sort_key
+from backend_fastapi.responses import FastJSONResponse, conditional_json
+from backend_fastapi.routers.doctors import load_doctor_map
+from backend_fastapi.slot_events import slot_broadcaster
+from backend_fastapi.utils import decode_cursor, encode_cursor, fetch_all, ndjson_chunks, stream_rows
 
 router = APIRouter(prefix="/api", tags=["schedules"])
 
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+UPSERT_CHUNK_SIZE = 500
+MAX_BULK_DAYS = 366
+PERIODS = (("morningSlots", "上午"), ("afternoonSlots", "下午"))
+STREAM_DEFAULT_DAYS = 30
+STREAM_MAX_DAYS = 92
+STREAM_MAX_DOCTORS = 50
+# 余号要实时，每次都重新验证；版本没变时直接用缓存的响应体，不查库
+SCHEDULE_CACHE_CONTROL = "no-cache"
 
-@router.get("/doctors/{doctor_id}/schedules")
+
+@router.get("/doctors/{doctor_id}/schedules", response_class=FastJSONResponse)
 async def get_doctor_schedules(
     doctor_id: str,
     startDate: Optional[str] = Query(default=None),
+    if_none_match: Optional[str] = Header(default=None),
     pool=Depends(get_pool),
-) -> List[Dict[str, Any]]:
+) -> Response:
+    """版本取 availability_index 里该医生的变更计数，加上规则展开出的虚拟行。
+
+    本进程的预约、取消、排班写入会立即让计数加一；其他进程的写入要等索引定期重建发现变化，
+    窗口外的行重建看不到，版本里再带上按 AVAILABILITY_REFRESH 划分的时间段，缓存最多旧这么久。
+    ETag 是响应体的哈希，内容没变时重新渲染也还是同一个 ETag。
+    明细查主库：计数在主库提交后才加一，从库可能还没跟上，读到的旧数据会按新版本缓存下来。
+    """
     start = startDate or date.today().isoformat()
-    schedules = await fetch_all(
-        """
-        SELECT * FROM doctor_schedules
-        WHERE doctor_id = %s AND schedule_date >= %s
-        ORDER BY schedule_date, period
-        """,
-        [doctor_id, start],
-        pool,
+    virtual = list(schedule_rules.expand(start, doctor_ids=[doctor_id]))
+    version = (
+        availability_index.doctor_version(doctor_id),
+        int(time.time() // AVAILABILITY_REFRESH),
+        tuple((str(row["schedule_date"]), row["period"], row["total_slots"]) for row in virtual),
     )
-    return schedules
+
+    async def build() -> List[Dict[str, Any]]:
+        schedules = await fetch_all(
+            """
+            SELECT * FROM doctor_schedules
+            WHERE doctor_id = %s AND schedule_date >= %s
+            ORDER BY schedule_date, period
+            """,
+            [doctor_id, start],
+            pool,
+        )
+        return list(merge_schedules(schedules, virtual))
+
+    etag, body, modified = await render_cache.render(("schedules", doctor_id, start), None, version, build)
+    return conditional_json(body, etag, if_none_match, SCHEDULE_CACHE_CONTROL, modified)
+
+
+def build_snapshot_query(doctor_ids: List[str], start_date: str, end_date: str) -> Tuple[str, List[Any]]:
+    sql = f"""
+        SELECT * FROM doctor_schedules
+        WHERE doctor_id IN ({", ".join(["%s"] * len(doctor_ids))}) AND schedule_date BETWEEN %s AND %s
+        ORDER BY schedule_date, doctor_id, period
+    """
+    return sql, [*doctor_ids, start_date, end_date]
+
+
+@router.get("/schedules/stream")
+async def stream_schedules(
+    doctorIds: str = Query(...),
+    startDate: Optional[str] = Query(default=None),
+    endDate: Optional[str] = Query(default=None),
+    lastEventId: Optional[str] = Query(default=None),
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    pool=Depends(get_pool),
+) -> StreamingResponse:
+    """SSE 推送号源剩余数的变化，代替轮询 /doctors/{id}/schedules。
+
+    doctorIds 逗号分隔。首次连接先发 snapshot 事件（范围内全部排班），之后只发有变化的号源（slots 事件，
+    同一号源在合并窗口内只发最新值）。重连时带 Last-Event-ID 头（EventSource 会自动带，
+    不能设置请求头的客户端用 lastEventId 参数）从断点补发。
+    """
+    doctor_ids = sorted({d.strip() for d in doctorIds.split(",") if d.strip()})
+    if not doctor_ids:
+        raise HTTPException(status_code=400, detail="doctorIds is required")
+    if len(doctor_ids) > STREAM_MAX_DOCTORS:
+        raise HTTPException(status_code=400, detail=f"At most {STREAM_MAX_DOCTORS} doctors per stream")
+    try:
+        start = date.fromisoformat(startDate) if startDate else date.today()
+        end = date.fromisoformat(endDate) if endDate else start + timedelta(days=STREAM_DEFAULT_DAYS - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid startDate or endDate")
+    if end < start or (end - start).days >= STREAM_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must be within {STREAM_MAX_DAYS} days")
+    slot_broadcaster.ensure_capacity()
+
+    async def load_snapshot() -> List[Dict[str, Any]]:
+        # 快照查主库：增量在主库提交后才推送，从库的快照可能缺少序号已经早于快照的变更
+        rows = await fetch_all(*build_snapshot_query(doctor_ids, start.isoformat(), end.isoformat()), pool)
+        return list(merge_schedules(rows, schedule_rules.expand(start, end, doctor_ids)))
+
+    events = slot_broadcaster.stream(doctor_ids, start.isoformat(), end.isoformat(), last_event_id or lastEventId, load_snapshot)
+    # X-Accel-Buffering 关掉 nginx 的响应缓冲，否则事件会攒着不发
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
 
 
 @router.post("/admin/schedules")
@@ -47,9 +136,59 @@ async def save_schedule(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[st
                 [doctor_id, schedule_date, period, total_slots, total_slots],
             )
             new_id = cur.lastrowid
+    slot_admission.mark_open(slot_key(doctor_id, schedule_date, period))
+    availability_index.set_slot(doctor_id, schedule_date, period, total_slots, schedule_id=new_id or None)
     return {"success": True, "message": "Schedule saved successfully", "id": new_id}
 
 
+def date_range(start_date: str, end_date: str) -> List[str]:
+    try:
+        current = datetime.fromisoformat(start_date).date()
+        end = datetime.fromisoformat(end_date).date()
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid startDate or endDate")
+    dates: List[str] = []
+    while current <= end:
+        dates.append(current.isoformat())
+        current += timedelta(days=1)
+    return dates
+
+
+async def upsert_schedule_rows(cur, rows: List[Tuple[str, str, str, int]]) -> int:
+    """分块发送多行 INSERT ... ON DUPLICATE KEY UPDATE，返回 MySQL 报告的影响行数。"""
+    affected = 0
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[start : start + UPSERT_CHUNK_SIZE]
+        params: List[Any] = []
+        for doctor_id, schedule_date, period, slots in chunk:
+            params.extend([doctor_id, schedule_date, period, slots, slots])
+        await cur.execute(
+            f"""
+            INSERT INTO doctor_schedules (doctor_id, schedule_date, period, total_slots, remaining_slots)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(chunk))}
+            ON DUPLICATE KEY UPDATE total_slots=VALUES(total_slots), remaining_slots=VALUES(remaining_slots)
+            """,
+            params,
+        )
+        affected += cur.rowcount
+    return affected
+
+
+async def write_schedule_rows(rows: List[Tuple[str, str, str, int]], pool) -> int:
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                affected = await upsert_schedule_rows(cur, rows)
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    for doctor_id, schedule_date, period, slots in rows:
+        availability_index.set_slot(doctor_id, schedule_date, period, slots)
+    return affected
+
+
 @router.post("/admin/schedules/batch")
 async def batch_schedules(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
     doctor_id = body.get("doctorId")
@@ -62,12 +201,7 @@ async def batch_schedules(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[
         raise HTTPException(status_code=400, detail="Missing doctorId")
     dates: List[str] = []
     if start_date and end_date:
-        start_dt = datetime.fromisoformat(start_date)
-        end_dt = datetime.fromisoformat(end_date)
-        current = start_dt
-        while current <= end_dt:
-            dates.append(current.date().isoformat())
-            current += timedelta(days=1)
+        dates = date_range(start_date, end_date)
     elif days:
         today = date.today()
         for i in range(int(days)):
@@ -76,45 +210,96 @@ async def batch_schedules(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[
     else:
         raise HTTPException(status_code=400, detail="Missing date range or days parameter")
 
-    async with pool.acquire() as conn:
-        conn.autocommit(False)
+    began = time.perf_counter()
+    rows: List[Tuple[str, str, str, int]] = []
+    for date_str in dates:
+        if morning_slots is not None and morning_slots >= 0:
+            rows.append((doctor_id, date_str, "上午", morning_slots))
+        if afternoon_slots is not None and afternoon_slots >= 0:
+            rows.append((doctor_id, date_str, "下午", afternoon_slots))
+    await write_schedule_rows(rows, pool)
+    slot_admission.reset_doctor(doctor_id)
+    return {
+        "success": True,
+        "message": f"Successfully set schedules for {len(dates)} days",
+        "rowsWritten": len(rows),
+        "elapsedMs": round((time.perf_counter() - began) * 1000, 2),
+    }
+
+
+def parse_weekday_templates(templates: Dict[Any, Any]) -> Dict[int, List[Tuple[str, int]]]:
+    """weekdayTemplates -> {星期(1-7): [(时段, 号源数)]}，批量写排班和排班规则共用。"""
+    weekday_slots: Dict[int, List[Tuple[str, int]]] = {}
+    for weekday, template in templates.items():
         try:
-            async with conn.cursor() as cur:
-                for date_str in dates:
-                    if morning_slots is not None and morning_slots >= 0:
-                        await cur.execute(
-                            """
-                            INSERT INTO doctor_schedules (doctor_id, schedule_date, period, total_slots, remaining_slots)
-                            VALUES (%s, %s, '上午', %s, %s)
-                            ON DUPLICATE KEY UPDATE total_slots=VALUES(total_slots), remaining_slots=VALUES(remaining_slots)
-                            """,
-                            [doctor_id, date_str, morning_slots, morning_slots],
-                        )
-                    if afternoon_slots is not None and afternoon_slots >= 0:
-                        await cur.execute(
-                            """
-                            INSERT INTO doctor_schedules (doctor_id, schedule_date, period, total_slots, remaining_slots)
-                            VALUES (%s, %s, '下午', %s, %s)
-                            ON DUPLICATE KEY UPDATE total_slots=VALUES(total_slots), remaining_slots=VALUES(remaining_slots)
-                            """,
-                            [doctor_id, date_str, afternoon_slots, afternoon_slots],
-                        )
-                await conn.commit()
-        except Exception:
-            await conn.rollback()
-            conn.autocommit(True)
-            raise
-        conn.autocommit(True)
-    return {"success": True, "message": f"Successfully set schedules for {len(dates)} days"}
+            weekday_num = int(weekday)
+        except (TypeError, ValueError):
+            weekday_num = 0
+        if weekday_num < 1 or weekday_num > 7 or not isinstance(template, dict):
+            raise HTTPException(status_code=400, detail=f"Invalid weekday template: {weekday}")
+        for field, period in PERIODS:
+            slots = template.get(field)
+            if slots is None:
+                continue
+            if not isinstance(slots, int) or slots < 0:
+                raise HTTPException(status_code=400, detail=f"Invalid {field} for weekday {weekday}")
+            weekday_slots.setdefault(weekday_num, []).append((period, slots))
+    return weekday_slots
 
 
-@router.get("/admin/schedules")
-async def admin_get_schedules(
-    doctorId: Optional[str] = Query(default=None),
-    startDate: Optional[str] = Query(default=None),
-    endDate: Optional[str] = Query(default=None),
-    pool=Depends(get_pool),
-) -> List[Dict[str, Any]]:
+@router.post("/admin/schedules/bulk")
+async def bulk_schedules(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[str, Any]:
+    """多个医生 × 日期范围 × 按星期的号源模板，在一个事务里写入。
+
+    weekdayTemplates 的键为 1-7（周一到周日），值形如 {"morningSlots": 20, "afternoonSlots": 10}；
+    没有模板的星期不写入。
+    """
+    doctor_ids = body.get("doctorIds")
+    start_date = body.get("startDate")
+    end_date = body.get("endDate")
+    templates = body.get("weekdayTemplates")
+    if not isinstance(doctor_ids, list) or not doctor_ids:
+        raise HTTPException(status_code=400, detail="doctorIds is required")
+    if not start_date or not end_date:
+        raise HTTPException(status_code=400, detail="Missing startDate or endDate")
+    if not isinstance(templates, dict) or not templates:
+        raise HTTPException(status_code=400, detail="weekdayTemplates is required")
+    dates = date_range(start_date, end_date)
+    if len(dates) > MAX_BULK_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range exceeds {MAX_BULK_DAYS} days")
+
+    weekday_slots = parse_weekday_templates(templates)
+
+    began = time.perf_counter()
+    rows: List[Tuple[str, str, str, int]] = []
+    for date_str in dates:
+        periods = weekday_slots.get(date.fromisoformat(date_str).isoweekday())
+        if not periods:
+            continue
+        for doctor_id in doctor_ids:
+            for period, slots in periods:
+                rows.append((doctor_id, date_str, period, slots))
+    affected = await write_schedule_rows(rows, pool)
+    for doctor_id in doctor_ids:
+        slot_admission.reset_doctor(doctor_id)
+    return {
+        "success": True,
+        "doctors": len(doctor_ids),
+        "days": len(dates),
+        "rowsWritten": len(rows),
+        "affectedRows": affected,
+        "elapsedMs": round((time.perf_counter() - began) * 1000, 2),
+    }
+
+
+def build_admin_schedules_query(
+    doctor_id: Optional[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    after: Optional[List[Any]] = None,
+    limit: Optional[int] = None,
+) -> Tuple[str, List[Any]]:
+    """按 (schedule_date, doctor_id, period) 排序的管理端排班查询；after 为上一页最后一行的这三列。"""
     sql = """
         SELECT s.*, d.name as doctor_name, d.hospital_name, d.department_name
         FROM doctor_schedules s
@@ -122,63 +307,132 @@ async def admin_get_schedules(
         WHERE 1=1
     """
     params: List[Any] = []
-    if doctorId:
+    if doctor_id:
         sql += " AND s.doctor_id = %s"
-        params.append(doctorId)
-    if startDate:
+        params.append(doctor_id)
+    if start_date:
         sql += " AND s.schedule_date >= %s"
-        params.append(startDate)
-    if endDate:
+        params.append(start_date)
+    if end_date:
         sql += " AND s.schedule_date <= %s"
-        params.append(endDate)
-    if not startDate and not endDate:
+        params.append(end_date)
+    if not start_date and not end_date:
         sql += " AND s.schedule_date >= CURDATE()"
+    if after:
+        sql += """
+            AND (s.schedule_date > %s OR (s.schedule_date = %s
+                 AND (s.doctor_id > %s OR (s.doctor_id = %s AND s.period > %s))))
+        """
+        params.extend([after[0], after[0], after[1], after[1], after[2]])
     sql += " ORDER BY s.schedule_date, s.doctor_id, s.period"
-    schedules = await fetch_all(sql, params, pool)
-
-    if doctorId and startDate and endDate:
-        merged: List[Dict[str, Any]] = []
-        date_map: Dict[str, Dict[str, Any]] = {}
-        for schedule in schedules:
-            key = schedule["schedule_date"].isoformat() if isinstance(schedule["schedule_date"], (date, datetime)) else schedule["schedule_date"]
-            if key not in date_map:
-                date_map[key] = {
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+
+async def admin_rule_schedules(
+    doctor_id: Optional[str], start_date: Optional[str], end_date: Optional[str], pool
+) -> Iterator[Dict[str, Any]]:
+    """管理端列表里由规则展开的排班，补上联表查询才有的医生字段。"""
+    if not schedule_rules.doctor_ids:
+        return iter(())
+    doctor_map = await load_doctor_map(pool)
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        for row in schedule_rules.expand(start_date, end_date, [doctor_id] if doctor_id else None):
+            doctor = doctor_map.get(row["doctor_id"], {})
+            yield {
+                **row,
+                "doctor_name": doctor.get("name"),
+                "hospital_name": doctor.get("hospitalName"),
+                "department_name": doctor.get("departmentName"),
+            }
+
+    return rows()
+
+
+@router.get("/admin/schedules", response_class=FastJSONResponse)
+async def admin_get_schedules(
+    doctorId: Optional[str] = Query(default=None),
+    startDate: Optional[str] = Query(default=None),
+    endDate: Optional[str] = Query(default=None),
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None),
+    format: Optional[str] = Query(default=None),
+    pool=Depends(get_pool),
+) -> Any:
+    merged_view = bool(doctorId and startDate and endDate)
+    virtual = await admin_rule_schedules(doctorId, startDate, endDate, pool)
+    if format == "ndjson" and not merged_view:
+        sql, params = build_admin_schedules_query(doctorId, startDate, endDate)
+        chunks = merge_schedule_stream(stream_rows(sql, params, pool), virtual)
+        return StreamingResponse(ndjson_chunks(chunks), media_type="application/x-ndjson")
+    if not merged_view and (limit is not None or cursor is not None):
+        page_size = limit or DEFAULT_PAGE_SIZE
+        after = None
+        if cursor:
+            try:
+                after = decode_cursor(cursor, 3)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            after_key = (str(after[0])[:10], str(after[1]), str(after[2]))
+            virtual = (row for row in virtual if schedule_sort_key(row) > after_key)
+        sql, params = build_admin_schedules_query(doctorId, startDate, endDate, after, page_size + 1)
+        # 具体行取了 page_size + 1 条，归并后的前 page_size + 1 条一定落在这些具体行覆盖的范围内，去重是完整的
+        rows = list(islice(merge_schedules(await fetch_all(sql, params, pool), virtual), page_size + 1))
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_cursor = encode_cursor([last["schedule_date"], last["doctor_id"], last["period"]])
+        return FastJSONResponse({"items": rows, "nextCursor": next_cursor})
+
+    sql, params = build_admin_schedules_query(doctorId, startDate, endDate)
+    schedules = list(merge_schedules(await fetch_all(sql, params, pool), virtual))
+    if not merged_view:
+        return FastJSONResponse(schedules)
+
+    merged: List[Dict[str, Any]] = []
+    date_map: Dict[str, Dict[str, Any]] = {}
+    for schedule in schedules:
+        key = schedule["schedule_date"].isoformat() if isinstance(schedule["schedule_date"], (date, datetime)) else schedule["schedule_date"]
+        if key not in date_map:
+            date_map[key] = {
+                "date": key,
+                "morningSlots": 0,
+                "afternoonSlots": 0,
+                "morningId": None,
+                "afternoonId": None,
+            }
+        item = date_map[key]
+        if schedule["period"] == "上午":
+            item["morningSlots"] = schedule["total_slots"]
+            item["morningId"] = schedule["id"]
+        elif schedule["period"] == "下午":
+            item["afternoonSlots"] = schedule["total_slots"]
+            item["afternoonId"] = schedule["id"]
+
+    current = datetime.fromisoformat(startDate)
+    end_dt = datetime.fromisoformat(endDate)
+    while current <= end_dt:
+        key = current.date().isoformat()
+        item = date_map.get(key)
+        if item:
+            merged.append(
+                {
                     "date": key,
-                    "morningSlots": 0,
-                    "afternoonSlots": 0,
-                    "morningId": None,
-                    "afternoonId": None,
+                    "morningSlots": item["morningSlots"],
+                    "afternoonSlots": item["afternoonSlots"],
+                    "morningId": item["morningId"],
+                    "afternoonId": item["afternoonId"],
+                    "doctorId": doctorId,
                 }
-            item = date_map[key]
-            if schedule["period"] == "上午":
-                item["morningSlots"] = schedule["total_slots"]
-                item["morningId"] = schedule["id"]
-            elif schedule["period"] == "下午":
-                item["afternoonSlots"] = schedule["total_slots"]
-                item["afternoonId"] = schedule["id"]
-
-        current = datetime.fromisoformat(startDate)
-        end_dt = datetime.fromisoformat(endDate)
-        while current <= end_dt:
-            key = current.date().isoformat()
-            item = date_map.get(key)
-            if item:
-                merged.append(
-                    {
-                        "date": key,
-                        "morningSlots": item["morningSlots"],
-                        "afternoonSlots": item["afternoonSlots"],
-                        "morningId": item["morningId"],
-                        "afternoonId": item["afternoonId"],
-                        "doctorId": doctorId,
-                    }
-                )
-            else:
-                merged.append({"date": key, "morningSlots": 0, "afternoonSlots": 0, "morningId": None, "afternoonId": None, "doctorId": doctorId})
-            current += timedelta(days=1)
-        return merged
-
-    return schedules
+            )
+        else:
+            merged.append({"date": key, "morningSlots": 0, "afternoonSlots": 0, "morningId": None, "afternoonId": None, "doctorId": doctorId})
+        current += timedelta(days=1)
+    return FastJSONResponse(merged)
 
 
 @router.post("/admin/schedules/updateOne")
@@ -191,6 +445,7 @@ async def update_schedule(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[
         slots = body.get("morningSlots") if body.get("morningSlots") is not None else body.get("afternoonSlots")
     if slots is None:
         raise HTTPException(status_code=400, detail="No fields to update")
+    key = availability_index.slot_for(schedule_id)
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
@@ -199,4 +454,13 @@ async def update_schedule(body: Dict[str, Any], pool=Depends(get_pool)) -> Dict[
             )
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Schedule not found")
+            if key is None:
+                # 索引里没有这一行（刚建的或在窗口外），同一连接上补查一次号源键
+                await cur.execute("SELECT doctor_id, schedule_date, period FROM doctor_schedules WHERE id = %s", [schedule_id])
+                row = await cur.fetchone()
+                key = slot_key(row["doctor_id"], row["schedule_date"], row["period"]) if row else None
+    if key is not None:
+        # 只重新放开这一个号源，其它时段的"已满"标记不受影响
+        slot_admission.mark_open(key)
+        availability_index.set_slot(*key, slots)
     return {"success": True, "message": "Schedule updated successfully"}
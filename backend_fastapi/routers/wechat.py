@@ -1,11 +1,19 @@
+import asyncio
 import os
 from datetime import datetime
 from typing import Any, Dict
 
-import httpx
 from fastapi import APIRouter, HTTPException
 
-from backend_fastapi.wechat_bot import WechatBot
+from backend_fastapi.wechat_auth import INVALID_TOKEN_ERRCODES, WechatTokenError, get_access_token_manager
+from backend_fastapi.wechat_bot import (
+    WechatBot,
+    booking_notification_payload,
+    get_http_client,
+    markdown_payload,
+    notification_queue,
+    text_payload,
+)
 
 router = APIRouter(prefix="/api", tags=["wechat"])
 
@@ -19,25 +27,39 @@ async def decrypt_phone(body: Dict[str, Any]) -> Dict[str, Any]:
     app_secret = os.getenv("WECHAT_APP_SECRET")
     if not app_id or not app_secret:
         raise HTTPException(status_code=500, detail="Missing WeChat credentials")
-    token_url = (
-        f"https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={app_id}&secret={app_secret}"
-    )
-    async with httpx.AsyncClient(timeout=10) as client:
-        token_resp = await client.get(token_url)
-        token_data = token_resp.json()
-        if token_data.get("errcode"):
-            raise HTTPException(status_code=500, detail=token_data.get("errmsg", "Failed to get access token"))
-        access_token = token_data.get("access_token")
+    manager = get_access_token_manager(app_id, app_secret)
+    for attempt in range(2):
+        try:
+            access_token = await manager.get_token()
+        except WechatTokenError as e:
+            raise HTTPException(status_code=500, detail=str(e))
         phone_url = f"https://api.weixin.qq.com/wxa/business/getuserphonenumber?access_token={access_token}"
-        phone_resp = await client.post(phone_url, json={"code": code})
+        phone_resp = await get_http_client().post(phone_url, json={"code": code})
         phone_data = phone_resp.json()
-        if phone_data.get("errcode") != 0:
-            raise HTTPException(status_code=500, detail=phone_data.get("errmsg", "Failed to decrypt phone number"))
+        if phone_data.get("errcode") in INVALID_TOKEN_ERRCODES and attempt == 0:
+            # token 被其他地方刷新或提前失效，作废后重试一次
+            manager.invalidate(access_token)
+            continue
+        break
+    if phone_data.get("errcode") != 0:
+        raise HTTPException(status_code=500, detail=phone_data.get("errmsg", "Failed to decrypt phone number"))
     phone_info = phone_data.get("phone_info", {})
     phone_number = phone_info.get("purePhoneNumber") or phone_info.get("phoneNumber")
     return {"success": True, "phoneNumber": phone_number, "countryCode": phone_info.get("countryCode")}
 
 
+async def enqueue_notification(webhook_url: str, payload: Dict[str, Any]) -> None:
+    try:
+        await notification_queue.enqueue(webhook_url, payload)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="通知队列已满，请稍后重试")
+
+
+@router.get("/wechat/queue-stats")
+async def wechat_queue_stats() -> Dict[str, Any]:
+    return notification_queue.snapshot()
+
+
 @router.post("/wechat/send-booking-notification")
 async def send_booking_notification(body: Dict[str, Any]) -> Dict[str, Any]:
     webhook_url = body.get("webhookUrl")
@@ -48,21 +70,22 @@ async def send_booking_notification(body: Dict[str, Any]) -> Dict[str, Any]:
         raise HTTPException(status_code=400, detail="webhookUrl is required")
     if not order_number or not project_name or not phone:
         raise HTTPException(status_code=400, detail="orderNumber, projectName and phone are required")
-    bot = WechatBot(webhook_url)
     submit_time = body.get(
         "submitTime",
         datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     )
-    result = await bot.send_booking_notification(
-        {
-            "orderNumber": order_number,
-            "projectName": project_name,
-            "phone": phone,
-            "message": body.get("message") or "授权号码",
-            "submitTime": submit_time,
-        },
-        mention_all=body.get("mentionAll", True),
-    )
+    booking_info = {
+        "orderNumber": order_number,
+        "projectName": project_name,
+        "phone": phone,
+        "message": body.get("message") or "授权号码",
+        "submitTime": submit_time,
+    }
+    if body.get("async"):
+        await enqueue_notification(webhook_url, booking_notification_payload(booking_info, body.get("mentionAll", True)))
+        return {"success": True, "message": "Notification queued", "queued": True}
+    bot = WechatBot(webhook_url)
+    result = await bot.send_booking_notification(booking_info, mention_all=body.get("mentionAll", True))
     return {"success": True, "message": "Notification sent successfully", "data": result}
 
 
@@ -72,6 +95,11 @@ async def send_wechat_text(body: Dict[str, Any]) -> Dict[str, Any]:
     content = body.get("content")
     if not webhook_url or not content:
         raise HTTPException(status_code=400, detail="webhookUrl and content are required")
+    if body.get("async"):
+        await enqueue_notification(
+            webhook_url, text_payload(content, body.get("mentionedList") or [], body.get("mentionedMobileList") or [])
+        )
+        return {"success": True, "message": "Text message queued", "queued": True}
     bot = WechatBot(webhook_url)
     result = await bot.send_text(content, body.get("mentionedList") or [], body.get("mentionedMobileList") or [])
     return {"success": True, "message": "Text message sent successfully", "data": result}
@@ -83,6 +111,9 @@ async def send_wechat_markdown(body: Dict[str, Any]) -> Dict[str, Any]:
     content = body.get("content")
     if not webhook_url or not content:
         raise HTTPException(status_code=400, detail="webhookUrl and content are required")
+    if body.get("async"):
+        await enqueue_notification(webhook_url, markdown_payload(content))
+        return {"success": True, "message": "Markdown message queued", "queued": True}
     bot = WechatBot(webhook_url)
     result = await bot.send_markdown(content)
     return {"success": True, "message": "Markdown message sent successfully", "data": result}
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import math
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import aiomysql
+
+SEARCH_INDEX_REFRESH = float(os.getenv("SEARCH_INDEX_REFRESH", "600"))
+
+# 字段 -> 权重，命中姓名比命中简介更相关
+SEARCH_FIELDS: Tuple[Tuple[str, float], ...] = (
+    ("name", 4.0),
+    ("expertise", 2.0),
+    ("department_name", 1.5),
+    ("hospital_name", 1.0),
+    ("intro", 0.5),
+)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+logger = logging.getLogger(__name__)
+
+
+def _grams(text: str) -> Set[str]:
+    """单字 + 相邻二字切分；中文不依赖分词词典也能做子串检索。"""
+    grams: Set[str] = set()
+    for run in _TOKEN_RE.findall(text.lower()):
+        grams.update(run)
+        grams.update(run[i : i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def _term_grams(term: str) -> Set[str]:
+    if len(term) == 1:
+        return {term}
+    return {term[i : i + 2] for i in range(len(term) - 1)}
+
+
+def split_query(query: str) -> List[str]:
+    return [term for term in _TOKEN_RE.findall(query.lower()) if term]
+
+
+class DoctorSearchIndex:
+    """医生关键词倒排索引（字二元组），在事件循环线程内读写。
+
+    候选集由所有查询词的二元组倒排表求交得到，再用子串校验排除二元组
+    拼凑出来的误命中；多个查询词之间是 AND 关系。
+    upsert / remove 是本进程的增量写入，定期 rebuild 从 MySQL 全量重建，兜底其他进程的写入。
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        # 每次增删改递增，给依赖搜索结果的响应缓存判断是否失效
+        self.version = 0
+        self._postings: Dict[str, Set[str]] = {}
+        self._docs: Dict[str, Dict[str, str]] = {}
+        self._doc_grams: Dict[str, Set[str]] = {}
+        # 每次增量写入的序号，重建时据此认出查询期间被改过的医生
+        self._seq = 0
+        self._touched: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def upsert(self, doctor_id: str, fields: Dict[str, Any]) -> None:
+        self._stamp(doctor_id)
+        self._upsert(doctor_id, fields)
+
+    def remove(self, doctor_id: str) -> None:
+        self._stamp(doctor_id)
+        self._remove(doctor_id)
+
+    def _stamp(self, doctor_id: str) -> None:
+        self._seq += 1
+        self._touched[doctor_id] = self._seq
+
+    def _upsert(self, doctor_id: str, fields: Dict[str, Any]) -> None:
+        self._remove(doctor_id)
+        doc = {name: str(fields.get(name) or "").lower() for name, _ in SEARCH_FIELDS}
+        grams: Set[str] = set()
+        for text in doc.values():
+            grams |= _grams(text)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(doctor_id)
+        self._docs[doctor_id] = doc
+        self._doc_grams[doctor_id] = grams
+        self.version += 1
+
+    def _remove(self, doctor_id: str) -> None:
+        grams = self._doc_grams.pop(doctor_id, None)
+        if grams is None:
+            return
+        self.version += 1
+        self._docs.pop(doctor_id, None)
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(doctor_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def replace_all(self, rows: Iterable[Dict[str, Any]], since: Optional[int] = None) -> None:
+        """用 rows 替换全部内容。
+
+        since 是重建查询开始时的序号：之后增量写入过的医生保留当前的数据（删掉的仍然删掉），查询结果可能是写入之前读到的。
+        """
+        touched = {doctor_id: seq for doctor_id, seq in self._touched.items() if since is not None and seq > since}
+        kept = {doctor_id: self._docs.get(doctor_id) for doctor_id in touched}
+        self._postings = {}
+        self._docs = {}
+        self._doc_grams = {}
+        for row in rows:
+            if row["doctor_id"] not in touched:
+                self._upsert(row["doctor_id"], row)
+        for doctor_id, doc in kept.items():
+            if doc is not None:
+                self._upsert(doctor_id, doc)
+        self._touched = touched
+        self.ready = True
+
+    def _candidates(self, term: str) -> Set[str]:
+        postings = [self._postings.get(gram) for gram in _term_grams(term)]
+        if not postings or any(p is None for p in postings):
+            return set()
+        postings.sort(key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """返回按相关度降序排列的 doctor_id。"""
+        terms = split_query(query)
+        if not terms:
+            return []
+        total = len(self._docs) or 1
+        scores: Optional[Dict[str, float]] = None
+        for term in terms:
+            matched: Dict[str, float] = {}
+            candidates = self._candidates(term)
+            if not candidates:
+                return []
+            idf = math.log(1.0 + total / len(candidates))
+            for doctor_id in candidates:
+                doc = self._docs[doctor_id]
+                score = 0.0
+                for name, weight in SEARCH_FIELDS:
+                    text = doc[name]
+                    count = text.count(term)
+                    if count:
+                        score += weight * (1.0 + math.log(count))
+                        if text == term:
+                            score += weight
+                if score:
+                    matched[doctor_id] = score * idf
+            if scores is None:
+                scores = matched
+            else:
+                scores = {doctor_id: scores[doctor_id] + s for doctor_id, s in matched.items() if doctor_id in scores}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self._docs[item[0]]["name"]))
+        ids = [doctor_id for doctor_id, _ in ranked]
+        return ids[:limit] if limit else ids
+
+    async def rebuild(self, pool: aiomysql.Pool) -> None:
+        started = self._seq
+        columns = ", ".join(name for name, _ in SEARCH_FIELDS)
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"SELECT doctor_id, {columns} FROM doctors")
+                rows = await cur.fetchall()
+        self.replace_all(rows, started)
+
+    async def refresh_forever(self, pool: aiomysql.Pool, interval: float = SEARCH_INDEX_REFRESH) -> None:
+        """定期全量重建，兜底其他进程的写入。"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebuild(pool)
+            except Exception as e:
+                logger.warning(f"Rebuild doctor search index failed: {e}")
+
+
+doctor_search_index = DoctorSearchIndex()
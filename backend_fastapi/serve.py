@@ -0,0 +1,133 @@
+"""预先 fork 的多进程启动方式，代替 uvicorn --workers。
+
+    python -m backend_fastapi.serve --host 0.0.0.0 --port 8000 --workers 4
+
+uvicorn --workers 用 spawn 起 worker，每个 worker 都要从头导入全部模块。这里主进程导入应用、做完一次性的
+准备工作后 fork，worker 直接继承主进程的内存，模块、函数、路由表、默认头像等只读数据按写时复制共享。
+fork 前 gc.freeze() 把这些对象移出 GC 跟踪，worker 里的垃圾回收不会改写它们所在的页。
+数据库连接池、内存索引和后台任务仍在每个 worker 的 startup 里各自建立，连接和事件循环不能跨 fork 共享。
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Any, Dict
+
+import uvicorn
+from uvicorn.main import STARTUP_FAILURE
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "2"))
+# worker 启动后这么久之内就退出，视为启动失败（比如连不上数据库），不再重启，整体退出
+SERVE_MIN_UPTIME = float(os.getenv("SERVE_MIN_UPTIME", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+def preload() -> Any:
+    """只需要做一次的启动工作，在主进程里做完，fork 出的 worker 共享结果。"""
+    from backend_fastapi.app import app
+    from backend_fastapi.utils import default_avatar_base64
+
+    default_avatar_base64()
+    return app
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn_worker(app: Any, sock: socket.socket, args: argparse.Namespace) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        gc.enable()
+        config = uvicorn.Config(app, log_level=args.log_level, backlog=args.backlog, timeout_keep_alive=args.keep_alive)
+        server = uvicorn.Server(config)
+        server.run(sockets=[sock])
+        if not server.started:
+            code = STARTUP_FAILURE
+    except BaseException:
+        logger.exception("Worker crashed")
+        code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+def serve(args: argparse.Namespace) -> int:
+    # 导入期间不做垃圾回收，免得刚创建的长寿对象在 fork 前被挪进老一代、GC 头被反复改写
+    gc.disable()
+    app = preload()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    gc.collect()
+    gc.freeze()
+
+    workers: Dict[int, float] = {}
+    stopping = False
+    failed = False
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(max(1, args.workers)):
+        workers[spawn_worker(app, sock, args)] = time.monotonic()
+    logger.info(f"Serving on {args.host}:{args.port} with {len(workers)} pre-forked workers")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        if time.monotonic() - started < SERVE_MIN_UPTIME:
+            logger.error(f"Worker {pid} exited with {code} right after start, shutting down")
+            failed = True
+            stop(signal.SIGTERM, None)
+            continue
+        # 重启的 worker 同样从主进程 fork，仍然共享冻结的那份数据
+        logger.warning(f"Worker {pid} exited with {code}, restarting")
+        workers[spawn_worker(app, sock, args)] = time.monotonic()
+    sock.close()
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5, help="空闲 keep-alive 连接保留的秒数")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(process)d %(levelname)s %(message)s")
+    sys.exit(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from backend_fastapi.booking import SlotKey, slot_key
+from backend_fastapi.utils import fast_json
+
+SLOT_EVENTS_BUFFER = int(os.getenv("SLOT_EVENTS_BUFFER", "10000"))
+SLOT_STREAM_MAX_CLIENTS = int(os.getenv("SLOT_STREAM_MAX_CLIENTS", "5000"))
+SLOT_STREAM_COALESCE = float(os.getenv("SLOT_STREAM_COALESCE", "0.25"))
+SLOT_STREAM_HEARTBEAT = float(os.getenv("SLOT_STREAM_HEARTBEAT", "15"))
+# 连接最长保持时间，到期由服务端结束，客户端带 Last-Event-ID 重连；也让重启时不必等长连接自己断开
+SLOT_STREAM_MAX_AGE = float(os.getenv("SLOT_STREAM_MAX_AGE", "300"))
+SLOT_STREAM_RETRY_MS = 3000
+
+
+def sse_event(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\n".encode() + b"data: " + fast_json(data) + b"\n\n"
+
+
+def slot_change(key: SlotKey, remaining: int) -> Dict[str, Any]:
+    # 字段名与排班查询返回的行一致，客户端可以直接合并
+    return {"doctor_id": key[0], "schedule_date": key[1], "period": key[2], "remaining_slots": remaining}
+
+
+class SlotSubscriber:
+    __slots__ = ("doctor_ids", "start", "end", "pending", "last_seq", "wake")
+
+    def __init__(self, doctor_ids: Set[str], start: str, end: str) -> None:
+        self.doctor_ids = doctor_ids
+        self.start = start
+        self.end = end
+        # 合并更新：同一个号源只保留最新的剩余数
+        self.pending: Dict[SlotKey, int] = {}
+        self.last_seq = 0
+        self.wake = asyncio.Event()
+
+    def matches(self, key: SlotKey) -> bool:
+        return key[0] in self.doctor_ids and self.start <= key[1] <= self.end
+
+    def push(self, seq: int, key: SlotKey, remaining: int) -> None:
+        self.pending[key] = remaining
+        self.last_seq = seq
+        self.wake.set()
+
+    def drain(self) -> List[Dict[str, Any]]:
+        pending, self.pending = self.pending, {}
+        self.wake.clear()
+        return [slot_change(key, remaining) for key, remaining in sorted(pending.items())]
+
+
+class SlotBroadcaster:
+    """进程内的号源变更广播，供 SSE 推送使用。
+
+    AvailabilityIndex 每次写入号源时调用 publish；每条变更分配一个递增序号，
+    最近 buffer_size 条保留在环形缓冲里，客户端带 Last-Event-ID 重连时从缓冲补发，
+    缓冲已经覆盖不到（或 ID 来自别的进程、重启前）时改发全量快照。
+    多进程部署下其他进程的写入要等 AvailabilityIndex 定期重建时才会广播出来。
+    """
+
+    def __init__(self, buffer_size: int = SLOT_EVENTS_BUFFER, max_subscribers: int = SLOT_STREAM_MAX_CLIENTS) -> None:
+        self.epoch = f"{int(time.time() * 1000):x}"
+        self.max_subscribers = max_subscribers
+        self.seq = 0
+        self._buffer: Deque[Tuple[int, SlotKey, int]] = deque(maxlen=max(1, buffer_size))
+        self._by_doctor: Dict[str, Set[SlotSubscriber]] = {}
+        self.subscribers = 0
+        self.published = 0
+        self.resumed = 0
+
+    def publish(self, doctor_id: Any, schedule_date: Any, period: Any, remaining: int) -> None:
+        key = slot_key(doctor_id, schedule_date, period)
+        self.seq += 1
+        self.published += 1
+        self._buffer.append((self.seq, key, remaining))
+        for subscriber in self._by_doctor.get(key[0], ()):
+            if subscriber.matches(key):
+                subscriber.push(self.seq, key, remaining)
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def parse_event_id(self, value: Optional[str]) -> Optional[int]:
+        if not value:
+            return None
+        epoch, _, seq = value.strip().partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def ensure_capacity(self) -> None:
+        if self.subscribers >= self.max_subscribers:
+            raise HTTPException(status_code=503, detail="推送连接数已满，请稍后重试")
+
+    def subscribe(self, doctor_ids: Iterable[str], start: str, end: str, last_event_id: Optional[str] = None) -> Tuple[SlotSubscriber, bool]:
+        """返回 (订阅, 是否从 Last-Event-ID 续上)。没续上时需要先发一份快照。"""
+        subscriber = SlotSubscriber(set(doctor_ids), start, end)
+        subscriber.last_seq = self.seq
+        for doctor_id in subscriber.doctor_ids:
+            self._by_doctor.setdefault(doctor_id, set()).add(subscriber)
+        self.subscribers += 1
+        resumed = self._replay(subscriber, self.parse_event_id(last_event_id))
+        if resumed:
+            self.resumed += 1
+        return subscriber, resumed
+
+    def _replay(self, subscriber: SlotSubscriber, after: Optional[int]) -> bool:
+        if after is None or after > self.seq:
+            return False
+        oldest = self._buffer[0][0] if self._buffer else self.seq + 1
+        if after < oldest - 1:
+            return False
+        for seq, key, remaining in self._buffer:
+            if seq > after and subscriber.matches(key):
+                subscriber.push(seq, key, remaining)
+        subscriber.last_seq = self.seq
+        return True
+
+    def unsubscribe(self, subscriber: SlotSubscriber) -> None:
+        for doctor_id in subscriber.doctor_ids:
+            subscribers = self._by_doctor.get(doctor_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_doctor[doctor_id]
+        self.subscribers -= 1
+
+    async def stream(
+        self,
+        doctor_ids: Iterable[str],
+        start: str,
+        end: str,
+        last_event_id: Optional[str],
+        load_snapshot: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        coalesce: float = SLOT_STREAM_COALESCE,
+        heartbeat: float = SLOT_STREAM_HEARTBEAT,
+        max_age: float = SLOT_STREAM_MAX_AGE,
+    ) -> AsyncIterator[bytes]:
+        """SSE 字节流。订阅放在生成器里，客户端在开始输出前就断开也不会留下订阅。
+
+        先订阅再查快照，查询期间发生的变更会在快照之后补发，不会漏掉。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_age
+        subscriber, resumed = self.subscribe(doctor_ids, start, end, last_event_id)
+        # 快照的事件 ID 取订阅时的序号：快照发出后立刻断线重连，也会补发查询期间的变更
+        snapshot_seq = subscriber.last_seq
+        try:
+            yield f"retry: {SLOT_STREAM_RETRY_MS}\n\n".encode()
+            if not resumed:
+                snapshot = await load_snapshot()
+                yield sse_event("snapshot", {"schedules": snapshot}, self.event_id(snapshot_seq))
+            while True:
+                timeout = min(heartbeat, deadline - loop.time())
+                if timeout <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(subscriber.wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if coalesce > 0:
+                    # 放号高峰时短时间内会有一串变更，攒一下合成一条事件
+                    await asyncio.sleep(coalesce)
+                changes = subscriber.drain()
+                if changes:
+                    yield sse_event("slots", {"changes": changes}, self.event_id(subscriber.last_seq))
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self.subscribers,
+            "doctors": len(self._by_doctor),
+            "published": self.published,
+            "resumed": self.resumed,
+            "buffered": len(self._buffer),
+            "seq": self.seq,
+        }
+
+
+slot_broadcaster = SlotBroadcaster()
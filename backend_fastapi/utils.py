@@ -1,14 +1,26 @@
+import asyncio
 import base64
+import csv
+import functools
+import hashlib
+import json
+import math
+import multiprocessing
 import os
 import uuid
-from datetime import date, datetime
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import aiomysql
-from PIL import Image
-from qcloud_cos import CosConfig, CosS3Client
+import orjson
+
+# Pillow 和 COS SDK 只在管理端写头像时用到，导入要近 100ms，放到第一次使用时再导入
+if TYPE_CHECKING:
+    from PIL import Image
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 LEGACY_BACKEND_DIR = ROOT_DIR / "backend"
@@ -20,16 +32,46 @@ COS_SECRET_ID = os.getenv("COS_SECRET_ID")
 COS_SECRET_KEY = os.getenv("COS_SECRET_KEY")
 COS_FOLDER = os.getenv("COS_FOLDER", "avatars")
 
+IMAGE_WORKERS = max(1, int(os.getenv("IMAGE_WORKERS", "2")))
+_image_executor: Optional[ProcessPoolExecutor] = None
+_image_slots: Optional[asyncio.Semaphore] = None
+
 
-def load_default_avatar() -> str:
+@functools.lru_cache(maxsize=None)
+def default_avatar_bytes() -> bytes:
+    """第一次用到时读一次；预 fork 启动时在主进程里读好，worker 共享。"""
     try:
-        data = DEFAULT_AVATAR_PATH.read_bytes()
-        return base64.b64encode(data).decode()
-    except Exception:
-        return ""
+        return DEFAULT_AVATAR_PATH.read_bytes()
+    except OSError:
+        return b""
+
+
+@functools.lru_cache(maxsize=None)
+def default_avatar_base64() -> str:
+    return base64.b64encode(default_avatar_bytes()).decode()
+
 
+def content_etag(content: bytes) -> str:
+    return '"' + hashlib.sha1(content).hexdigest()[:20] + '"'
 
-DEFAULT_AVATAR_BASE64 = load_default_avatar()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """按 RFC 7232 的弱比较判断 If-None-Match 是否命中。"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def sniff_image_type(content: bytes) -> str:
+    if content.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if content.startswith(b"GIF8"):
+        return "image/gif"
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
 
 
 def normalize_avatar(value: Optional[str]) -> Optional[str]:
@@ -40,40 +82,94 @@ def normalize_avatar(value: Optional[str]) -> Optional[str]:
     ).replace("data:image/jpeg;base64,", "").strip()
 
 
+# 典型照片 JPEG 体积随质量变化的相对比例（以 q=90 为 1），用来估计第一次探测的质量
+_JPEG_SIZE_CURVE = ((90, 1.0), (80, 0.65), (70, 0.5), (60, 0.4), (50, 0.33), (40, 0.27))
+
+
+def _estimate_quality(points: List[Tuple[int, int]], limit_bytes: int) -> float:
+    """在已测得的 (质量, 体积) 点之间按对数体积线性插值，估计刚好达到上限的质量。"""
+    points = sorted(points)
+    for (q_low, size_low), (q_high, size_high) in zip(points, points[1:]):
+        if size_low <= limit_bytes <= size_high:
+            if size_high == size_low:
+                return float(q_low)
+            frac = math.log(limit_bytes / size_low) / math.log(size_high / size_low)
+            return q_low + (q_high - q_low) * frac
+    return float(points[0][0])
+
+
+def encode_jpeg_to_limit(
+    image: "Image.Image", limit_bytes: int, max_quality: int = 90, min_quality: int = 40, tolerance: int = 10
+) -> Tuple[bytes, int]:
+    """搜索不超过 limit_bytes 的最高 JPEG 质量，返回 (数据, 编码次数)。
+
+    先编码 max_quality；超限时用体积曲线估计下一个探测点，之后在已测点之间插值收敛，
+    探测点略偏向低质量一侧以便尽快落入上限内，体积达到上限的 95% 即停止。min_quality 仍超限时返回 min_quality
+    的结果，与原先 90→40 逐级降质量的行为一致。
+    """
+    buffer = BytesIO()
+    encodes = 0
+
+    def save_with_quality(q: int) -> bytes:
+        nonlocal encodes
+        encodes += 1
+        buffer.seek(0)
+        buffer.truncate(0)
+        image.save(buffer, format="JPEG", quality=q, optimize=True)
+        return buffer.getvalue()
+
+    data = save_with_quality(max_quality)
+    if len(data) <= limit_bytes:
+        return data, encodes
+
+    lo, hi = min_quality, max_quality
+    lo_data: Optional[bytes] = None
+    measured = [(max_quality, len(data))]
+    # 最低质量的体积未测时按曲线估计，保证插值总有下界
+    estimated_floor = (min_quality, int(len(data) * _JPEG_SIZE_CURVE[-1][1]))
+    curve = [(q, int(len(data) * ratio)) for q, ratio in _JPEG_SIZE_CURVE if min_quality < q < max_quality]
+    guide = curve
+    while hi - lo > tolerance:
+        floor = [] if lo_data is not None else [estimated_floor]
+        estimate = _estimate_quality(floor + guide + measured, limit_bytes)
+        q = min(hi - 1, max(lo + 1, int(estimate) - 1))
+        candidate = save_with_quality(q)
+        measured.append((q, len(candidate)))
+        guide = []
+        if len(candidate) <= limit_bytes:
+            lo, lo_data = q, candidate
+            if len(candidate) >= limit_bytes * 0.95:
+                # 已用满 95% 的体积预算，再提高质量收益很小
+                break
+        else:
+            hi = q
+    if lo_data is None:
+        lo_data = save_with_quality(min_quality)
+    return lo_data, encodes
+
+
 def compress_image_to_limit(image_bytes: bytes, limit_bytes: int = 100 * 1024) -> bytes:
-    """压缩图片至限定大小，优先降质量，必要时缩放。"""
+    """压缩图片至限定大小，必要时缩放，再搜索满足上限的最高质量。"""
+    from PIL import Image
+
     try:
         image = Image.open(BytesIO(image_bytes))
     except Exception:
         return image_bytes
 
-    if image.mode not in ("RGB", "RGBA"):
-        image = image.convert("RGB")
-
     max_side = max(image.size)
+    # 已经是合规 JPEG（例如上传 COS 前的二次压缩）时直接返回
+    if image.format == "JPEG" and max_side <= 800 and len(image_bytes) <= limit_bytes:
+        return image_bytes
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
     if max_side > 800:
         ratio = 800 / float(max_side)
         new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
         image = image.resize(new_size, Image.LANCZOS)
 
-    quality = 90
-    step = 10
-    min_quality = 40
-    buffer = BytesIO()
-
-    def save_with_quality(q: int) -> Tuple[bytes, int]:
-        buffer.seek(0)
-        buffer.truncate(0)
-        img_to_save = image.convert("RGB")
-        img_to_save.save(buffer, format="JPEG", quality=q, optimize=True)
-        data = buffer.getvalue()
-        return data, len(data)
-
-    data, size = save_with_quality(quality)
-    while size > limit_bytes and quality > min_quality:
-        quality -= step
-        data, size = save_with_quality(quality)
-
+    data, _ = encode_jpeg_to_limit(image, limit_bytes)
     return data
 
 
@@ -90,8 +186,43 @@ def process_avatar_payload(raw_value: Optional[str]) -> Optional[str]:
     return base64.b64encode(compressed).decode()
 
 
+def get_image_executor() -> ProcessPoolExecutor:
+    """图片解码/缩放/编码是纯 CPU 工作，放到独立进程池里，避免阻塞事件循环。"""
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _image_executor
+
+
+def shutdown_image_executor() -> None:
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=False, cancel_futures=True)
+        _image_executor = None
+
+
+async def process_avatar_payload_async(raw_value: Optional[str]) -> Optional[str]:
+    global _image_slots
+    if _image_slots is None:
+        _image_slots = asyncio.Semaphore(IMAGE_WORKERS * 2)
+    async with _image_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_image_executor(), process_avatar_payload, raw_value)
+
+
+async def upload_avatar_to_cos_async(base64_data: str) -> str:
+    """COS 上传是阻塞的网络 I/O，放到默认线程池执行。"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, upload_avatar_to_cos, base64_data)
+
+
+async def delete_avatar_from_cos_async(avatar_url: str) -> None:
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, delete_avatar_from_cos, avatar_url)
+
+
 def to_avatar_data_uri(value: Any) -> Optional[str]:
-    if value is None and not DEFAULT_AVATAR_BASE64:
+    if value is None and not default_avatar_base64():
         return None
     base = ""
     if isinstance(value, (bytes, bytearray)):
@@ -99,7 +230,7 @@ def to_avatar_data_uri(value: Any) -> Optional[str]:
     elif isinstance(value, str):
         base = value.strip()
     if not base:
-        base = DEFAULT_AVATAR_BASE64
+        base = default_avatar_base64()
     return f"data:image/png;base64,{base}" if base else None
 
 
@@ -149,15 +280,121 @@ async def fetch_one(sql: str, params: Optional[List[Any]], pool: aiomysql.Pool)
             return await cur.fetchone()
 
 
-def upload_avatar_to_cos(base64_data: str) -> str:
+async def stream_rows(
+    sql: str, params: Optional[List[Any]], pool: aiomysql.Pool, chunk_size: int = 500
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """用服务端游标（SSDictCursor）分块读取结果，内存占用与结果集大小无关。"""
+    async with pool.acquire() as conn:
+        cur = await conn.cursor(aiomysql.SSDictCursor)
+        try:
+            await cur.execute(sql, params or [])
+            while True:
+                rows = await cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        except BaseException:
+            # 客户端中途断开时直接关闭连接，否则关闭游标会把剩余结果全部读完
+            conn.close()
+            raise
+        await cur.close()
+
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def fast_json(content: Any) -> bytes:
+    """orjson 原生处理 date/datetime，Decimal 等交给 json_default，结果与 jsonable_encoder 一致。"""
+    return orjson.dumps(content, default=json_default)
+
+
+async def ndjson_chunks(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield b"".join(orjson.dumps(row, default=json_default, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+def ndjson_stream(sql: str, params: Optional[List[Any]], pool: aiomysql.Pool) -> AsyncIterator[bytes]:
+    return ndjson_chunks(stream_rows(sql, params, pool))
+
+
+# 以这些字符开头的文本在 Excel 里会被当成公式
+_CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_cell(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, str) and value.startswith(_CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def csv_chunks(chunks: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    """按块输出 CSV：先发带 BOM 的表头（Excel 才能认出 UTF-8），之后每块行编码一次。"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield b"\xef\xbb\xbf" + buffer.getvalue().encode()
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([csv_cell(row.get(column)) for column in columns] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """把排序键编码成不透明的分页游标。"""
+    raw = json.dumps(values, separators=(",", ":"), default=json_default).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _cos_client() -> Any:
     if not (COS_BUCKET and COS_REGION and COS_SECRET_ID and COS_SECRET_KEY):
         raise RuntimeError("COS config missing (COS_BUCKET/COS_REGION/COS_SECRET_ID/COS_SECRET_KEY)")
+    from qcloud_cos import CosConfig, CosS3Client
+
+    return CosS3Client(
+        CosConfig(Region=COS_REGION, SecretId=COS_SECRET_ID, SecretKey=COS_SECRET_KEY, Scheme="https")
+    )
+
+
+def _cos_url_prefix() -> str:
+    return f"https://{COS_BUCKET}.cos.{COS_REGION}.myqcloud.com/"
+
+
+def upload_avatar_to_cos(base64_data: str) -> str:
+    client = _cos_client()
     decoded = base64.b64decode(base64_data)
     # 使用压缩后的数据
     compressed = compress_image_to_limit(decoded)
-    client = CosS3Client(
-        CosConfig(Region=COS_REGION, SecretId=COS_SECRET_ID, SecretKey=COS_SECRET_KEY, Scheme="https")
-    )
     key = f"{COS_FOLDER.rstrip('/')}/{uuid.uuid4().hex}.jpg"
     client.put_object(Bucket=COS_BUCKET, Body=compressed, Key=key)
-    return f"https://{COS_BUCKET}.cos.{COS_REGION}.myqcloud.com/{key}"
+    return _cos_url_prefix() + key
+
+
+def delete_avatar_from_cos(avatar_url: str) -> None:
+    """删除 upload_avatar_to_cos 上传的对象；不是本桶的地址直接忽略。"""
+    prefix = _cos_url_prefix()
+    if not avatar_url.startswith(prefix):
+        return
+    _cos_client().delete_object(Bucket=COS_BUCKET, Key=avatar_url[len(prefix) :])
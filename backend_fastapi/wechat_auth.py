@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from backend_fastapi.wechat_bot import get_http_client
+
+# 提前于 expires_in 刷新，避免临界时刻拿到刚好过期的 token
+TOKEN_REFRESH_MARGIN = float(os.getenv("WECHAT_TOKEN_REFRESH_MARGIN", "300"))
+TOKEN_URL = "https://api.weixin.qq.com/cgi-bin/token"
+# 40001：access_token 无效；40014：不合法的 access_token；42001：access_token 超时
+INVALID_TOKEN_ERRCODES = {40001, 40014, 42001}
+
+
+class WechatTokenError(Exception):
+    pass
+
+
+class AccessTokenManager:
+    """缓存小程序 access_token，并发刷新时只有一个请求真正访问微信接口（single-flight）。"""
+
+    def __init__(self, app_id: str, app_secret: str, refresh_margin: float = TOKEN_REFRESH_MARGIN) -> None:
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self.refreshes = 0
+
+    def _valid(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at
+
+    async def get_token(self) -> str:
+        if self._valid():
+            return self._token  # type: ignore[return-value]
+        async with self._lock:
+            # 排队期间别的请求可能已经刷新好了
+            if self._valid():
+                return self._token  # type: ignore[return-value]
+            return await self._refresh()
+
+    async def _refresh(self) -> str:
+        resp = await get_http_client().get(
+            TOKEN_URL,
+            params={"grant_type": "client_credential", "appid": self.app_id, "secret": self.app_secret},
+        )
+        data = resp.json()
+        if data.get("errcode") or not data.get("access_token"):
+            raise WechatTokenError(data.get("errmsg", "Failed to get access token"))
+        expires_in = float(data.get("expires_in") or 7200)
+        self._token = data["access_token"]
+        self._expires_at = time.monotonic() + max(0.0, expires_in - self.refresh_margin)
+        self.refreshes += 1
+        return self._token
+
+    def invalidate(self, token: str) -> None:
+        """微信返回 token 失效时调用；只作废仍是当前值的 token，避免覆盖别人刚刷新的结果。"""
+        if self._token == token:
+            self._token = None
+            self._expires_at = 0.0
+
+
+_managers: Dict[Tuple[str, str], AccessTokenManager] = {}
+
+
+def get_access_token_manager(app_id: str, app_secret: str) -> AccessTokenManager:
+    key = (app_id, app_secret)
+    manager = _managers.get(key)
+    if manager is None:
+        manager = _managers[key] = AccessTokenManager(app_id, app_secret)
+    return manager
@@ -1,5 +1,95 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
 import httpx
 
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_ENQUEUE_TIMEOUT = float(os.getenv("NOTIFY_ENQUEUE_TIMEOUT", "0.5"))
+NOTIFY_BATCH_WINDOW = float(os.getenv("NOTIFY_BATCH_WINDOW", "1.0"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+# 同时跟踪的 webhook 上限；webhook 地址来自请求体，不设上限时随便换地址就能让内存一直涨
+NOTIFY_MAX_WEBHOOKS = int(os.getenv("NOTIFY_MAX_WEBHOOKS", "256"))
+# 企业微信群机器人限制：每个 webhook 每分钟最多 20 条
+WEBHOOK_RATE_LIMIT = 20
+WEBHOOK_RATE_PERIOD = 60.0
+# 企业微信消息内容上限（UTF-8 字节）
+CONTENT_LIMITS = {"text": 2048, "markdown": 4096}
+# 45009：接口调用超过限制；-1：系统繁忙
+RETRYABLE_ERRCODES = {45009, -1}
+
+logger = logging.getLogger(__name__)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """进程内共享的 HTTP 客户端，复用 TCP/TLS 连接。"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class WechatAPIError(ValueError):
+    def __init__(self, errcode: Any, errmsg: Any) -> None:
+        super().__init__(f"企业微信API错误: {errmsg} (errcode: {errcode})")
+        self.errcode = errcode
+
+
+def text_payload(content: str, mentioned_list=None, mentioned_mobile_list=None) -> dict:
+    return {
+        "msgtype": "text",
+        "text": {
+            "content": content,
+            "mentioned_list": mentioned_list or [],
+            "mentioned_mobile_list": mentioned_mobile_list or [],
+        },
+    }
+
+
+def markdown_payload(content: str) -> dict:
+    return {"msgtype": "markdown", "markdown": {"content": content}}
+
+
+def booking_notification_payload(booking_info: dict, mention_all: bool = True) -> dict:
+    order_number = booking_info.get("orderNumber")
+    project_name = booking_info.get("projectName")
+    phone = booking_info.get("phone")
+    message = booking_info.get("message")
+    submit_time = booking_info.get("submitTime")
+    content = (
+        f"【今日第 {order_number} 单】\n"
+        f"项目：{project_name}\n"
+        f"电话：{phone}\n"
+        f"留言：{message}\n\n"
+        f"提交时间：{submit_time}"
+    )
+    mentioned = ["@all"] if mention_all else []
+    return text_payload(content, mentioned_list=mentioned)
+
+
+async def post_webhook(webhook_url: str, payload: dict) -> dict:
+    resp = await get_http_client().post(webhook_url, json=payload)
+    data = resp.json()
+    if data.get("errcode") != 0:
+        raise WechatAPIError(data.get("errcode"), data.get("errmsg"))
+    return data
+
 
 class WechatBot:
     def __init__(self, webhook_url: str) -> None:
@@ -8,40 +98,180 @@ class WechatBot:
         self.webhook_url = webhook_url
 
     async def _post(self, payload: dict) -> dict:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(self.webhook_url, json=payload)
-            data = resp.json()
-            if data.get("errcode") != 0:
-                raise ValueError(f"企业微信API错误: {data.get('errmsg')} (errcode: {data.get('errcode')})")
-            return data
+        return await post_webhook(self.webhook_url, payload)
 
     async def send_text(self, content: str, mentioned_list=None, mentioned_mobile_list=None) -> dict:
-        payload = {
-            "msgtype": "text",
-            "text": {
-                "content": content,
-                "mentioned_list": mentioned_list or [],
-                "mentioned_mobile_list": mentioned_mobile_list or [],
-            },
-        }
-        return await self._post(payload)
+        return await self._post(text_payload(content, mentioned_list, mentioned_mobile_list))
 
     async def send_markdown(self, content: str) -> dict:
-        payload = {"msgtype": "markdown", "markdown": {"content": content}}
-        return await self._post(payload)
+        return await self._post(markdown_payload(content))
 
     async def send_booking_notification(self, booking_info: dict, mention_all: bool = True) -> dict:
-        order_number = booking_info.get("orderNumber")
-        project_name = booking_info.get("projectName")
-        phone = booking_info.get("phone")
-        message = booking_info.get("message")
-        submit_time = booking_info.get("submitTime")
-        content = (
-            f"【今日第 {order_number} 单】\n"
-            f"项目：{project_name}\n"
-            f"电话：{phone}\n"
-            f"留言：{message}\n\n"
-            f"提交时间：{submit_time}"
-        )
-        mentioned = ["@all"] if mention_all else []
-        return await self.send_text(content, mentioned_list=mentioned)
+        return await self._post(booking_notification_payload(booking_info, mention_all))
+
+
+def merge_payloads(payloads: List[dict]) -> List[dict]:
+    """把同一 webhook 的一批消息合并：相邻的同类型消息拼成一条，超过长度上限时拆开。"""
+    merged: List[dict] = []
+    for payload in payloads:
+        msgtype = payload.get("msgtype")
+        last = merged[-1] if merged else None
+        if last is None or msgtype not in CONTENT_LIMITS or last.get("msgtype") != msgtype:
+            merged.append(_copy_payload(payload))
+            continue
+        body, new_body = last[msgtype], payload[msgtype]
+        content = f"{body['content']}\n\n{new_body['content']}"
+        if len(content.encode()) > CONTENT_LIMITS[msgtype]:
+            merged.append(_copy_payload(payload))
+            continue
+        body["content"] = content
+        if msgtype == "text":
+            for field in ("mentioned_list", "mentioned_mobile_list"):
+                for item in new_body.get(field) or []:
+                    if item not in body[field]:
+                        body[field].append(item)
+    return merged
+
+
+def _copy_payload(payload: dict) -> dict:
+    msgtype = payload.get("msgtype")
+    if msgtype not in CONTENT_LIMITS:
+        return payload
+    body = dict(payload[msgtype])
+    if msgtype == "text":
+        body["mentioned_list"] = list(body.get("mentioned_list") or [])
+        body["mentioned_mobile_list"] = list(body.get("mentioned_mobile_list") or [])
+    return {"msgtype": msgtype, msgtype: body}
+
+
+class NotificationQueue:
+    """异步通知队列：接口只负责入队，按 webhook 攒批、限速、带抖动重试后投递。
+
+    同一 webhook 在 batch_window 内到达的消息合并发送；被限速期间继续到达的消息
+    也会在下一次发送时合并。队列总长度有上限，满了以后 enqueue 最多等待
+    enqueue_timeout 秒，仍无空位则抛出 asyncio.QueueFull。
+    webhook 的消息发完、限速窗口也过了之后不再跟踪；同时跟踪的 webhook 达到 max_webhooks 时，
+    新的 webhook 同样抛出 asyncio.QueueFull。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = NOTIFY_QUEUE_SIZE,
+        batch_window: float = NOTIFY_BATCH_WINDOW,
+        max_retries: int = NOTIFY_MAX_RETRIES,
+        enqueue_timeout: float = NOTIFY_ENQUEUE_TIMEOUT,
+        max_webhooks: int = NOTIFY_MAX_WEBHOOKS,
+    ) -> None:
+        self.maxsize = maxsize
+        self.max_webhooks = max(1, max_webhooks)
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.enqueue_timeout = enqueue_timeout
+        self._buffers: Dict[str, List[dict]] = {}
+        self._senders: Dict[str, asyncio.Task] = {}
+        self._sent_at: Dict[str, Deque[float]] = {}
+        self._pending = 0
+        self._space: Optional[asyncio.Condition] = None
+        # enqueued/flushed 按入队的单条通知计数，requests/retries/failed 按实际发出的（合并后）请求计数
+        self.stats: Dict[str, int] = {"enqueued": 0, "flushed": 0, "requests": 0, "retries": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def enqueue(self, webhook_url: str, payload: dict) -> None:
+        if webhook_url not in self._senders and webhook_url not in self._sent_at and self._tracked() >= self.max_webhooks:
+            self._prune()
+            if self._tracked() >= self.max_webhooks:
+                self.stats["rejected"] += 1
+                raise asyncio.QueueFull()
+        if self._space is None:
+            self._space = asyncio.Condition()
+        if self._pending >= self.maxsize:
+            async with self._space:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self._pending < self.maxsize), self.enqueue_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.stats["rejected"] += 1
+                    raise asyncio.QueueFull()
+        self._pending += 1
+        self.stats["enqueued"] += 1
+        self._buffers.setdefault(webhook_url, []).append(payload)
+        if webhook_url not in self._senders:
+            self._senders[webhook_url] = asyncio.create_task(self._drain(webhook_url))
+
+    async def _release(self, count: int) -> None:
+        self._pending -= count
+        if self._space is not None:
+            async with self._space:
+                self._space.notify_all()
+
+    async def _drain(self, webhook_url: str) -> None:
+        try:
+            while self._buffers.get(webhook_url):
+                await asyncio.sleep(self.batch_window)
+                await self._wait_rate_limit(webhook_url)
+                payloads = self._buffers.pop(webhook_url, [])
+                await self._release(len(payloads))
+                messages = merge_payloads(payloads)
+                for index, message in enumerate(messages):
+                    if index:
+                        await self._wait_rate_limit(webhook_url)
+                    await self._deliver(webhook_url, message)
+                self.stats["flushed"] += len(payloads)
+        finally:
+            self._senders.pop(webhook_url, None)
+            self._prune()
+
+    def _tracked(self) -> int:
+        return len(self._senders.keys() | self._sent_at.keys())
+
+    def _prune(self) -> None:
+        """去掉没有待发消息、限速窗口也已经过去的 webhook。"""
+        expired = time.monotonic() - WEBHOOK_RATE_PERIOD
+        for webhook_url in [url for url, sent_at in self._sent_at.items() if not sent_at or sent_at[-1] < expired]:
+            if webhook_url not in self._senders:
+                del self._sent_at[webhook_url]
+
+    async def _wait_rate_limit(self, webhook_url: str) -> None:
+        sent_at = self._sent_at.setdefault(webhook_url, deque(maxlen=WEBHOOK_RATE_LIMIT))
+        if len(sent_at) == WEBHOOK_RATE_LIMIT:
+            wait = WEBHOOK_RATE_PERIOD - (time.monotonic() - sent_at[0])
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _deliver(self, webhook_url: str, payload: dict) -> None:
+        for attempt in range(self.max_retries + 1):
+            self._sent_at.setdefault(webhook_url, deque(maxlen=WEBHOOK_RATE_LIMIT)).append(time.monotonic())
+            try:
+                await post_webhook(webhook_url, payload)
+                self.stats["requests"] += 1
+                return
+            except WechatAPIError as e:
+                if e.errcode not in RETRYABLE_ERRCODES or attempt == self.max_retries:
+                    break
+            except (httpx.HTTPError, ValueError):
+                if attempt == self.max_retries:
+                    break
+            self.stats["retries"] += 1
+            # 指数退避 + 全抖动
+            await asyncio.sleep(random.uniform(0, min(30.0, 0.5 * 2**attempt)))
+            await self._wait_rate_limit(webhook_url)
+        self.stats["failed"] += 1
+        logger.warning(f"Deliver wechat notification failed: webhook={webhook_url[-8:]} msgtype={payload.get('msgtype')}")
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """停机时尽量把已入队的消息发完，超时后放弃。"""
+        senders = list(self._senders.values())
+        if senders:
+            _, pending = await asyncio.wait(senders, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": self._pending, "webhooks": len(self._senders), "trackedWebhooks": self._tracked()}
+
+
+notification_queue = NotificationQueue()
@@ -0,0 +1,94 @@
+"""头像压缩微基准：原先的 90→40 逐级降质量 vs 当前按体积曲线插值的质量搜索。
+
+    python -m benchmarks.avatar_compress [--rounds 3] [--json out.json]
+
+输入是合成图片（渐变 + 噪声块），覆盖小图、手机原图和大尺寸照片。
+"""
+import argparse
+import json
+import random
+import time
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from backend_fastapi.utils import encode_jpeg_to_limit
+
+LIMIT_BYTES = 100 * 1024
+
+
+def legacy_encode(image: Image.Image, limit_bytes: int) -> Tuple[bytes, int]:
+    quality, step, min_quality = 90, 10, 40
+    buffer = BytesIO()
+    encodes = 0
+
+    def save_with_quality(q: int) -> bytes:
+        nonlocal encodes
+        encodes += 1
+        buffer.seek(0)
+        buffer.truncate(0)
+        image.convert("RGB").save(buffer, format="JPEG", quality=q, optimize=True)
+        return buffer.getvalue()
+
+    data = save_with_quality(quality)
+    while len(data) > limit_bytes and quality > min_quality:
+        quality -= step
+        data = save_with_quality(quality)
+    return data, encodes
+
+
+def synthetic_image(width: int, height: int, noise: float, seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noisy = Image.effect_noise((width, height), 64 * noise + 1).convert("RGB")
+    image = Image.blend(base, noisy, min(1.0, noise))
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        image.paste(color, (x, y, min(width, x + width // 6), min(height, y + height // 6)))
+    return image
+
+
+def prepare(image: Image.Image) -> Image.Image:
+    # 与 compress_image_to_limit 相同的预处理：统一 RGB、最长边缩到 800
+    image = image.convert("RGB")
+    max_side = max(image.size)
+    if max_side > 800:
+        ratio = 800 / float(max_side)
+        image = image.resize((int(image.size[0] * ratio), int(image.size[1] * ratio)), Image.LANCZOS)
+    return image
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    cases = [
+        ("small-clean", 480, 480, 0.05),
+        ("phone-mixed", 1200, 1600, 0.5),
+        ("phone-busy", 1200, 1600, 0.7),
+        ("photo-noisy", 3000, 4000, 0.9),
+        ("noise-only", 800, 800, 1.0),
+    ]
+    results: List[Dict[str, Any]] = []
+    for index, (name, width, height, noise) in enumerate(cases):
+        image = prepare(synthetic_image(width, height, noise, seed=index))
+        for label, encoder in (("legacy", legacy_encode), ("search", encode_jpeg_to_limit)):
+            began = time.perf_counter()
+            for _ in range(args.rounds):
+                data, encodes = encoder(image, LIMIT_BYTES)
+            elapsed = (time.perf_counter() - began) / args.rounds
+            results.append(
+                {"case": name, "encoder": label, "encodes": encodes, "bytes": len(data), "wallMs": round(elapsed * 1000, 2)}
+            )
+            print(f"{name:>12} {label:>6}: encodes={encodes} bytes={len(data):>6} wall={elapsed * 1000:7.2f}ms")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""抢号基准：N 个并发请求抢同一个排班行。
+
+    python -m benchmarks.booking_storm                 # 进程内 MySQL 替身
+    python -m benchmarks.booking_storm --mysql         # 使用 DB_* 环境变量指向的真实 MySQL
+
+对比两条路径：
+- legacy：SELECT ... FOR UPDATE → UPDATE → INSERT → COMMIT → 另取连接回读
+- current：routers.appointments.book_appointment（条件扣减 + 进程内准入）
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List
+
+from fastapi import HTTPException
+
+from backend_fastapi.booking import slot_admission
+from backend_fastapi.routers.appointments import book_appointment
+from backend_fastapi.utils import fetch_one
+from benchmarks.standin import StandInPool
+
+
+async def legacy_create_appointment(body: Dict[str, Any], pool: Any) -> Dict[str, Any]:
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    SELECT * FROM doctor_schedules
+                    WHERE doctor_id = %s AND schedule_date = %s AND period = %s
+                    FOR UPDATE
+                    """,
+                    [body["doctorId"], body["scheduleDate"], body["period"]],
+                )
+                schedule = await cur.fetchone()
+                if not schedule:
+                    raise HTTPException(status_code=400, detail="该时段暂无号源")
+                if schedule["remaining_slots"] <= 0:
+                    raise HTTPException(status_code=400, detail="该时段号源已满")
+                await cur.execute(
+                    "UPDATE doctor_schedules SET remaining_slots = remaining_slots - 1 WHERE id = %s",
+                    [schedule["id"]],
+                )
+                await cur.execute(
+                    """
+                    INSERT INTO appointments
+                    (doctor_id, doctor_name, schedule_date, period, patient_name, patient_phone, status)
+                    VALUES (%s, %s, %s, %s, %s, %s, 'pending')
+                    """,
+                    [
+                        body["doctorId"],
+                        body["doctorName"],
+                        body["scheduleDate"],
+                        body["period"],
+                        body["patientName"],
+                        body["patientPhone"],
+                    ],
+                )
+                new_id = cur.lastrowid
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    appointment = await fetch_one("SELECT * FROM appointments WHERE id = %s", [new_id], pool)
+    return {"success": True, "appointment": appointment}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def storm(
+    name: str,
+    book: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+    pool: Any,
+    schedule: Dict[str, Any],
+    concurrency: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    outcomes = {"booked": 0, "rejected": 0, "errors": 0}
+    start_gate = asyncio.Event()
+
+    async def one(i: int) -> None:
+        body = dict(schedule, patientName=f"压测{i}", patientPhone=f"139{i:08d}", doctorName="压测医生")
+        await start_gate.wait()
+        began = time.perf_counter()
+        try:
+            await book(body, pool)
+            outcomes["booked"] += 1
+        except HTTPException:
+            outcomes["rejected"] += 1
+        except Exception:
+            outcomes["errors"] += 1
+        latencies.append(time.perf_counter() - began)
+
+    tasks = [asyncio.create_task(one(i)) for i in range(concurrency)]
+    await asyncio.sleep(0)
+    began = time.perf_counter()
+    start_gate.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - began
+    return {
+        "path": name,
+        "requests": concurrency,
+        **outcomes,
+        "elapsedSec": round(elapsed, 4),
+        "bookingsPerSec": round(outcomes["booked"] / elapsed, 1) if elapsed else 0.0,
+        "requestsPerSec": round(concurrency / elapsed, 1) if elapsed else 0.0,
+        "p50Ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99Ms": round(percentile(latencies, 99) * 1000, 2),
+        "maxMs": round(max(latencies) * 1000, 2),
+    }
+
+
+async def run_standin(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    for name, book in (("legacy", legacy_create_appointment), ("current", _current)):
+        pool = StandInPool(maxsize=args.pool_size, rtt=args.rtt_ms / 1000.0)
+        schedule = {"doctorId": "bench-doctor", "scheduleDate": date.today().isoformat(), "period": "上午"}
+        pool.db.add_schedule(schedule["doctorId"], schedule["scheduleDate"], schedule["period"], args.slots)
+        slot_admission.reset()
+        result = await storm(name, book, pool, schedule, args.concurrency)
+        result["statements"] = pool.statements
+        results.append(result)
+    return results
+
+
+async def run_mysql(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from backend_fastapi.db import init_db_pool
+
+    pool = await init_db_pool()
+    doctor_id = str(uuid.uuid4())
+    schedule = {"doctorId": doctor_id, "scheduleDate": (date.today() + timedelta(days=1)).isoformat(), "period": "上午"}
+    results = []
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("INSERT INTO doctors (doctor_id, name) VALUES (%s, %s)", [doctor_id, "压测医生"])
+        for name, book in (("legacy", legacy_create_appointment), ("current", _current)):
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("DELETE FROM appointments WHERE doctor_id = %s", [doctor_id])
+                    await cur.execute(
+                        """
+                        INSERT INTO doctor_schedules (doctor_id, schedule_date, period, total_slots, remaining_slots)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE total_slots=VALUES(total_slots), remaining_slots=VALUES(remaining_slots)
+                        """,
+                        [doctor_id, schedule["scheduleDate"], schedule["period"], args.slots, args.slots],
+                    )
+            slot_admission.reset()
+            results.append(await storm(name, book, pool, schedule, args.concurrency))
+    finally:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM doctors WHERE doctor_id = %s", [doctor_id])
+        pool.close()
+        await pool.wait_closed()
+    return results
+
+
+async def _current(body: Dict[str, Any], pool: Any) -> Any:
+    return await book_appointment(body, pool)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--slots", type=int, default=30, help="排班行的号源数")
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="替身模式下每条语句的往返耗时")
+    parser.add_argument("--mysql", action="store_true", help="使用真实 MySQL（DB_* 环境变量）")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_mysql(args) if args.mysql else run_standin(args))
+    for result in results:
+        print(
+            f"{result['path']:>8}: booked={result['booked']} rejected={result['rejected']} errors={result['errors']} "
+            f"elapsed={result['elapsedSec']}s bookings/s={result['bookingsPerSec']} "
+            f"p50={result['p50Ms']}ms p99={result['p99Ms']}ms max={result['maxMs']}ms"
+        )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
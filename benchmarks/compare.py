@@ -0,0 +1,67 @@
+"""对比两次 benchmarks.load 的结果，标出退化的场景。
+
+    python -m benchmarks.compare base.json new.json [--threshold 0.10] [--min-ms 1.0]
+
+吞吐（rps）下降或 p50/p99 延迟上升超过 threshold（相对值）即视为退化；延迟的绝对差
+小于 --min-ms 时忽略，避免亚毫秒级的抖动误报。出现 5xx/连接错误增多也算退化。
+有退化时退出码为 1，可以直接放进 CI。
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+# (字段, 越大越好)
+METRICS: List[Tuple[str, bool]] = [("rps", True), ("p50Ms", False), ("p99Ms", False)]
+
+
+def load(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path, encoding="utf-8") as fh:
+        report = json.load(fh)
+    return {result["scenario"]: result for result in report["results"]}
+
+
+def compare(
+    base: Dict[str, Dict[str, Any]], new: Dict[str, Dict[str, Any]], threshold: float, min_ms: float
+) -> Tuple[List[str], List[str]]:
+    lines: List[str] = []
+    regressions: List[str] = []
+    for scenario in sorted(set(base) | set(new)):
+        if scenario not in base or scenario not in new:
+            lines.append(f"{scenario:>16}: only in {'base' if scenario in base else 'new'}")
+            continue
+        old, cur = base[scenario], new[scenario]
+        cells = []
+        for field, higher_is_better in METRICS:
+            before, after = float(old.get(field) or 0), float(cur.get(field) or 0)
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            flagged = worse > threshold and (higher_is_better or after - before >= min_ms)
+            cells.append(f"{field} {before:g}→{after:g} ({change:+.1%}){' !' if flagged else ''}")
+            if flagged:
+                regressions.append(f"{scenario} {field} {change:+.1%}")
+        if cur.get("errors", 0) > old.get("errors", 0):
+            regressions.append(f"{scenario} errors {old.get('errors', 0)}→{cur['errors']}")
+            cells.append(f"errors {old.get('errors', 0)}→{cur['errors']} !")
+        lines.append(f"{scenario:>16}: " + "  ".join(cells))
+    return lines, regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--min-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    lines, regressions = compare(load(args.base), load(args.new), args.threshold, args.min_ms)
+    print("\n".join(lines))
+    if regressions:
+        print("\nregressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
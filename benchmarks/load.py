@@ -0,0 +1,292 @@
+"""HTTP 压测：启动 backend_fastapi.app:app，按脚本化场景打请求，输出吞吐和延迟。
+
+    python -m benchmarks.load                                  # 启动 uvicorn，连 DB_* 指向的 MySQL（先跑 benchmarks.seed）
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 # 压已经在跑的服务
+    python -m benchmarks.load --standin                        # 进程内 + MySQL 替身，只支持 booking-storm
+    python -m benchmarks.load --scenarios doctor-list,search --duration 20 --json run.json
+
+场景：
+- booking-storm：--storm-requests 个请求同时抢同一个排班行（开跑前把号源重置为 --storm-slots）
+- doctor-list：首页医生列表
+- search：按擅长关键词搜医生
+- admin-schedules：管理端按 7 天日期范围分页看排班
+- avatar：取医生头像（外链头像返回 302，不跟随）
+- phone-lookup：按手机号查预约
+
+其余场景是闭环压测：--concurrency 个客户端在 --duration 秒内连续发请求，前 --warmup 秒不计入。
+两次结果用 python -m benchmarks.compare 对比。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from backend_fastapi.metrics import LatencyHistogram
+from benchmarks.seed import KEYWORDS, doctor_id, phone, storm_slot
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+def doctor_list(rng: random.Random, args: argparse.Namespace) -> Request:
+    return "GET", "/api/doctors", None
+
+
+def search(rng: random.Random, args: argparse.Namespace) -> Request:
+    return "GET", f"/api/doctors?keyword={rng.choice(KEYWORDS)}", None
+
+
+def admin_schedules(rng: random.Random, args: argparse.Namespace) -> Request:
+    start = date.today() + timedelta(days=rng.randrange(max(1, args.days - 7)))
+    end = start + timedelta(days=6)
+    return "GET", f"/api/admin/schedules?startDate={start}&endDate={end}&limit=200", None
+
+
+def avatar(rng: random.Random, args: argparse.Namespace) -> Request:
+    return "GET", f"/api/doctors/{doctor_id(rng.randrange(args.doctors))}/avatar", None
+
+
+def phone_lookup(rng: random.Random, args: argparse.Namespace) -> Request:
+    return "GET", f"/api/appointments?phone={phone(rng.randrange(args.phones))}&limit=20", None
+
+
+CLOSED_LOOP: Dict[str, Callable[[random.Random, argparse.Namespace], Request]] = {
+    "doctor-list": doctor_list,
+    "search": search,
+    "admin-schedules": admin_schedules,
+    "avatar": avatar,
+    "phone-lookup": phone_lookup,
+}
+SCENARIOS = ["booking-storm", *CLOSED_LOOP]
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+
+    async def send(self, client: httpx.AsyncClient, request: Request, record: bool = True) -> None:
+        method, url, body = request
+        began = time.perf_counter()
+        try:
+            resp = await client.request(method, url, json=body)
+            status = str(resp.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        if not record:
+            return
+        self.latency.record(time.perf_counter() - began)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not status.isdigit() or int(status) >= 500:
+            self.errors += 1
+
+    def result(self, scenario: str, elapsed: float, **extra: Any) -> Dict[str, Any]:
+        latency = self.latency
+        return {
+            "scenario": scenario,
+            "requests": latency.count,
+            "errors": self.errors,
+            "statuses": dict(sorted(self.statuses.items())),
+            "durationSec": round(elapsed, 3),
+            "rps": round(latency.count / elapsed, 1) if elapsed else 0.0,
+            "p50Ms": round(latency.percentile(50) * 1000, 2),
+            "p90Ms": round(latency.percentile(90) * 1000, 2),
+            "p99Ms": round(latency.percentile(99) * 1000, 2),
+            "maxMs": round(latency.max * 1000, 2),
+            **extra,
+        }
+
+
+async def run_closed_loop(client: httpx.AsyncClient, name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    build = CLOSED_LOOP[name]
+    recorder = Recorder()
+    loop = asyncio.get_running_loop()
+    measure_from = loop.time() + args.warmup
+    deadline = measure_from + args.duration
+
+    async def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        while loop.time() < deadline:
+            await recorder.send(client, build(rng, args), record=loop.time() >= measure_from)
+
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    return recorder.result(name, args.duration, concurrency=args.concurrency)
+
+
+async def reset_storm_slot(args: argparse.Namespace) -> None:
+    """把抢号的排班行号源重置，并删掉上一轮抢到的预约。"""
+    if args.standin:
+        args.standin_pool.db.add_schedule(*storm_slot().values(), args.storm_slots)
+        return
+    import aiomysql
+
+    from backend_fastapi.db import DB_CONFIG
+
+    slot = storm_slot()
+    conn = await aiomysql.connect(autocommit=True, charset="utf8mb4", **DB_CONFIG)
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "DELETE FROM appointments WHERE doctor_id = %s AND schedule_date = %s AND period = %s AND patient_name LIKE %s",
+                [slot["doctorId"], slot["scheduleDate"], slot["period"], "抢号%"],
+            )
+            await cur.execute(
+                """
+                INSERT INTO doctor_schedules (doctor_id, schedule_date, period, total_slots, remaining_slots)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE total_slots = VALUES(total_slots), remaining_slots = VALUES(remaining_slots)
+                """,
+                [slot["doctorId"], slot["scheduleDate"], slot["period"], args.storm_slots, args.storm_slots],
+            )
+    finally:
+        conn.close()
+
+
+async def run_booking_storm(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, Any]:
+    await reset_storm_slot(args)
+    if args.base_url:
+        # 已在运行的服务可能还记着上一轮"号源已满"的状态，等它过期
+        from backend_fastapi.booking import BOOKING_CLOSED_TTL
+
+        await asyncio.sleep(BOOKING_CLOSED_TTL)
+    slot = storm_slot()
+    recorder = Recorder()
+    gate = asyncio.Event()
+
+    async def one(i: int) -> None:
+        body = dict(slot, doctorName="压测医生", patientName=f"抢号{i}", patientPhone=phone(i))
+        await gate.wait()
+        await recorder.send(client, ("POST", "/api/appointments", body))
+
+    tasks = [asyncio.create_task(one(i)) for i in range(args.storm_requests)]
+    await asyncio.sleep(0)
+    began = time.perf_counter()
+    gate.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - began
+    booked = recorder.statuses.get("200", 0)
+    return recorder.result("booking-storm", elapsed, booked=booked, slots=args.storm_slots, oversold=max(0, booked - args.storm_slots))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                if (await client.get("/metrics")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not become ready")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scenarios = SCENARIOS if args.scenarios == "all" else args.scenarios.split(",")
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(unknown)}")
+    if args.standin and scenarios != ["booking-storm"]:
+        # 替身只认得预约相关的几条 SQL
+        print("stand-in mode only supports booking-storm; other scenarios skipped")
+        scenarios = ["booking-storm"]
+
+    process = None
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.storm_requests))
+    if args.standin:
+        from backend_fastapi.app import app
+        from benchmarks.standin import StandInPool
+
+        args.standin_pool = app.state.db_pool = StandInPool(maxsize=args.pool_size, rtt=args.rtt_ms / 1000.0)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://standin", limits=limits)
+    else:
+        base_url = args.base_url
+        if not base_url:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            command = [
+                sys.executable, "-m", "uvicorn", "backend_fastapi.app:app",
+                "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning",
+            ]
+            process = subprocess.Popen(command, env=dict(os.environ))
+            await wait_ready(base_url, process)
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout)
+
+    results = []
+    try:
+        for name in scenarios:
+            if name == "booking-storm":
+                result = await run_booking_storm(client, args)
+            else:
+                result = await run_closed_loop(client, name, args)
+            results.append(result)
+            print(
+                f"{name:>16}: requests={result['requests']} errors={result['errors']} rps={result['rps']} "
+                f"p50={result['p50Ms']}ms p99={result['p99Ms']}ms max={result['maxMs']}ms statuses={result['statuses']}"
+            )
+    finally:
+        await client.aclose()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    options = {key: value for key, value in vars(args).items() if key not in ("json_path", "standin_pool")}
+    return {
+        "meta": {"startedAt": datetime.now().isoformat(timespec="seconds"), "gitRevision": git_revision(), "options": options},
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="all", help=f"逗号分隔：{','.join(SCENARIOS)}")
+    parser.add_argument("--base-url", help="压已经在运行的服务，不再自行启动")
+    parser.add_argument("--workers", type=int, default=1, help="自行启动 uvicorn 时的 worker 数")
+    parser.add_argument("--standin", action="store_true", help="进程内运行，数据库换成替身")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--storm-requests", type=int, default=1000)
+    parser.add_argument("--storm-slots", type=int, default=30)
+    # 以下三项要与 benchmarks.seed 的参数一致
+    parser.add_argument("--doctors", type=int, default=2000)
+    parser.add_argument("--phones", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--pool-size", type=int, default=10, help="替身连接池大小")
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="替身每条语句的往返耗时")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
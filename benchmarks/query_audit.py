@@ -0,0 +1,449 @@
+"""SQL 执行计划审计：列出接口会发出的每一种查询，逐条 EXPLAIN FORMAT=JSON，报告全表扫描、filesort、临时表和扫描行数，并给出缺失索引的建议。
+
+    python -m benchmarks.seed --schema      # 先准备一个灌好数据的本地库
+    python -m benchmarks.query_audit [--min-rows 1000] [--json]
+    python -m benchmarks.query_audit --list # 不连库，只列出查询并检查覆盖
+
+查询来源：
+- backend_fastapi 里整条写死的 SQL 字面量，用 AST 静态提取，参数按列名取样例值；
+- 拼接或 f-string 生成的 SQL，由 dynamic_queries() 调用路由里的 build_* 函数枚举出各种筛选组合。
+  静态提取到的每个 f-string / 拼接起点都必须被某条枚举出的查询覆盖，否则算“未审计”。
+
+有问题的查询（不在 ACCEPTED 里）或未审计的 SQL 存在时退出码为 1，适合放在上线前的检查里。
+"""
+import argparse
+import ast
+import asyncio
+import json
+import re
+import sys
+from datetime import date, datetime, timedelta
+from fnmatch import fnmatch
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import aiomysql
+
+from backend_fastapi.archival import APPOINTMENT_COLUMNS, ARCHIVE_TABLE, FINISHED_STATUSES
+from backend_fastapi.db import DB_CONFIG
+from backend_fastapi.metrics import fingerprint
+from backend_fastapi.routers.appointments import build_export_query, build_listing_query
+from backend_fastapi.routers.doctors import DOCTOR_COLUMNS
+from backend_fastapi.routers.schedules import build_admin_schedules_query, build_snapshot_query
+from backend_fastapi.search import SEARCH_FIELDS
+from benchmarks.seed import doctor_id, phone
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SOURCE_DIR = ROOT_DIR / "backend_fastapi"
+
+# (名称, SQL, 参数)
+Query = Tuple[str, str, List[Any]]
+
+# 有意为之的扫描：名称（fnmatch 通配）-> (接受的问题类型, 原因)
+ACCEPTED: Dict[str, Tuple[Set[str], str]] = {
+    "doctors.list*": ({"full scan"}, "医生列表本来就是全表；有关键词时线上走内存倒排索引，LIKE 只是兜底"),
+    "search.rebuild": ({"full scan"}, "后台全量重建搜索索引"),
+    "recurrence.ScheduleRuleIndex.rebuild*": ({"full scan"}, "后台全量加载规则和例外"),
+    "appointments.list all*full": ({"full scan", "full index scan", "filesort"}, "不带筛选和分页的导出，本来就读整表"),
+    "appointments.export all*": ({"full scan", "full index scan", "filesort"}, "不带筛选的全量导出"),
+    "schedules.stream": ({"filesort"}, "最多 50 个医生 x 92 天，排序行数有上限"),
+}
+
+SQL_START_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE)\b", re.I)
+TABLE_REF_RE = re.compile(r"\b(FROM|INTO|UPDATE)\s+\w", re.I)
+COMPARE_RE = re.compile(r"(\w+)\s*(?:=|!=|<>|<=|>=|<|>|\bLIKE)\s*$", re.I)
+BETWEEN_RE = re.compile(r"(\w+)\s+BETWEEN\s+(?:%s\s+AND\s+)?$", re.I)
+IN_LIST_RE = re.compile(r"(\w+)\s+IN\s*\((?:\s*%s\s*,)*\s*$", re.I)
+INSERT_RE = re.compile(r"INSERT\s+(?:IGNORE\s+)?INTO\s+\w+\s*\(([^)]*)\)\s*VALUES", re.I)
+ALIAS_RE = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.I)
+ORDER_BY_RE = re.compile(r"\bORDER BY (.+?)(?:\bLIMIT\b|\bFOR UPDATE\b|\)|$)", re.I)
+EXPR_MARK = "__expr__"
+NOT_ALIAS = {"where", "left", "right", "inner", "join", "on", "set", "order", "limit", "group", "union", "for", "values", "select"}
+
+
+def sample_values() -> Dict[str, Any]:
+    """WHERE / SET / VALUES 里按列名取的样例值，和 benchmarks.seed 灌入的数据对得上。"""
+    today = date.today()
+    tomorrow = today + timedelta(days=1)
+    return {
+        "doctor_id": doctor_id(0),
+        "patient_phone": phone(0),
+        "schedule_date": tomorrow.isoformat(),
+        "exception_date": tomorrow.isoformat(),
+        "valid_from": today.isoformat(),
+        "valid_until": tomorrow.isoformat(),
+        "period": "上午",
+        "weekday": tomorrow.isoweekday(),
+        "status": "completed",
+        "created_at": (datetime.now() - timedelta(days=30)).replace(microsecond=0),
+        "id": 1,
+        "total_slots": 20,
+        "remaining_slots": 20,
+    }
+
+
+def sample_params(sql: str, samples: Dict[str, Any]) -> List[Any]:
+    """按每个 %s 前面的列名（或 INSERT 的列清单）填样例值；认不出的列填一个字符串。"""
+    insert = INSERT_RE.search(sql)
+    insert_columns = [c.strip() for c in insert.group(1).split(",")] if insert else []
+    values_at = insert.end() if insert else len(sql)
+    params: List[Any] = []
+    values_index = 0
+    for match in re.finditer(r"%s", sql):
+        before = sql[: match.start()]
+        if insert_columns and match.start() > values_at and "DUPLICATE" not in before[values_at:].upper():
+            column = insert_columns[values_index % len(insert_columns)]
+            values_index += 1
+        elif re.search(r"\bLIMIT\s*$", before, re.I):
+            params.append(50)
+            continue
+        elif re.search(r"\bINTERVAL\s*$", before, re.I):
+            params.append(28)
+            continue
+        else:
+            found = COMPARE_RE.search(before) or BETWEEN_RE.search(before) or IN_LIST_RE.search(before)
+            column = found.group(1) if found else ""
+        params.append(samples.get(column.lower(), "x"))
+    return params
+
+
+def _render(node: ast.AST) -> Optional[str]:
+    """字符串常量原样返回，f-string 的插值部分换成 EXPR_MARK；其它表达式返回 None。"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        return "".join(part.value if isinstance(part, ast.Constant) else EXPR_MARK for part in node.values)
+    return None
+
+
+def extract_statements(source_dir: Path = SOURCE_DIR) -> List[Dict[str, Any]]:
+    """静态提取 SQL：整条字面量可以直接审计，f-string 和后面还会 += 拼接的起点只能当作模式去匹配。"""
+    found: List[Dict[str, Any]] = []
+    for path in sorted(source_dir.rglob("*.py")):
+        module = path.relative_to(source_dir).with_suffix("").as_posix().replace("/", ".").replace("routers.", "")
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+
+        def visit(node: ast.AST, scope: List[str], extended: Set[str]) -> None:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names = {n.target.id for n in ast.walk(node) if isinstance(n, ast.AugAssign) and isinstance(n.target, ast.Name)}
+                for child in ast.iter_child_nodes(node):
+                    visit(child, scope + [node.name], names)
+                return
+            text = _render(node)
+            if text is not None:
+                if SQL_START_RE.match(text) and TABLE_REF_RE.search(text):
+                    found.append(
+                        {
+                            "name": ".".join([module, *scope]),
+                            "location": f"{path.relative_to(ROOT_DIR)}:{node.lineno}",
+                            "sql": text,
+                            "dynamic": isinstance(node, ast.JoinedStr) or id(node) in fragments,
+                        }
+                    )
+                return
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and target.id in extended:
+                        fragments.add(id(node.value))
+                    elif isinstance(target, ast.Name) and not scope:
+                        # 模块级常量（如 TAKE_SLOT_SQL）用常量名称呼
+                        scope = [target.id]
+            for child in ast.iter_child_nodes(node):
+                visit(child, scope, extended)
+
+        fragments: Set[int] = set()
+        visit(tree, [], set())
+    # 同一个函数里有多条时加序号
+    seen: Dict[str, int] = {}
+    for statement in found:
+        seen[statement["name"]] = seen.get(statement["name"], 0) + 1
+        if seen[statement["name"]] > 1:
+            statement["name"] += f"#{seen[statement['name']]}"
+    return found
+
+
+def statement_pattern(sql: str) -> "re.Pattern[str]":
+    text = re.escape(fingerprint(sql)).replace(re.escape(EXPR_MARK), ".+?")
+    return re.compile(text, re.I)
+
+
+def dynamic_queries(samples: Dict[str, Any]) -> Iterator[Query]:
+    """拼接出来的 SQL：枚举各接口所有的筛选组合。"""
+    filters = {"phone": samples["patient_phone"], "doctor": samples["doctor_id"], "status": "pending"}
+    after = [samples["created_at"], 1000]
+    for chosen in product([False, True], repeat=3):
+        phone_value, doctor_value, status_value = (value if on else None for on, value in zip(chosen, filters.values()))
+        label = "+".join(name for on, name in zip(chosen, filters) if on) or "all"
+        for archived in (False, True):
+            for mode, cursor, limit in (("full", None, None), ("page", None, 51), ("next", after, 51)):
+                name = f"appointments.list {label}{' archived' if archived else ''} {mode}"
+                yield (name, *build_listing_query(phone_value, doctor_value, status_value, archived, cursor, limit))
+
+    start, end = samples["schedule_date"], (date.today() + timedelta(days=7)).isoformat()
+    for chosen in product([False, True], repeat=4):
+        values = [value if on else None for on, value in zip(chosen, (start, end, samples["doctor_id"], "completed"))]
+        label = "+".join(name for on, name in zip(chosen, ("start", "end", "doctor", "status")) if on) or "all"
+        for table in ("appointments", ARCHIVE_TABLE):
+            name = f"appointments.export {label}{' archived' if table == ARCHIVE_TABLE else ''}"
+            yield (name, *build_export_query(table, *values))
+
+    schedule_after = [samples["schedule_date"], samples["doctor_id"], "上午"]
+    for chosen in product([False, True], repeat=3):
+        doctor_value, start_value, end_value = (value if on else None for on, value in zip(chosen, (samples["doctor_id"], start, end)))
+        label = "+".join(name for on, name in zip(chosen, ("doctor", "start", "end")) if on) or "upcoming"
+        for mode, cursor, limit in (("full", None, None), ("page", None, 201), ("next", schedule_after, 201)):
+            yield (f"schedules.admin {label} {mode}", *build_admin_schedules_query(doctor_value, start_value, end_value, cursor, limit))
+    yield ("schedules.stream", *build_snapshot_query([doctor_id(i) for i in range(3)], start, end))
+
+    doctor_sql = f"SELECT {DOCTOR_COLUMNS} FROM doctors"
+    yield ("doctors.list", doctor_sql, [])
+    yield ("doctors.list keyword", doctor_sql + " WHERE name LIKE %s OR expertise LIKE %s", ["%高血压%", "%高血压%"])
+    yield ("doctors.load", doctor_sql + " WHERE doctor_id = %s", [samples["doctor_id"]])
+    yield ("search.rebuild", f"SELECT doctor_id, {', '.join(name for name, _ in SEARCH_FIELDS)} FROM doctors", [])
+
+    for weekday, period in product([None, 1], [None, "上午"]):
+        sql = "DELETE FROM schedule_rules WHERE doctor_id = %s"
+        params: List[Any] = [samples["doctor_id"]]
+        if weekday is not None:
+            sql += " AND weekday = %s"
+            params.append(weekday)
+        if period:
+            sql += " AND period = %s"
+            params.append(period)
+        yield (f"schedule_rules.delete{' weekday' if weekday else ''}{' period' if period else ''}", sql, params)
+    rule_row = [samples["doctor_id"], 1, "上午", 20, None, None]
+    yield (
+        "schedule_rules.save",
+        """
+        INSERT INTO schedule_rules (doctor_id, weekday, period, total_slots, valid_from, valid_until)
+        VALUES (%s, %s, %s, %s, %s, %s), (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE total_slots = VALUES(total_slots),
+        valid_from = VALUES(valid_from), valid_until = VALUES(valid_until)
+        """,
+        rule_row + [samples["doctor_id"], 2, "上午", 20, None, None],
+    )
+    yield (
+        "schedules.upsert",
+        """
+        INSERT INTO doctor_schedules (doctor_id, schedule_date, period, total_slots, remaining_slots)
+        VALUES (%s, %s, %s, %s, %s), (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE total_slots=VALUES(total_slots), remaining_slots=VALUES(remaining_slots)
+        """,
+        [samples["doctor_id"], samples["schedule_date"], "上午", 20, 20, samples["doctor_id"], samples["schedule_date"], "下午", 20, 20],
+    )
+
+    statuses = ", ".join(["%s"] * len(FINISHED_STATUSES))
+    yield (
+        "archival.batch",
+        f"SELECT id FROM appointments WHERE status IN ({statuses}) AND created_at < %s LIMIT %s FOR UPDATE",
+        [*FINISHED_STATUSES, samples["created_at"], 500],
+    )
+    yield (
+        "archival.copy",
+        f"INSERT INTO {ARCHIVE_TABLE} ({APPOINTMENT_COLUMNS}, archived_at) SELECT {APPOINTMENT_COLUMNS}, NOW() FROM appointments WHERE id IN (%s, %s)",
+        [1, 2],
+    )
+    yield ("archival.delete", "DELETE FROM appointments WHERE id IN (%s, %s)", [1, 2])
+    yield ("appointments.cancel archived", f"SELECT id FROM {ARCHIVE_TABLE} WHERE id = %s", [1])
+
+
+def collect_queries(samples: Dict[str, Any]) -> Tuple[List[Query], List[Dict[str, Any]]]:
+    """返回 (要审计的查询, 没被任何查询覆盖的静态 SQL)。"""
+    statements = extract_statements()
+    queries: List[Query] = [
+        (s["name"], s["sql"], sample_params(s["sql"], samples)) for s in statements if not s["dynamic"]
+    ]
+    queries.extend(dynamic_queries(samples))
+    fingerprints = [fingerprint(sql) for _, sql, _ in queries]
+    unaudited = [
+        s for s in statements if s["dynamic"] and not any(statement_pattern(s["sql"]).match(fp) for fp in fingerprints)
+    ]
+    return queries, unaudited
+
+
+def _walk(node: Any, parent_key: str = "") -> Iterator[Tuple[str, Dict[str, Any]]]:
+    if isinstance(node, dict):
+        yield parent_key, node
+        for key, value in node.items():
+            yield from _walk(value, key)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk(item, parent_key)
+
+
+def _is_real_table(table: Dict[str, Any]) -> bool:
+    """派生表、UNION 结果和 INSERT 的目标表不算扫描。"""
+    name = str(table.get("table_name", ""))
+    return not (table.get("insert") or table.get("materialized_from_subquery") or name.startswith("<"))
+
+
+def _tables(node: Any) -> List[Dict[str, Any]]:
+    return [item for key, item in _walk(node) if key == "table" and "table_name" in item]
+
+
+def _column_names(condition: str, alias: str, pattern: str) -> List[str]:
+    found = re.findall(rf"`{re.escape(alias)}`\.`(\w+)`{pattern}", condition)
+    return list(dict.fromkeys(found))
+
+
+def suggest_index(
+    sql: str, table: Dict[str, Any], filesort: bool, aliases: Dict[str, str], indexes: Dict[str, Dict[str, List[str]]]
+) -> Optional[str]:
+    """等值列在前，其后是排序列（有 filesort 时）或第一个范围列；已有索引能覆盖这个前缀时不再建议。
+
+    InnoDB 二级索引末尾自带主键，建议里省掉主键列，比对已有索引时把主键补上。
+    """
+    alias = table["table_name"]
+    real = aliases.get(alias, alias)
+    condition = " ".join(str(table.get(key, "")) for key in ("attached_condition", "index_condition"))
+    equal = _column_names(condition, alias, r" (?:= |in \()")
+    if table.get("access_type") in ("ref", "eq_ref", "const"):
+        equal = list(dict.fromkeys([*table.get("used_key_parts", []), *equal]))
+    tail: List[str] = []
+    if filesort:
+        order = ORDER_BY_RE.findall(fingerprint(sql))
+        if order:
+            for column in order[-1].split(","):
+                name = column.strip().split()[0].split(".")[-1]
+                if name not in equal:
+                    tail.append(name)
+    else:
+        tail = [c for c in _column_names(condition, alias, r" (?:<|>|<=|>=|between)") if c not in equal][:1]
+    primary = indexes.get(real, {}).get("PRIMARY", [])
+    while tail and tail[-1] in primary:
+        tail.pop()
+    wanted = equal + tail
+    if not wanted:
+        return None
+    for key, columns in indexes.get(real, {}).items():
+        columns = columns if key == "PRIMARY" else columns + primary
+        if set(columns[: len(equal)]) == set(equal) and columns[len(equal) : len(wanted)] == tail:
+            return None
+    return f"ALTER TABLE {real} ADD INDEX idx_{'_'.join(wanted)} ({', '.join(wanted)})"
+
+
+def analyze_plan(
+    name: str, sql: str, plan: Dict[str, Any], indexes: Dict[str, Dict[str, List[str]]], min_rows: int
+) -> Dict[str, Any]:
+    aliases = {}
+    for table, alias in ALIAS_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in NOT_ALIAS:
+            aliases[alias] = table
+    findings: List[Tuple[str, str]] = []
+    suggestions: List[str] = []
+    access: List[str] = []
+    examined = 0
+    sorted_tables: Set[int] = set()
+    for key, node in _walk(plan):
+        if key == "ordering_operation" and node.get("using_filesort"):
+            sorted_real = [t for t in _tables(node) if _is_real_table(t)]
+            if sorted_real:
+                findings.append(("filesort", f"排序 {sorted_real[0]['table_name']}"))
+                sorted_tables.add(id(sorted_real[0]))
+        if node.get("using_temporary_table") and key != "union_result":
+            findings.append(("temporary table", key))
+    for table in _tables(plan):
+        if not _is_real_table(table):
+            continue
+        rows = int(table.get("rows_examined_per_scan", 0) or 0)
+        examined += rows
+        access.append(f"{table['table_name']}:{table.get('access_type')}({table.get('key') or '-'}) rows={rows}")
+        scan = {"ALL": "full scan", "index": "full index scan"}.get(table.get("access_type"))
+        if scan and rows >= min_rows:
+            findings.append((scan, f"{aliases.get(table['table_name'], table['table_name'])} 扫描 {rows} 行"))
+        if (scan and rows >= min_rows) or id(table) in sorted_tables:
+            suggestion = suggest_index(sql, table, id(table) in sorted_tables, aliases, indexes)
+            if suggestion and suggestion not in suggestions:
+                suggestions.append(suggestion)
+    accepted = next(((kinds, reason) for pattern, (kinds, reason) in ACCEPTED.items() if fnmatch(name, pattern)), (set(), ""))
+    problems = [f"{kind}: {detail}" for kind, detail in findings if kind not in accepted[0]]
+    return {
+        "name": name,
+        "access": access,
+        "rowsExamined": examined,
+        "cost": plan.get("query_block", {}).get("cost_info", {}).get("query_cost"),
+        "findings": [f"{kind}: {detail}" for kind, detail in findings],
+        "problems": problems,
+        "accepted": accepted[1] if findings and not problems else "",
+        "suggestions": suggestions if problems else [],
+    }
+
+
+async def load_indexes(cur: Any, tables: Set[str]) -> Dict[str, Dict[str, List[str]]]:
+    """表名 -> {索引名: 列}。"""
+    indexes: Dict[str, Dict[str, List[str]]] = {}
+    for table in sorted(tables):
+        await cur.execute(f"SHOW INDEX FROM {table}")
+        keys: Dict[str, List[str]] = {}
+        for row in sorted(await cur.fetchall(), key=lambda r: (r["Key_name"], r["Seq_in_index"])):
+            keys.setdefault(row["Key_name"], []).append(row["Column_name"])
+        indexes[table] = keys
+    return indexes
+
+
+async def audit(queries: List[Query], min_rows: int) -> List[Dict[str, Any]]:
+    conn = await aiomysql.connect(**DB_CONFIG, cursorclass=aiomysql.DictCursor, autocommit=True)
+    results: List[Dict[str, Any]] = []
+    try:
+        async with conn.cursor() as cur:
+            tables = {table for _, sql, _ in queries for table, _ in ALIAS_RE.findall(sql)}
+            indexes = await load_indexes(cur, tables)
+            for name, sql, params in queries:
+                try:
+                    await cur.execute(f"EXPLAIN FORMAT=JSON {sql}", params)
+                    plan = json.loads((await cur.fetchone())["EXPLAIN"])
+                except Exception as e:
+                    results.append({"name": name, "access": [], "rowsExamined": 0, "cost": None, "findings": [],
+                                    "problems": [f"explain failed: {e}"], "accepted": "", "suggestions": []})
+                    continue
+                results.append(analyze_plan(name, sql, plan, indexes, min_rows))
+    finally:
+        conn.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-rows", type=int, default=1000, help="扫描行数低于这个值的全表扫描不报")
+    parser.add_argument("--only", default="", help="只审计名称匹配该通配符的查询")
+    parser.add_argument("--list", action="store_true", help="不连数据库，只列出查询和覆盖情况")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    queries, unaudited = collect_queries(sample_values())
+    if args.only:
+        queries = [q for q in queries if fnmatch(q[0], args.only)]
+    for name, sql, params in queries:
+        if sql.count("%s") != len(params):
+            unaudited.append({"name": name, "location": "-", "sql": sql, "dynamic": True})
+
+    if args.list:
+        for name, sql, _ in queries:
+            print(f"{name}\n    {fingerprint(sql)}")
+        results: List[Dict[str, Any]] = []
+    else:
+        results = asyncio.run(audit(queries, args.min_rows))
+
+    if args.json:
+        print(json.dumps({"results": results, "unaudited": unaudited}, ensure_ascii=False, indent=2, default=str))
+    else:
+        for r in results:
+            mark = "PROBLEM" if r["problems"] else "ok"
+            print(f"{r['name']:<48} rows≈{r['rowsExamined']:<9} {mark}  {'; '.join(r['access'])}")
+            for problem in r["problems"]:
+                print(f"    - {problem}")
+            for suggestion in r["suggestions"]:
+                print(f"    建议: {suggestion}")
+            if r["accepted"]:
+                print(f"    已接受: {r['accepted']}")
+        for s in unaudited:
+            print(f"未审计: {s['name']} ({s['location']}) {fingerprint(s['sql'])[:120]}")
+        print(f"{len(queries)} 条查询，{sum(1 for r in results if r['problems'])} 条有问题，{len(unaudited)} 条 SQL 未覆盖")
+    if unaudited or any(r["problems"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
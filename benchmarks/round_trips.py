@@ -0,0 +1,133 @@
+"""写接口的数据库往返预算：每个接口占用几次连接、发几条语句，超出预算时退出码为 1。
+
+    python -m benchmarks.round_trips
+
+直接调用路由里的实现函数，数据库换成 benchmarks.standin 的替身（rtt=0，只计数）。
+头像处理和 COS 上传换成直接返回固定值的函数，它们不走数据库，不计入预算。
+tests/test_round_trips.py 按同样的场景断言预算；确实需要多一次往返时，同步调整 BUDGETS 并在提交说明里写明原因。
+"""
+import asyncio
+import sys
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from backend_fastapi.booking import slot_admission
+from backend_fastapi.cache import invalidate_doctor_cache
+from backend_fastapi.routers import doctors
+from backend_fastapi.routers.appointments import book_appointment, cancel_booking
+from benchmarks.standin import StandInPool
+
+# 场景 -> (连接获取次数, 语句数)，BEGIN/COMMIT/ROLLBACK 各算一条
+BUDGETS: Dict[str, Tuple[int, int]] = {
+    "appointments.create": (1, 5),
+    "appointments.create (duplicate)": (1, 1),
+    "appointments.create (full)": (1, 5),
+    "appointments.cancel": (1, 5),
+    "doctors.create": (1, 1),
+    "doctors.modifyInfo (cached)": (1, 1),
+    "doctors.modifyInfo (uncached)": (1, 2),
+    "doctors.modifyInfo (missing)": (1, 1),
+    "doctors.modifyImage (cached)": (1, 1),
+    "doctors.modifyImage (uncached)": (1, 2),
+    "doctors.modifyImage (missing)": (1, 1),
+}
+
+SLOT = {"doctorId": "rt-doctor", "scheduleDate": "2030-01-01", "period": "上午"}
+
+
+async def _fake_process(raw: Optional[str]) -> Optional[str]:
+    return raw
+
+
+async def _fake_upload(payload: str) -> str:
+    return "https://example.invalid/avatars/rt.jpg"
+
+
+# 医生不存在时被删掉的头像地址
+deleted_avatars: List[str] = []
+
+
+async def _fake_delete(avatar_url: str) -> None:
+    deleted_avatars.append(avatar_url)
+
+
+async def measure(pool: StandInPool, func: Callable[[], Awaitable[Any]]) -> Tuple[int, int, Optional[int]]:
+    acquires, statements = pool.acquires, pool.statements
+    status = None
+    try:
+        await func()
+    except HTTPException as e:
+        status = e.status_code
+    return pool.acquires - acquires, pool.statements - statements, status
+
+
+async def run() -> List[Dict[str, Any]]:
+    pool = StandInPool(rtt=0)
+    pool.db.add_schedule(SLOT["doctorId"], SLOT["scheduleDate"], SLOT["period"], 2)
+    doctors.process_avatar_payload_async = _fake_process
+    doctors.upload_avatar_to_cos_async = _fake_upload
+    doctors.delete_avatar_from_cos_async = _fake_delete
+    slot_admission.reset()
+    invalidate_doctor_cache()
+
+    booking = dict(SLOT, doctorName="往返医生", patientName="往返", patientPhone="13900000000")
+    created = await doctors.create_doctor({"name": "往返医生", "title": "主任医师"}, pool)
+    info = {"doctorId": created["id"], "name": "往返医生", "title": "副主任医师", "registrationFee": 20}
+
+    async def fill_slot() -> None:
+        await book_appointment(dict(booking, patientPhone="13900000001"), pool)
+        # 去掉进程内"已满"标记，让请求真正走到数据库
+        slot_admission.reset()
+
+    async def warm_doctor() -> None:
+        await doctors.load_doctor(created["id"], pool)
+
+    Setup = Optional[Callable[[], Awaitable[None]]]
+    scenarios: List[Tuple[str, Callable[[], Awaitable[Any]], Setup]] = [
+        ("appointments.create", lambda: book_appointment(booking, pool), None),
+        ("appointments.create (duplicate)", lambda: book_appointment(booking, pool), None),
+        ("appointments.create (full)", lambda: book_appointment(dict(booking, patientPhone="13900000002"), pool), fill_slot),
+        ("appointments.cancel", lambda: cancel_booking({"appointmentId": 1}, pool), None),
+        ("doctors.create", lambda: doctors.create_doctor({"name": "往返医生"}, pool), None),
+        ("doctors.modifyInfo (cached)", lambda: doctors.admin_modify_doctor_info(info, pool), warm_doctor),
+        ("doctors.modifyInfo (uncached)", lambda: doctors.admin_modify_doctor_info(info, pool), None),
+        ("doctors.modifyInfo (missing)", lambda: doctors.admin_modify_doctor_info(dict(info, doctorId="none"), pool), None),
+        ("doctors.modifyImage (cached)", lambda: doctors.admin_modify_doctor_image({"doctorId": created["id"], "avatarImage": "x"}, pool), warm_doctor),
+        ("doctors.modifyImage (uncached)", lambda: doctors.admin_modify_doctor_image({"doctorId": created["id"], "avatarImage": "x"}, pool), None),
+        ("doctors.modifyImage (missing)", lambda: doctors.admin_modify_doctor_image({"doctorId": "none", "avatarImage": "x"}, pool), None),
+    ]
+    results = []
+    for name, func, setup in scenarios:
+        invalidate_doctor_cache()
+        if setup is not None:
+            await setup()
+        acquires, statements, status = await measure(pool, func)
+        budget = BUDGETS[name]
+        results.append(
+            {
+                "scenario": name,
+                "status": status or 200,
+                "acquires": acquires,
+                "statements": statements,
+                "budget": budget,
+                "ok": acquires <= budget[0] and statements <= budget[1],
+            }
+        )
+    return results
+
+
+def main() -> None:
+    results = asyncio.run(run())
+    for r in results:
+        mark = "ok" if r["ok"] else "OVER BUDGET"
+        print(
+            f"{r['scenario']:>32}: status={r['status']} acquires={r['acquires']}/{r['budget'][0]} "
+            f"statements={r['statements']}/{r['budget'][1]}  {mark}"
+        )
+    if not all(r["ok"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
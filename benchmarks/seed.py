@@ -0,0 +1,159 @@
+"""给压测灌数据：几千个医生、90 天排班、上百万条预约。
+
+    python -m benchmarks.seed [--doctors 2000] [--appointments 1000000] [--days 90]
+    python -m benchmarks.seed --schema      # 先执行 backend/database-migration.sql（会清空全部表！）
+    python -m benchmarks.seed --reset       # 只删除之前灌入的压测数据（doctor_id 以 bench- 开头）
+
+使用 DB_* 环境变量指向的 MySQL。数据用固定随机种子生成，同样的参数每次得到同样的数据，
+benchmarks.load 按同样的规则挑医生 ID、手机号和搜索关键词。
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, List, Sequence
+
+import aiomysql
+
+from backend_fastapi.db import DB_CONFIG
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MIGRATION_SQL = ROOT_DIR / "backend" / "database-migration.sql"
+
+DOCTOR_PREFIX = "bench-"
+SEED = 20240601
+CHUNK_ROWS = 2000
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚"
+TITLES = ["主任医师", "副主任医师", "主治医师", "住院医师"]
+DEPARTMENTS = ["心内科", "消化内科", "呼吸科", "神经内科", "骨科", "儿科", "妇科", "皮肤科", "眼科", "口腔科", "中医科", "内分泌科"]
+# 搜索场景从这里取关键词
+KEYWORDS = ["高血压", "冠心病", "胃炎", "哮喘", "失眠", "骨折", "湿疹", "糖尿病", "近视", "牙周炎", "头痛", "关节炎"]
+PERIODS = ["上午", "下午"]
+STATUSES = ["pending", "pending", "confirmed", "completed", "completed", "cancelled"]
+
+
+def doctor_id(index: int) -> str:
+    return f"{DOCTOR_PREFIX}{index:06d}"
+
+
+def phone(index: int) -> str:
+    return f"139{index:08d}"
+
+
+def storm_slot() -> dict:
+    """抢号场景固定打这个排班行：第 0 个医生明天上午。"""
+    return {"doctorId": doctor_id(0), "scheduleDate": (date.today() + timedelta(days=1)).isoformat(), "period": "上午"}
+
+
+def doctor_rows(count: int, rng: random.Random) -> List[Sequence[Any]]:
+    rows = []
+    for i in range(count):
+        department = DEPARTMENTS[i % len(DEPARTMENTS)]
+        expertise = "、".join(rng.sample(KEYWORDS, 3))
+        # 三分之一用默认头像，其余是外链（头像接口返回重定向）
+        avatar = None if i % 3 == 0 else f"https://example.invalid/avatars/{doctor_id(i)}.jpg"
+        rows.append(
+            (
+                doctor_id(i),
+                rng.choice(SURNAMES) + rng.choice(GIVEN) + rng.choice(GIVEN),
+                rng.choice(TITLES),
+                expertise,
+                f"擅长{expertise}的诊治，从医{rng.randint(3, 35)}年。",
+                f"H{i % 50:03d}",
+                f"第{i % 50 + 1}人民医院",
+                department,
+                rng.choice([10, 15, 20, 30, 50]),
+                avatar,
+            )
+        )
+    return rows
+
+
+async def insert_rows(cur: Any, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> None:
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start : start + CHUNK_ROWS]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholders] * len(chunk))
+        await cur.execute(sql, [value for row in chunk for value in row])
+
+
+async def seed(args: argparse.Namespace) -> None:
+    rng = random.Random(SEED)
+    conn = await aiomysql.connect(autocommit=True, charset="utf8mb4", **DB_CONFIG)
+    try:
+        async with conn.cursor() as cur:
+            if args.schema:
+                for statement in MIGRATION_SQL.read_text(encoding="utf-8").split(";"):
+                    lines = [line for line in statement.splitlines() if not line.strip().startswith("--")]
+                    if "".join(lines).strip():
+                        await cur.execute("\n".join(lines))
+            # 外键 ON DELETE CASCADE 会带走排班和预约
+            await cur.execute("DELETE FROM doctors WHERE doctor_id LIKE %s", [DOCTOR_PREFIX + "%"])
+            if args.reset:
+                print("removed previous benchmark data")
+                return
+
+            began = time.perf_counter()
+            doctors = doctor_rows(args.doctors, rng)
+            await insert_rows(
+                cur,
+                "doctors",
+                ["doctor_id", "name", "title", "expertise", "intro", "hospital_id", "hospital_name", "department_name", "registration_fee", "avatar_url"],
+                doctors,
+            )
+            print(f"doctors: {len(doctors)}")
+
+            today = date.today()
+            schedules = []
+            for i in range(args.doctors):
+                for offset in range(args.days):
+                    for period in PERIODS:
+                        total = rng.choice([0, 10, 20, 30])
+                        schedules.append((doctor_id(i), today + timedelta(days=offset), period, total, rng.randint(0, total)))
+            await insert_rows(cur, "doctor_schedules", ["doctor_id", "schedule_date", "period", "total_slots", "remaining_slots"], schedules)
+            print(f"schedules: {len(schedules)}")
+
+            columns = [
+                "doctor_id", "doctor_name", "hospital_name", "department_name", "schedule_date", "period",
+                "patient_name", "patient_phone", "registration_fee", "status", "created_at",
+            ]
+            now = datetime.now().replace(microsecond=0)
+            batch: List[Sequence[Any]] = []
+            for n in range(args.appointments):
+                doctor = doctors[rng.randrange(len(doctors))]
+                created_at = now - timedelta(seconds=rng.randrange(365 * 86400))
+                batch.append(
+                    (
+                        doctor[0], doctor[1], doctor[6], doctor[7],
+                        (created_at + timedelta(days=rng.randint(0, 14))).date(), rng.choice(PERIODS),
+                        "患者" + str(n), phone(rng.randrange(args.phones)), doctor[8], rng.choice(STATUSES), created_at,
+                    )
+                )
+                if len(batch) >= CHUNK_ROWS * 5:
+                    await insert_rows(cur, "appointments", columns, batch)
+                    batch = []
+                    print(f"appointments: {n + 1}", end="\r", flush=True)
+            await insert_rows(cur, "appointments", columns, batch)
+            print(f"appointments: {args.appointments}")
+            print(f"seeded in {time.perf_counter() - began:.1f}s")
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=2000)
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--phones", type=int, default=200_000, help="预约手机号的取值个数")
+    parser.add_argument("--schema", action="store_true", help="先执行迁移脚本重建所有表")
+    parser.add_argument("--reset", action="store_true", help="只删除压测数据")
+    asyncio.run(seed(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
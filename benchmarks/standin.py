@@ -0,0 +1,351 @@
+"""进程内的 MySQL 替身，用于没有数据库时跑基准。
+
+只模拟基准需要的几条语句，但保留了对性能有决定性影响的行为：
+连接池大小上限、每条语句一次网络往返、事务内行锁持有到 COMMIT/ROLLBACK。
+测试也用它：事务内对号源和预约的修改在 ROLLBACK 时撤销，appointments 的 uniq_active_booking
+唯一键同样生效（有效预约重复时抛 1062）。
+"""
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pymysql
+
+
+def _norm(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+class StandInDatabase:
+    def __init__(self) -> None:
+        self.schedules: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.appointments: Dict[int, Dict[str, Any]] = {}
+        self.doctors: Dict[str, Dict[str, Any]] = {}
+        self.rules: List[Dict[str, Any]] = []
+        self.exceptions: List[Dict[str, Any]] = []
+        self.row_locks: Dict[Any, asyncio.Lock] = {}
+        self._next_schedule_id = 1
+        self._next_appointment_id = 1
+
+    def add_schedule(self, doctor_id: str, schedule_date: str, period: str, slots: int) -> Dict[str, Any]:
+        row = {
+            "id": self._next_schedule_id,
+            "doctor_id": doctor_id,
+            "schedule_date": schedule_date,
+            "period": period,
+            "total_slots": slots,
+            "remaining_slots": slots,
+        }
+        self._next_schedule_id += 1
+        self.schedules[(doctor_id, str(schedule_date), period)] = row
+        return row
+
+    def add_rule(
+        self, doctor_id: str, weekday: int, period: str, slots: int, valid_from: Optional[date] = None, valid_until: Optional[date] = None
+    ) -> None:
+        self.rules.append(
+            {"doctor_id": doctor_id, "weekday": weekday, "period": period, "total_slots": slots, "valid_from": valid_from, "valid_until": valid_until}
+        )
+
+    def add_exception(self, doctor_id: str, exception_date: date, period: str, slots: int) -> None:
+        self.exceptions.append({"doctor_id": doctor_id, "exception_date": exception_date, "period": period, "total_slots": slots})
+
+    def lock_for(self, key: Any) -> asyncio.Lock:
+        lock = self.row_locks.get(key)
+        if lock is None:
+            lock = self.row_locks[key] = asyncio.Lock()
+        return lock
+
+
+class StandInCursor:
+    def __init__(self, conn: "StandInConnection") -> None:
+        self.conn = conn
+        self.db = conn.db
+        self.rowcount = -1
+        self.lastrowid: Optional[int] = None
+        self._rows: List[Dict[str, Any]] = []
+
+    async def __aenter__(self) -> "StandInCursor":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+    async def execute(self, sql: str, params: Optional[List[Any]] = None) -> int:
+        await self.conn.round_trip()
+        params = list(params or [])
+        text = _norm(sql)
+        for pattern, handler in _HANDLERS:
+            match = pattern.search(text)
+            if match:
+                self._rows = []
+                self.rowcount = 0
+                await handler(self, match, params)
+                return self.rowcount
+        raise NotImplementedError(f"stand-in does not understand: {text[:120]}")
+
+    async def fetchone(self) -> Optional[Dict[str, Any]]:
+        return self._rows.pop(0) if self._rows else None
+
+    async def fetchall(self) -> List[Dict[str, Any]]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    def _on_rollback(self, undo: Callable[[], None]) -> None:
+        if self.conn.in_transaction:
+            self.conn.undo.append(undo)
+
+    async def _lock_row(self, key: Any) -> None:
+        if self.conn.in_transaction and key not in self.conn.held:
+            lock = self.db.lock_for(key)
+            await lock.acquire()
+            self.conn.held[key] = lock
+
+
+async def _select_schedule_for_update(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    key = (params[0], str(params[1]), params[2])
+    await cur._lock_row(("schedule", key))
+    row = cur.db.schedules.get(key)
+    cur._rows = [dict(row)] if row else []
+    cur.rowcount = len(cur._rows)
+
+
+async def _select_schedule(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    row = cur.db.schedules.get((params[0], str(params[1]), params[2]))
+    cur._rows = [dict(row)] if row else []
+    cur.rowcount = len(cur._rows)
+
+
+async def _decrement_by_id(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    for key, row in cur.db.schedules.items():
+        if row["id"] == params[0]:
+            await cur._lock_row(("schedule", key))
+            row["remaining_slots"] -= 1
+            cur.rowcount = 1
+
+
+async def _conditional_decrement(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    key = (params[0], str(params[1]), params[2])
+    row = cur.db.schedules.get(key)
+    if row is None:
+        return
+    await cur._lock_row(("schedule", key))
+    if row["remaining_slots"] > 0:
+        row["remaining_slots"] -= 1
+        cur._on_rollback(lambda: row.update(remaining_slots=row["remaining_slots"] + 1))
+        cur.rowcount = 1
+        cur.lastrowid = row["remaining_slots"]
+
+
+async def _increment(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    key = (params[0], str(params[1]), params[2])
+    row = cur.db.schedules.get(key)
+    if row is None:
+        return
+    await cur._lock_row(("schedule", key))
+    row["remaining_slots"] += 1
+    cur._on_rollback(lambda: row.update(remaining_slots=row["remaining_slots"] - 1))
+    cur.rowcount = 1
+    cur.lastrowid = row["remaining_slots"]
+
+
+async def _insert_appointment(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    columns = [c.strip() for c in match.group(1).split(",")]
+    literal_values = [v.strip() for v in match.group(2).split(",")]
+    values = iter(params)
+    row: Dict[str, Any] = {"created_at": datetime.now()}
+    for column, literal in zip(columns, literal_values):
+        row[column] = next(values) if literal == "%s" else literal.strip("'\"")
+    if row.get("status") != "cancelled" and _active_appointment(cur.db, row["patient_phone"], row["doctor_id"], row["schedule_date"], row["period"]):
+        raise pymysql.err.IntegrityError(pymysql.constants.ER.DUP_ENTRY, "Duplicate entry for key 'uniq_active_booking'")
+    row["id"] = cur.db._next_appointment_id
+    cur.db._next_appointment_id += 1
+    cur.db.appointments[row["id"]] = row
+    cur._on_rollback(lambda: cur.db.appointments.pop(row["id"], None))
+    cur.rowcount = 1
+    cur.lastrowid = row["id"]
+
+
+async def _insert_doctor(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    columns = [c.strip() for c in match.group(1).split(",")]
+    row = dict(zip(columns, params))
+    cur.db.doctors[row["doctor_id"]] = row
+    cur.rowcount = 1
+
+
+async def _update_doctor(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    # 与真实连接池一样按 FOUND_ROWS 语义：rowcount 是匹配行数
+    row = cur.db.doctors.get(params[-1])
+    if row:
+        columns = [assignment.split("=")[0].strip() for assignment in match.group(1).split(",")]
+        row.update(zip(columns, params))
+        cur.rowcount = 1
+
+
+async def _select_doctor(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    row = cur.db.doctors.get(params[0])
+    if row:
+        columns = [c.strip() for c in match.group(1).split(",")]
+        cur._rows = [{column: row.get(column) for column in columns}]
+    cur.rowcount = len(cur._rows)
+
+
+async def _select_appointment(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    row = cur.db.appointments.get(params[0])
+    if row and match.group(1):
+        await cur._lock_row(("appointment", row["id"]))
+    cur._rows = [dict(row)] if row else []
+    cur.rowcount = len(cur._rows)
+
+
+def _active_appointment(db: StandInDatabase, phone: Any, doctor_id: Any, schedule_date: Any, period: Any) -> Optional[int]:
+    for row in db.appointments.values():
+        if (row["patient_phone"], row["doctor_id"], str(row["schedule_date"]), row["period"]) == (phone, doctor_id, str(schedule_date), period) and row.get("status") != "cancelled":
+            return row["id"]
+    return None
+
+
+async def _check_active_appointment(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    cur._rows = [{"now": datetime.now().replace(microsecond=0), "duplicate_id": _active_appointment(cur.db, *params)}]
+    cur.rowcount = 1
+
+
+async def _insert_schedule_ignore(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    doctor_id, schedule_date, period, total, remaining = params
+    key = (doctor_id, str(schedule_date), period)
+    if key in cur.db.schedules:
+        return
+    row = cur.db.add_schedule(doctor_id, str(schedule_date), period, total)
+    row["remaining_slots"] = remaining
+    cur._on_rollback(lambda: cur.db.schedules.pop(key, None))
+    cur.rowcount = 1
+
+
+async def _select_rules(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    cur._rows = [dict(row) for row in cur.db.rules]
+    cur.rowcount = len(cur._rows)
+
+
+async def _select_exceptions(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    today = date.today()
+    cur._rows = [dict(row) for row in cur.db.exceptions if row["exception_date"] >= today]
+    cur.rowcount = len(cur._rows)
+
+
+async def _rule_slot_total(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    # 参数顺序见 backend_fastapi.recurrence.RULE_SLOT_SQL：例外优先，其次是生效中的规则
+    doctor_id, day, period, _, weekday, _, _, _ = params
+    for row in cur.db.exceptions:
+        if (row["doctor_id"], row["exception_date"], row["period"]) == (doctor_id, day, period):
+            cur._rows = [{"total_slots": row["total_slots"]}]
+            break
+    else:
+        for row in cur.db.rules:
+            if (
+                (row["doctor_id"], row["weekday"], row["period"]) == (doctor_id, weekday, period)
+                and (row["valid_from"] is None or row["valid_from"] <= day)
+                and (row["valid_until"] is None or row["valid_until"] >= day)
+            ):
+                cur._rows = [{"total_slots": row["total_slots"]}]
+                break
+    cur.rowcount = len(cur._rows)
+
+
+async def _cancel_appointment(cur: StandInCursor, match: Any, params: List[Any]) -> None:
+    row = cur.db.appointments.get(params[0])
+    if row:
+        status = row.get("status")
+        row["status"] = "cancelled"
+        cur._on_rollback(lambda: row.update(status=status))
+        cur.rowcount = 1
+
+
+_HANDLERS: List[Tuple["re.Pattern[str]", Callable[..., Any]]] = [
+    (re.compile(r"^SELECT \* FROM doctor_schedules WHERE doctor_id = %s AND schedule_date = %s AND period = %s FOR UPDATE"), _select_schedule_for_update),
+    (re.compile(r"^SELECT [\w, ]+ FROM doctor_schedules WHERE doctor_id = %s AND schedule_date = %s AND period = %s$"), _select_schedule),
+    (re.compile(r"^UPDATE doctor_schedules SET remaining_slots = remaining_slots - 1 WHERE id = %s"), _decrement_by_id),
+    (re.compile(r"^UPDATE doctor_schedules SET remaining_slots = LAST_INSERT_ID\(remaining_slots - 1\) WHERE doctor_id = %s AND schedule_date = %s AND period = %s AND remaining_slots > 0"), _conditional_decrement),
+    (re.compile(r"^UPDATE doctor_schedules SET remaining_slots = (?:LAST_INSERT_ID\()?remaining_slots \+ 1\)? WHERE doctor_id = %s AND schedule_date = %s AND period = %s"), _increment),
+    (re.compile(r"^INSERT INTO appointments \((.+?)\) VALUES \((.+)\)$"), _insert_appointment),
+    (re.compile(r"^SELECT \* FROM appointments WHERE id = %s( FOR UPDATE)?$"), _select_appointment),
+    (re.compile(r"^SELECT NOW\(\) AS now, \( SELECT id FROM appointments WHERE patient_phone = %s AND doctor_id = %s AND schedule_date = %s AND period = %s AND status != 'cancelled'"), _check_active_appointment),
+    (re.compile(r"^UPDATE appointments SET status = .cancelled. WHERE id = %s"), _cancel_appointment),
+    (re.compile(r"^INSERT IGNORE INTO doctor_schedules \(doctor_id, schedule_date, period, total_slots, remaining_slots\) VALUES"), _insert_schedule_ignore),
+    (re.compile(r"^SELECT doctor_id, weekday, period, total_slots, valid_from, valid_until FROM schedule_rules$"), _select_rules),
+    (re.compile(r"^SELECT doctor_id, exception_date, period, total_slots FROM schedule_exceptions WHERE exception_date >= CURDATE\(\)$"), _select_exceptions),
+    (re.compile(r"^SELECT total_slots FROM \( SELECT 0 AS priority, total_slots FROM schedule_exceptions"), _rule_slot_total),
+    (re.compile(r"^INSERT INTO doctors \((.+?)\) VALUES"), _insert_doctor),
+    (re.compile(r"^UPDATE doctors SET (.+) WHERE doctor_id ?= ?%s$"), _update_doctor),
+    (re.compile(r"^SELECT ([\w, ]+) FROM doctors WHERE doctor_id = %s$"), _select_doctor),
+]
+
+
+class StandInConnection:
+    def __init__(self, pool: "StandInPool") -> None:
+        self.pool = pool
+        self.db = pool.db
+        self.in_transaction = False
+        self.held: Dict[Any, asyncio.Lock] = {}
+        self.undo: List[Callable[[], None]] = []
+
+    async def round_trip(self) -> None:
+        self.pool.statements += 1
+        await asyncio.sleep(self.pool.rtt)
+
+    def cursor(self, *args: Any) -> StandInCursor:
+        return StandInCursor(self)
+
+    async def begin(self) -> None:
+        await self.round_trip()
+        self.in_transaction = True
+
+    async def autocommit(self, value: bool) -> None:
+        self.in_transaction = not value
+
+    async def commit(self) -> None:
+        await self.round_trip()
+        self._end()
+
+    async def rollback(self) -> None:
+        await self.round_trip()
+        for undo in reversed(self.undo):
+            undo()
+        self._end()
+
+    def _end(self) -> None:
+        self.in_transaction = False
+        self.undo.clear()
+        for lock in self.held.values():
+            lock.release()
+        self.held.clear()
+
+
+class StandInPool:
+    """aiomysql.Pool 的最小替身：acquire() 受 maxsize 限制，每条语句 sleep 一个 RTT。"""
+
+    def __init__(self, db: Optional[StandInDatabase] = None, maxsize: int = 10, rtt: float = 0.0005) -> None:
+        self.db = db or StandInDatabase()
+        self.maxsize = maxsize
+        self.rtt = rtt
+        self.statements = 0
+        self.acquires = 0
+        self._slots = asyncio.Semaphore(maxsize)
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self._slots:
+            self.acquires += 1
+            conn = StandInConnection(self)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn._end()
+
+    def close(self) -> None:
+        return None
+
+    async def wait_closed(self) -> None:
+        return None
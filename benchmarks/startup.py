@@ -0,0 +1,188 @@
+"""启动基准：导入应用要多久、每个 worker 占多少内存，预 fork 能共享多少。
+
+    python -m benchmarks.startup [--rounds 5] [--workers 4] [--max-import-ms 1500] [--json out.json]
+
+- import：每轮在全新的解释器里导入 backend_fastapi.app，记录耗时和导入后的 RSS（取中位数），
+  并检查 LAZY_MODULES 没有在启动时被导入；被导入了或超过 --max-import-ms 时退出码为 1。
+- workers：按三种方式起 --workers 个只导入应用、不提供服务的进程（不需要数据库），各自跑一次完整 GC
+  模拟运行一段时间后的状态，再读 /proc/<pid>/smaps_rollup：
+  spawn 相当于 uvicorn --workers，每个 worker 各自导入；fork 是导入后直接 fork；
+  fork+freeze 是 backend_fastapi.serve 的做法，fork 前 gc.freeze()。
+  Pss 按共享页的进程数平摊，Private 是只属于该进程的部分；合计包含预 fork 的主进程。
+
+tests/test_startup.py 跑 import 这一项，断言 LAZY_MODULES 没被导入、耗时和内存不超过 IMPORT_BUDGET_MS / RSS_BUDGET_KB。
+预算留了余量，只用来拦住明显的回退（比如又在启动时导入了一个重依赖）；确实需要调高时在提交说明里写明原因。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+# 只在管理端写头像时才用到的重依赖，启动时不应该被导入
+LAZY_MODULES = ("PIL", "qcloud_cos")
+# 导入耗时中位数和导入后 RSS 的上限，慢机器上可以用环境变量放宽
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "3000"))
+RSS_BUDGET_KB = int(os.getenv("STARTUP_RSS_BUDGET_KB", str(80 * 1024)))
+
+IMPORT_PROBE = f"""
+import json, sys, time
+began = time.perf_counter()
+import backend_fastapi.app
+elapsed = time.perf_counter() - began
+rss = next(int(line.split()[1]) for line in open("/proc/self/status") if line.startswith("VmRSS:"))
+lazy = [name for name in {LAZY_MODULES!r} if name in sys.modules]
+print(json.dumps({{"importMs": elapsed * 1000, "rssKb": rss, "modules": len(sys.modules), "eagerLazyModules": lazy}}))
+"""
+
+SPAWN_PROBE = """
+import gc, os, sys
+from backend_fastapi.serve import preload
+preload()
+gc.collect()
+print(os.getpid(), flush=True)
+sys.stdin.read()
+"""
+
+FORK_PROBE = """
+import gc, os, sys
+from backend_fastapi.serve import preload
+freeze, count = sys.argv[1] == "1", int(sys.argv[2])
+gc.disable()
+preload()
+gc.collect()
+if freeze:
+    gc.freeze()
+children = []
+for _ in range(count):
+    pid = os.fork()
+    if pid == 0:
+        gc.enable()
+        gc.collect()
+        # 多个子进程共用一个管道，一次 write 写完整行，避免交错
+        os.write(1, f"{os.getpid()}\\n".encode())
+        sys.stdin.read()
+        os._exit(0)
+    children.append(pid)
+sys.stdin.read()
+for pid in children:
+    os.waitpid(pid, 0)
+"""
+
+
+def run_probe(code: str, *argv: str, stdin: Any = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", code, *argv], cwd=ROOT_DIR, stdin=stdin, stdout=subprocess.PIPE, text=True
+    )
+
+
+def measure_import(rounds: int) -> Dict[str, Any]:
+    samples = []
+    for _ in range(rounds):
+        process = run_probe(IMPORT_PROBE)
+        out, _ = process.communicate()
+        if process.returncode:
+            raise RuntimeError("import probe failed")
+        samples.append(json.loads(out))
+    return {
+        "importMs": round(statistics.median(s["importMs"] for s in samples), 1),
+        "importMsMin": round(min(s["importMs"] for s in samples), 1),
+        "rssKb": int(statistics.median(s["rssKb"] for s in samples)),
+        "modules": samples[-1]["modules"],
+        "eagerLazyModules": sorted({name for s in samples for name in s["eagerLazyModules"]}),
+    }
+
+
+def memory_of(pid: int) -> Dict[str, int]:
+    fields: Dict[str, int] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rssKb": fields.get("Rss", 0),
+        "pssKb": fields.get("Pss", 0),
+        "privateKb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def read_pid(process: subprocess.Popen) -> int:
+    line = process.stdout.readline()
+    if not line.strip():
+        raise RuntimeError("worker probe exited before becoming ready")
+    return int(line)
+
+
+def measure_workers(mode: str, count: int) -> Dict[str, Any]:
+    if mode == "spawn":
+        processes = [run_probe(SPAWN_PROBE, stdin=subprocess.PIPE) for _ in range(count)]
+        master = None
+    else:
+        processes = [run_probe(FORK_PROBE, "1" if mode == "fork+freeze" else "0", str(count), stdin=subprocess.PIPE)]
+        master = processes[0].pid
+    try:
+        if master is None:
+            workers = [read_pid(p) for p in processes]
+        else:
+            workers = [read_pid(processes[0]) for _ in range(count)]
+        usage = [memory_of(pid) for pid in workers]
+        total = sum(u["pssKb"] for u in usage) + (memory_of(master)["pssKb"] if master else 0)
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait(timeout=30)
+    return {
+        "mode": mode,
+        "workers": count,
+        "rssKb": int(statistics.mean(u["rssKb"] for u in usage)),
+        "pssKb": int(statistics.mean(u["pssKb"] for u in usage)),
+        "privateKb": int(statistics.mean(u["privateKb"] for u in usage)),
+        "totalPssKb": total,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4, help="0 表示只测导入")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="导入耗时中位数的上限")
+    parser.add_argument("--json", dest="json_path", default=None)
+    args = parser.parse_args()
+
+    result: Dict[str, Any] = {"import": measure_import(max(1, args.rounds)), "workers": []}
+    imported = result["import"]
+    print(
+        f"import: median={imported['importMs']}ms min={imported['importMsMin']}ms rss={imported['rssKb'] // 1024}MiB "
+        f"modules={imported['modules']} eager={','.join(imported['eagerLazyModules']) or '-'}"
+    )
+    if args.workers > 0:
+        rows: List[Dict[str, Any]] = result["workers"]
+        for mode in ("spawn", "fork", "fork+freeze"):
+            row = measure_workers(mode, args.workers)
+            rows.append(row)
+            print(
+                f"{mode:>12}: per worker rss={row['rssKb'] // 1024}MiB pss={row['pssKb'] // 1024}MiB "
+                f"private={row['privateKb'] // 1024}MiB  total pss={row['totalPssKb'] // 1024}MiB"
+            )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if imported["eagerLazyModules"]:
+        print(f"modules that should load lazily were imported at startup: {', '.join(imported['eagerLazyModules'])}")
+        failed = True
+    if args.max_import_ms is not None and imported["importMs"] > args.max_import_ms:
+        print(f"import took {imported['importMs']}ms, over budget {args.max_import_ms}ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""预约路径：并发抢号不超卖，取消后号源恢复。数据库用 benchmarks.standin 的替身，条件扣减时持有行锁到提交。"""
+import asyncio
+from typing import Any, List
+
+import pytest
+from fastapi import HTTPException
+
+from backend_fastapi.booking import slot_admission
+from backend_fastapi.routers.appointments import book_appointment, cancel_booking
+from benchmarks.standin import StandInPool
+
+SLOT = {"doctorId": "booking-doctor", "scheduleDate": "2030-02-01", "period": "上午"}
+SLOT_KEY = (SLOT["doctorId"], SLOT["scheduleDate"], SLOT["period"])
+
+
+def booking(phone: str) -> dict:
+    return dict(SLOT, doctorName="测试医生", patientName="测试", patientPhone=phone)
+
+
+@pytest.fixture
+def pool() -> StandInPool:
+    slot_admission.reset()
+    # rtt 不为 0，并发请求才会在语句之间真正交错。替身的锁和信号量绑定在第一次等待它们的事件循环上，
+    # 所以每个用例只 asyncio.run 一次
+    pool = StandInPool(rtt=0.001)
+    pool.db.add_schedule(*SLOT_KEY, 3)
+    return pool
+
+
+async def book_many(pool: StandInPool, count: int, first: int = 0) -> List[Any]:
+    requests = (book_appointment(booking(f"1380000{i:04d}"), pool) for i in range(first, first + count))
+    return await asyncio.gather(*requests, return_exceptions=True)
+
+
+def test_concurrent_bookings_do_not_oversell(pool: StandInPool) -> None:
+    results = asyncio.run(book_many(pool, 20))
+    booked = [r for r in results if isinstance(r, dict)]
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(booked) == 3
+    assert len(rejected) == 17 and all(e.status_code == 400 for e in rejected)
+    assert pool.db.schedules[SLOT_KEY]["remaining_slots"] == 0
+    assert len(pool.db.appointments) == 3
+    assert sorted(r["appointment"]["id"] for r in booked) == sorted(pool.db.appointments)
+
+
+def test_full_slot_is_rejected_without_database(pool: StandInPool) -> None:
+    async def scenario() -> None:
+        await book_many(pool, 3)
+        statements = pool.statements
+        with pytest.raises(HTTPException) as exc:
+            await book_appointment(booking("13900000000"), pool)
+        assert exc.value.status_code == 400
+        assert pool.statements == statements
+
+    asyncio.run(scenario())
+
+
+def test_cancel_restores_slot(pool: StandInPool) -> None:
+    async def scenario() -> None:
+        results = await book_many(pool, 3)
+        assert pool.db.schedules[SLOT_KEY]["remaining_slots"] == 0
+        appointment_id = results[0]["appointment"]["id"]
+
+        await cancel_booking({"appointmentId": appointment_id}, pool)
+        assert pool.db.schedules[SLOT_KEY]["remaining_slots"] == 1
+        assert pool.db.appointments[appointment_id]["status"] == "cancelled"
+        with pytest.raises(HTTPException) as exc:
+            await cancel_booking({"appointmentId": appointment_id}, pool)
+        assert exc.value.status_code == 400
+        assert pool.db.schedules[SLOT_KEY]["remaining_slots"] == 1
+
+        # 取消会清掉"已满"标记，放出来的号马上能约，且只能约到一个
+        results = await book_many(pool, 20, first=100)
+        assert sum(isinstance(r, dict) for r in results) == 1
+        assert pool.db.schedules[SLOT_KEY]["remaining_slots"] == 0
+
+    asyncio.run(scenario())
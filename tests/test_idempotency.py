@@ -0,0 +1,138 @@
+"""Idempotency-Key 与重复预约：进程内的结果重放，以及跨进程时由 uniq_active_booking 唯一键兜底。"""
+import asyncio
+from contextlib import nullcontext
+from typing import Any, Dict, List
+
+import pytest
+from fastapi import HTTPException, Response
+
+from backend_fastapi.booking import slot_admission
+from backend_fastapi.idempotency import IdempotencyStore
+from backend_fastapi.routers import appointments
+from benchmarks.standin import StandInPool
+
+SLOT = {"doctorId": "idem-doctor", "scheduleDate": "2030-03-01", "period": "下午"}
+SLOT_KEY = (SLOT["doctorId"], SLOT["scheduleDate"], SLOT["period"])
+BOOKING = dict(SLOT, doctorName="测试医生", patientName="测试", patientPhone="13700000000")
+
+
+def test_replays_stored_result() -> None:
+    store = IdempotencyStore()
+    calls: List[int] = []
+
+    async def func() -> Dict[str, Any]:
+        calls.append(1)
+        return {"id": len(calls)}
+
+    async def scenario() -> None:
+        assert await store.run(("scope", "k"), {"a": 1}, func) == ({"id": 1}, False)
+        assert await store.run(("scope", "k"), {"a": 1}, func) == ({"id": 1}, True)
+        # 同一个 key 换个 scope 是另一个请求
+        assert await store.run(("other", "k"), {"a": 1}, func) == ({"id": 2}, False)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert store.stats["replayed"] == 1
+
+
+def test_joiner_awaits_in_flight_request() -> None:
+    store = IdempotencyStore()
+    calls: List[int] = []
+
+    async def scenario() -> None:
+        release = asyncio.Event()
+
+        async def func() -> str:
+            calls.append(1)
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(store.run(("scope", "k"), {"a": 1}, func))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(store.run(("scope", "k"), {"a": 1}, func))
+        await asyncio.sleep(0)
+        assert not first.done() and not second.done()
+        release.set()
+        assert await first == ("done", False)
+        assert await second == ("done", True)
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+    assert store.stats["joined"] == 1
+
+
+def test_body_mismatch_is_rejected() -> None:
+    store = IdempotencyStore()
+
+    async def func() -> str:
+        return "ok"
+
+    async def scenario() -> None:
+        await store.run(("scope", "k"), {"a": 1}, func)
+        with pytest.raises(HTTPException) as exc:
+            await store.run(("scope", "k"), {"a": 2}, func)
+        assert exc.value.status_code == 422
+
+    asyncio.run(scenario())
+    assert store.stats["conflicts"] == 1
+
+
+def test_client_errors_are_replayed_server_errors_are_not() -> None:
+    store = IdempotencyStore()
+    calls: List[int] = []
+
+    async def fail(status: int) -> None:
+        calls.append(status)
+        raise HTTPException(status_code=status)
+
+    async def scenario() -> None:
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await store.run(("scope", "4xx"), {}, lambda: fail(400))
+            with pytest.raises(HTTPException):
+                await store.run(("scope", "5xx"), {}, lambda: fail(503))
+
+    asyncio.run(scenario())
+    assert calls == [400, 503, 503]
+
+
+@pytest.fixture
+def pool() -> StandInPool:
+    slot_admission.reset()
+    pool = StandInPool(rtt=0.001)
+    pool.db.add_schedule(*SLOT_KEY, 5)
+    return pool
+
+
+def test_replayed_booking_takes_one_slot(pool: StandInPool, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(appointments, "idempotency_store", IdempotencyStore())
+
+    async def scenario() -> List[Response]:
+        responses = [Response(), Response()]
+        results = [await appointments.create_appointment(BOOKING, r, idempotency_key="book-1", pool=pool) for r in responses]
+        assert results[0] == results[1]
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert "Idempotent-Replayed" not in responses[0].headers
+    assert responses[1].headers["Idempotent-Replayed"] == "true"
+    assert len(pool.db.appointments) == 1
+    assert pool.db.schedules[SLOT_KEY]["remaining_slots"] == 4
+
+
+def test_cross_process_duplicate_hits_unique_key(pool: StandInPool, monkeypatch: pytest.MonkeyPatch) -> None:
+    # 另一个进程的请求不经过本进程的 booking_dedupe，两个请求都能通过事务外的重复检查，
+    # 只能靠 INSERT 时的 uniq_active_booking 拦下来
+    monkeypatch.setattr(appointments.booking_dedupe, "hold", lambda phone, key: nullcontext())
+
+    async def scenario() -> List[Any]:
+        return await asyncio.gather(*(appointments.book_appointment(dict(BOOKING), pool) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    booked = [r for r in results if isinstance(r, dict)]
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(booked) == 1
+    assert len(rejected) == 1 and rejected[0].status_code == 409
+    assert len(pool.db.appointments) == 1
+    # 被拦下的事务回滚，扣掉的号源也恢复
+    assert pool.db.schedules[SLOT_KEY]["remaining_slots"] == 4
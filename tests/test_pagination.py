@@ -0,0 +1,65 @@
+"""预约列表的 keyset 分页：游标编解码，以及 (created_at, id) 边界上同一时间的多行不重不漏。"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from backend_fastapi.routers import appointments
+from backend_fastapi.routers.appointments import build_listing_query
+from backend_fastapi.utils import decode_cursor, encode_cursor
+
+BASE = datetime(2030, 1, 1, 9, 0, 0)
+# 每 3 行共用一个 created_at，页大小 2 时边界会落在同一秒的几行中间
+ROWS = [{"id": i, "created_at": BASE + timedelta(seconds=i // 3), "status": "pending"} for i in range(1, 12)]
+
+
+def test_cursor_round_trip() -> None:
+    cursor = encode_cursor([BASE, 42])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [BASE.isoformat(), 42]
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor([1, 2, 3]), encode_cursor({"a": 1}), ""])
+def test_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2)
+
+
+def test_listing_query_keyset_boundary() -> None:
+    sql, params = build_listing_query("13800000000", None, None, False, ["2030-01-01T09:00:01", 5], 3)
+    assert "AND (created_at < %s OR (created_at = %s AND id < %s))" in sql
+    assert sql.endswith("ORDER BY created_at DESC, id DESC LIMIT %s")
+    assert params == ["13800000000", "2030-01-01T09:00:01", "2030-01-01T09:00:01", 5, 3]
+
+
+async def fake_fetch_all(sql: str, params: List[Any], pool: Any) -> List[Dict[str, Any]]:
+    """按 build_listing_query 生成的谓词和排序在内存里执行（只支持不带筛选条件的查询）。"""
+    rows = sorted(ROWS, key=lambda row: (row["created_at"], row["id"]), reverse=True)
+    if "created_at < %s" in sql:
+        created_at, last_id, limit = datetime.fromisoformat(params[0]), params[2], params[3]
+        rows = [row for row in rows if row["created_at"] < created_at or (row["created_at"] == created_at and row["id"] < last_id)]
+    else:
+        limit = params[0]
+    return [dict(row) for row in rows[:limit]]
+
+
+def test_pages_cover_every_row_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(appointments, "fetch_all", fake_fetch_all)
+
+    async def page(cursor: Optional[str]) -> Dict[str, Any]:
+        response = await appointments.list_appointments(
+            phone=None, doctorId=None, status=None, limit=2, cursor=cursor, format=None, includeArchived=False, pool=None
+        )
+        return json.loads(response.body)
+
+    seen: List[int] = []
+    cursor = None
+    for _ in range(len(ROWS)):
+        body = asyncio.run(page(cursor))
+        seen.extend(item["id"] for item in body["items"])
+        cursor = body["nextCursor"]
+        if cursor is None:
+            break
+    assert seen == [row["id"] for row in sorted(ROWS, key=lambda row: (row["created_at"], row["id"]), reverse=True)]
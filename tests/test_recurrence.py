@@ -0,0 +1,131 @@
+"""排班规则：按星期展开、例外优先、与具体行归并，以及规则时段第一次被预约时落行。"""
+import asyncio
+from datetime import date, timedelta
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from fastapi import HTTPException
+
+from backend_fastapi.booking import slot_admission
+from backend_fastapi.recurrence import ScheduleRuleIndex, merge_schedule_stream, merge_schedules, rule_slot_total, virtual_schedule
+from backend_fastapi.routers.appointments import book_appointment
+from benchmarks.standin import StandInPool
+
+DOCTOR = "rule-doctor"
+# 一周后与今天同一个星期几，落在放号周期内
+DAY = date.today() + timedelta(days=7)
+
+
+def build_index(pool: StandInPool, horizon_days: int = 28) -> ScheduleRuleIndex:
+    index = ScheduleRuleIndex(horizon_days)
+    asyncio.run(index.rebuild(pool))
+    return index
+
+
+def slots(rows: List[Dict[str, Any]]) -> List[Tuple[str, str, str, int]]:
+    return [(row["doctor_id"], str(row["schedule_date"]), row["period"], row["total_slots"]) for row in rows]
+
+
+@pytest.fixture
+def pool() -> StandInPool:
+    slot_admission.reset()
+    pool = StandInPool(rtt=0)
+    pool.db.add_rule(DOCTOR, DAY.isoweekday(), "上午", 10)
+    pool.db.add_rule(DOCTOR, DAY.isoweekday(), "下午", 8, valid_until=DAY + timedelta(days=7))
+    return pool
+
+
+def test_rules_expand_weekly_within_window(pool: StandInPool) -> None:
+    index = build_index(pool)
+    rows = slots(list(index.expand(date.today() - timedelta(days=30), date.today() + timedelta(days=365))))
+    # 今天起 28 天内同一星期几出现 4 次；下午的规则两周后失效
+    days = [(date.today() + timedelta(days=7 * i)).isoformat() for i in range(4)]
+    assert [row for row in rows if row[2] == "上午"] == [(DOCTOR, day, "上午", 10) for day in days]
+    assert [row for row in rows if row[2] == "下午"] == [(DOCTOR, day, "下午", 8) for day in days[:3]]
+    assert rows == sorted(rows, key=lambda row: (row[1], row[0], row[2]))
+    assert list(index.expand(DAY, DAY, doctor_ids=["someone-else"])) == []
+
+
+def test_exceptions_override_rules(pool: StandInPool) -> None:
+    other_day = DAY + timedelta(days=1)
+    pool.db.add_exception(DOCTOR, DAY, "上午", 0)
+    pool.db.add_exception(DOCTOR, DAY, "下午", 3)
+    pool.db.add_exception(DOCTOR, other_day, "上午", 5)
+    index = build_index(pool)
+    assert slots(list(index.expand(DAY, other_day))) == [
+        (DOCTOR, DAY.isoformat(), "下午", 3),
+        (DOCTOR, other_day.isoformat(), "上午", 5),
+    ]
+
+
+def test_merge_prefers_concrete_rows_and_keeps_order() -> None:
+    day1, day2, day3 = (DAY + timedelta(days=i) for i in range(3))
+    concrete = [
+        {"doctor_id": "a", "schedule_date": day1, "period": "上午", "total_slots": 20, "remaining_slots": 4},
+        {"doctor_id": "b", "schedule_date": day2, "period": "下午", "total_slots": 6, "remaining_slots": 6},
+    ]
+    virtual = [
+        virtual_schedule("a", day1, "上午", 10),
+        virtual_schedule("a", day1, "下午", 10),
+        virtual_schedule("a", day2, "上午", 10),
+        virtual_schedule("b", day2, "下午", 10),
+        virtual_schedule("a", day3, "上午", 10),
+    ]
+    expected = [
+        ("a", day1.isoformat(), "上午", 20),
+        ("a", day1.isoformat(), "下午", 10),
+        ("a", day2.isoformat(), "上午", 10),
+        ("b", day2.isoformat(), "下午", 6),
+        ("a", day3.isoformat(), "上午", 10),
+    ]
+    assert slots(list(merge_schedules(concrete, virtual))) == expected
+    assert slots(list(merge_schedules([], virtual))) == slots(virtual)
+    assert slots(list(merge_schedules(concrete, []))) == slots(concrete)
+
+    async def chunks():
+        for row in concrete:
+            yield [row]
+
+    async def streamed() -> List[Dict[str, Any]]:
+        return [row async for chunk in merge_schedule_stream(chunks(), virtual) for row in chunk]
+
+    assert slots(asyncio.run(streamed())) == expected
+
+
+def test_rule_slot_total(pool: StandInPool) -> None:
+    # 例外优先于同一天的规则
+    pool.db.add_exception(DOCTOR, DAY + timedelta(days=7), "上午", 4)
+
+    async def total(day: date, period: str) -> int:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                return await rule_slot_total(cur, DOCTOR, day, period, horizon_days=28)
+
+    assert asyncio.run(total(DAY, "上午")) == 10
+    assert asyncio.run(total(DAY + timedelta(days=7), "上午")) == 4
+    assert asyncio.run(total(DAY + timedelta(days=1), "上午")) == 0
+    assert asyncio.run(total(DAY + timedelta(days=14), "下午")) == 0
+    assert asyncio.run(total(DAY + timedelta(days=28), "上午")) == 0
+    assert asyncio.run(total(date.today() - timedelta(days=7), "上午")) == 0
+
+
+def test_first_booking_materializes_rule_slot(pool: StandInPool) -> None:
+    pool.db.add_exception(DOCTOR, DAY, "下午", 0)
+    booking = {"doctorId": DOCTOR, "scheduleDate": DAY.isoformat(), "period": "上午", "patientName": "测试"}
+
+    async def scenario() -> None:
+        result = await book_appointment(dict(booking, patientPhone="13600000000"), pool)
+        assert result["success"]
+        row = pool.db.schedules[(DOCTOR, DAY.isoformat(), "上午")]
+        assert (row["total_slots"], row["remaining_slots"]) == (10, 9)
+        # 已经有具体行之后按行扣减，不再查规则
+        await book_appointment(dict(booking, patientPhone="13600000001"), pool)
+        assert row["remaining_slots"] == 8
+        # 例外停诊的时段和没有规则的日期都约不上，也不会落行
+        for period, day in (("下午", DAY), ("上午", DAY + timedelta(days=1))):
+            with pytest.raises(HTTPException) as exc:
+                await book_appointment(dict(booking, scheduleDate=day.isoformat(), period=period, patientPhone="13600000002"), pool)
+            assert exc.value.status_code == 400
+            assert (DOCTOR, day.isoformat(), period) not in pool.db.schedules
+
+    asyncio.run(scenario())
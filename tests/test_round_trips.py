@@ -0,0 +1,35 @@
+"""写接口的数据库往返预算，场景和预算见 benchmarks.round_trips。"""
+import asyncio
+from typing import Any, Dict
+
+import pytest
+
+from benchmarks.round_trips import BUDGETS, deleted_avatars, run
+
+# 预期的响应状态，防止场景提前出错、没走到数据库也能"满足"预算
+EXPECTED_STATUS = {
+    "appointments.create (duplicate)": 409,
+    "appointments.create (full)": 400,
+    "doctors.modifyInfo (missing)": 404,
+    "doctors.modifyImage (missing)": 404,
+}
+
+
+@pytest.fixture(scope="module")
+def results() -> Dict[str, Dict[str, Any]]:
+    return {r["scenario"]: r for r in asyncio.run(run())}
+
+
+@pytest.mark.parametrize("scenario", sorted(BUDGETS))
+def test_round_trip_budget(results: Dict[str, Dict[str, Any]], scenario: str) -> None:
+    result = results[scenario]
+    acquires, statements = BUDGETS[scenario]
+    assert result["status"] == EXPECTED_STATUS.get(scenario, 200)
+    assert result["acquires"] <= acquires, f"{scenario}: {result['acquires']} acquires, budget {acquires}"
+    assert result["statements"] <= statements, f"{scenario}: {result['statements']} statements, budget {statements}"
+
+
+def test_missing_doctor_avatar_is_deleted(results: Dict[str, Dict[str, Any]]) -> None:
+    # 医生不存在时刚上传的头像要删掉，不能留在 COS 上
+    assert results["doctors.modifyImage (missing)"]["status"] == 404
+    assert deleted_avatars == ["https://example.invalid/avatars/rt.jpg"]
@@ -0,0 +1,104 @@
+"""号源变更的 SSE 广播：Last-Event-ID 续传、epoch 不符时改发快照、连接数满时 503。"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+import pytest
+from fastapi import HTTPException
+
+from backend_fastapi.slot_events import SlotBroadcaster
+
+DOCTOR = "sse-doctor"
+DAY = "2030-04-01"
+
+
+def parse_events(chunks: List[bytes]) -> List[Dict[str, Any]]:
+    events = []
+    for chunk in chunks:
+        fields = dict(line.split(": ", 1) for line in chunk.decode().splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append({"id": fields.get("id"), "event": fields["event"], "data": json.loads(fields["data"])})
+    return events
+
+
+async def collect(broadcaster: SlotBroadcaster, last_event_id: Optional[str], publish: List[int]) -> List[Dict[str, Any]]:
+    """订阅（预期没续上、先发快照）后依次发布 publish 里的余号，收完这些事件就断开。"""
+
+    async def load_snapshot() -> List[Dict[str, Any]]:
+        return [{"doctor_id": DOCTOR, "schedule_date": DAY, "period": "上午", "remaining_slots": 9}]
+
+    stream = broadcaster.stream([DOCTOR], DAY, DAY, last_event_id, load_snapshot, coalesce=0, heartbeat=1, max_age=5)
+    chunks = [await stream.__anext__(), await stream.__anext__()]
+    for remaining in publish:
+        broadcaster.publish(DOCTOR, DAY, "上午", remaining)
+        chunks.append(await stream.__anext__())
+    await stream.aclose()
+    return parse_events(chunks)
+
+
+async def snapshot_not_expected() -> List[Dict[str, Any]]:
+    raise AssertionError("resumed stream must not load a snapshot")
+
+
+def test_resume_replays_missed_changes() -> None:
+    async def scenario() -> None:
+        broadcaster = SlotBroadcaster(buffer_size=100)
+        first = await collect(broadcaster, None, [8])
+        assert [e["event"] for e in first] == ["snapshot", "slots"]
+        last_id = first[-1]["id"]
+        # 断线期间的变更：一条是订阅范围外的医生，不应补发
+        broadcaster.publish(DOCTOR, DAY, "上午", 7)
+        broadcaster.publish("other", DAY, "上午", 1)
+        broadcaster.publish(DOCTOR, DAY, "下午", 5)
+
+        stream = broadcaster.stream([DOCTOR], DAY, DAY, last_id, snapshot_not_expected, coalesce=0, heartbeat=1, max_age=5)
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        events = parse_events(chunks)
+        assert [e["event"] for e in events] == ["slots"]
+        changes = {(c["period"], c["remaining_slots"]) for c in events[0]["data"]["changes"]}
+        assert changes == {("上午", 7), ("下午", 5)}
+        assert events[0]["id"] == broadcaster.event_id(broadcaster.seq)
+        assert broadcaster.resumed == 1
+        assert broadcaster.subscribers == 0
+
+    asyncio.run(scenario())
+
+
+def test_foreign_or_stale_event_id_falls_back_to_snapshot() -> None:
+    async def scenario() -> None:
+        broadcaster = SlotBroadcaster(buffer_size=2)
+        first = await collect(broadcaster, None, [8])
+        # 别的进程（或重启前）的 ID：epoch 不一致
+        other = SlotBroadcaster()
+        other.epoch = "other"
+        foreign = other.event_id(1)
+        events = await collect(broadcaster, foreign, [])
+        assert [e["event"] for e in events] == ["snapshot"]
+        # 缓冲已经覆盖不到的 ID
+        for remaining in (7, 6, 5):
+            broadcaster.publish(DOCTOR, DAY, "上午", remaining)
+        events = await collect(broadcaster, first[-1]["id"], [])
+        assert [e["event"] for e in events] == ["snapshot"]
+        assert broadcaster.resumed == 0
+
+    asyncio.run(scenario())
+
+
+def test_parse_event_id() -> None:
+    broadcaster = SlotBroadcaster()
+    assert broadcaster.parse_event_id(broadcaster.event_id(3)) == 3
+    assert broadcaster.parse_event_id(f"{broadcaster.epoch}x-3") is None
+    assert broadcaster.parse_event_id(f"{broadcaster.epoch}-abc") is None
+    assert broadcaster.parse_event_id(None) is None
+
+
+def test_capacity_returns_503() -> None:
+    broadcaster = SlotBroadcaster(max_subscribers=1)
+    broadcaster.ensure_capacity()
+    subscriber, _ = broadcaster.subscribe([DOCTOR], DAY, DAY)
+    with pytest.raises(HTTPException) as exc:
+        broadcaster.ensure_capacity()
+    assert exc.value.status_code == 503
+    broadcaster.unsubscribe(subscriber)
+    broadcaster.ensure_capacity()
@@ -0,0 +1,23 @@
+"""启动预算：在全新的解释器里导入应用，见 benchmarks.startup。"""
+from typing import Any, Dict
+
+import pytest
+
+from benchmarks.startup import IMPORT_BUDGET_MS, RSS_BUDGET_KB, measure_import
+
+
+@pytest.fixture(scope="module")
+def imported() -> Dict[str, Any]:
+    return measure_import(3)
+
+
+def test_lazy_modules_not_imported(imported: Dict[str, Any]) -> None:
+    assert imported["eagerLazyModules"] == []
+
+
+def test_import_time_budget(imported: Dict[str, Any]) -> None:
+    assert imported["importMs"] <= IMPORT_BUDGET_MS, f"import took {imported['importMs']}ms, budget {IMPORT_BUDGET_MS}ms"
+
+
+def test_import_rss_budget(imported: Dict[str, Any]) -> None:
+    assert imported["rssKb"] <= RSS_BUDGET_KB, f"rss {imported['rssKb']}kB after import, budget {RSS_BUDGET_KB}kB"